@@ -1,8 +1,10 @@
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Input } from "@/components/ui/input";
+import { Label } from "@/components/ui/label";
 import { ScrollArea } from "@/components/ui/scroll-area";
 import { Separator } from "@/components/ui/separator";
+import { Switch } from "@/components/ui/switch";
 import { Toaster } from "@/components/ui/sonner";
 import { cn } from "@/lib/utils";
 import { AnimatePresence, motion } from "framer-motion";
@@ -14,12 +16,13 @@ import { useLocation } from "wouter";
 import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, DialogTrigger } from "@/components/ui/dialog";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
 import { api, getWsUrl } from "@/lib/api";
-import { BarChart, Bar, XAxis, YAxis, Tooltip, ResponsiveContainer, Cell } from 'recharts';
+import { BarChart, Bar, XAxis, YAxis, Tooltip, ResponsiveContainer } from 'recharts';
 
 // 定义配置项接口
 interface LinkConfig {
   id: number;
   keywords: string[];
+  pinyin_match?: boolean; // 按拼音匹配，同音字也能触发
 }
 
 // 日志接口
@@ -46,7 +49,7 @@ export default function Home() {
   const logsEndRef = useRef<HTMLDivElement>(null);
   const [, setLocation] = useLocation();
   const [wsUrl, setWsUrl] = useState("");
-  const [stats, setStats] = useState<{today_triggers: number}>({today_triggers: 0});
+  const [stats, setStats] = useState<{today_triggers: number; hourly: number[]}>({today_triggers: 0, hourly: Array(24).fill(0)});
   const [historyLogs, setHistoryLogs] = useState<any[]>([]);
 
   // 自动滚动日志
@@ -91,12 +94,20 @@ export default function Home() {
             };
             
             ws.onmessage = (event) => {
-                const log = JSON.parse(event.data);
-                setLogs(prev => [...prev.slice(-99), log]);
+                // 服务端把短时间内的日志合并成数组推送
+                const data = JSON.parse(event.data);
+                const batch: LogEntry[] = Array.isArray(data) ? data : [data];
+                setLogs(prev => [...prev, ...batch].slice(-100));
                 
                 // 如果是成功触发，更新统计
-                if (log.type === 'success') {
-                    setStats(prev => ({...prev, today_triggers: prev.today_triggers + 1}));
+                const triggers = batch.filter(log => log.type === 'success').length;
+                if (triggers > 0) {
+                    const hour = new Date().getHours();
+                    setStats(prev => ({
+                        ...prev,
+                        today_triggers: prev.today_triggers + triggers,
+                        hourly: prev.hourly.map((count, h) => h === hour ? count + triggers : count),
+                    }));
                 }
             };
             
@@ -209,6 +220,13 @@ export default function Home() {
     );
   };
 
+  // 切换拼音匹配
+  const handleTogglePinyin = (id: number, checked: boolean) => {
+    setConfigs((prev) =>
+      prev.map((config) => (config.id === id ? { ...config, pinyin_match: checked } : config))
+    );
+  };
+
   // 添加新链接
   const handleAddLink = () => {
     const newId = configs.length > 0 ? Math.max(...configs.map((c) => c.id)) + 1 : 1;
@@ -344,10 +362,21 @@ export default function Home() {
                   <Card className="border-white/5 bg-card/50 backdrop-blur-sm hover:bg-card/80 transition-colors group">
                     <div className="flex flex-col md:flex-row items-start md:items-center p-4 gap-4">
                       {/* 序号 */}
-                      <div className="flex-shrink-0 w-24 pt-2 md:pt-0">
+                      <div className="flex-shrink-0 w-24 pt-2 md:pt-0 flex flex-col gap-2">
                         <span className="text-sm font-medium text-muted-foreground">
                           链接 #{config.id}
                         </span>
+                        <div className="flex items-center gap-1.5" title="同音字也能触发">
+                          <Switch
+                            id={`pinyin-${config.id}`}
+                            checked={!!config.pinyin_match}
+                            onCheckedChange={(checked) => handleTogglePinyin(config.id, checked)}
+                            className="scale-75 origin-left"
+                          />
+                          <Label htmlFor={`pinyin-${config.id}`} className="text-xs text-muted-foreground">
+                            拼音
+                          </Label>
+                        </div>
                       </div>
 
                       {/* 关键词区域 */}
@@ -478,15 +507,13 @@ export default function Home() {
                         <div className="text-2xl font-bold text-primary">{stats.today_triggers}</div>
                     </div>
                     <div className="col-span-2 bg-white/5 p-3 rounded-lg flex flex-col">
-                        <div className="text-xs text-muted-foreground mb-1">最近触发趋势</div>
+                        <div className="text-xs text-muted-foreground mb-1">今日触发趋势</div>
                         <div className="flex-grow h-16 w-full">
                              <ResponsiveContainer width="100%" height="100%">
-                                <BarChart data={historyLogs.slice(0, 10).reverse()}>
-                                  <Bar dataKey="id" fill="#8884d8">
-                                    {historyLogs.map((entry, index) => (
-                                      <Cell key={`cell-${index}`} fill={entry.type === 'success' ? '#10b981' : '#3b82f6'} />
-                                    ))}
-                                  </Bar>
+                                <BarChart data={stats.hourly.map((count, hour) => ({ hour: `${hour}:00`, count }))}>
+                                  <XAxis dataKey="hour" hide />
+                                  <Tooltip />
+                                  <Bar dataKey="count" fill="#10b981" />
                                 </BarChart>
                               </ResponsiveContainer>
                         </div>
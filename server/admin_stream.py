@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+
+from fastapi import WebSocket
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# 每个管理端的待发送队列长度，超过后按日志类型的策略丢弃
+ADMIN_QUEUE_SIZE = int(os.environ.get("ADMIN_QUEUE_SIZE", 256))
+# 积压超过该长度的连接被踢掉
+ADMIN_EVICT_BACKLOG = int(os.environ.get("ADMIN_EVICT_BACKLOG", 1024))
+# 单次发送超过该秒数视为卡死
+ADMIN_SEND_TIMEOUT = float(os.environ.get("ADMIN_SEND_TIMEOUT", 5))
+
+# 合并窗口 (毫秒)，窗口内的日志合并为一个数组发送，0 表示立即发送
+ADMIN_BATCH_MS = float(os.environ.get("ADMIN_BATCH_MS", 50))
+
+# 队列满时可以丢弃最旧一条的日志类型，其余类型 (success 等) 从不丢弃
+DROPPABLE_TYPES = {"info"}
+
+
+class Frame(NamedTuple):
+    droppable: bool  # 整批都是可丢弃类型时才能丢
+    payload: Union[str, bytes]  # str 作为文本帧发送，bytes 作为二进制帧发送
+
+
+def negotiate_format(requested: Optional[str]) -> str:
+    """管理端通过 /ws/admin/{user_id}?format=msgpack 请求二进制格式，服务端未安装 msgpack 时退回 JSON"""
+    if requested == "msgpack" and msgpack is not None:
+        return "msgpack"
+    return "json"
+
+
+def encode_frame(batch: List[dict], fmt: str) -> Frame:
+    droppable = all(log.get("type") in DROPPABLE_TYPES for log in batch)
+    if fmt == "msgpack":
+        return Frame(droppable, msgpack.packb(batch, use_bin_type=True))
+    if orjson is not None:
+        return Frame(droppable, orjson.dumps(batch).decode())
+    return Frame(droppable, json.dumps(batch, ensure_ascii=False, separators=(",", ":")))
+
+
+class LogBatcher:
+    """按用户合并窗口内的日志，每批交给 deliver 回调统一序列化和分发"""
+
+    def __init__(self, deliver: Callable[[int, List[dict]], None], window: float = ADMIN_BATCH_MS / 1000):
+        self.deliver = deliver
+        self.window = window
+        self._pending: Dict[int, List[dict]] = {}
+
+    def add(self, user_id: int, log_data: dict):
+        if self.window <= 0:
+            self.deliver(user_id, [log_data])
+            return
+        batch = self._pending.get(user_id)
+        if batch is None:
+            self._pending[user_id] = [log_data]
+            asyncio.get_running_loop().call_later(self.window, self.flush, user_id)
+        else:
+            batch.append(log_data)
+
+    def flush(self, user_id: int):
+        batch = self._pending.pop(user_id, None)
+        if batch:
+            self.deliver(user_id, batch)
+
+
+class AdminConnection:
+    """管理端连接，带独立的发送队列和发送任务
+
+    广播只把已序列化的帧放入队列后立即返回，一个卡住的浏览器标签页不会
+    拖慢识别循环，也不影响其他管理端。
+    """
+
+    def __init__(self, websocket: WebSocket, format: str = "json", max_queue: int = ADMIN_QUEUE_SIZE,
+                 evict_backlog: int = ADMIN_EVICT_BACKLOG, send_timeout: float = ADMIN_SEND_TIMEOUT):
+        self.websocket = websocket
+        self.format = format
+        self.max_queue = max_queue
+        self.evict_backlog = evict_backlog
+        self.send_timeout = send_timeout
+        self.dropped = 0
+        self.closed = False
+        self._queue = deque()
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._writer())
+
+    @property
+    def backlog(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, frame: Frame) -> bool:
+        """放入发送队列，返回 False 表示连接已关闭或被踢掉"""
+        if self.closed:
+            return False
+        if len(self._queue) >= self.max_queue:
+            if not self._drop_oldest():
+                if frame.droppable:
+                    self.dropped += 1
+                    return True
+                # 不可丢弃的日志继续排队，积压过多时踢掉连接
+                if len(self._queue) >= self.evict_backlog:
+                    logger.warning(f"Evicting admin connection with backlog {len(self._queue)}")
+                    self.close(code=1013)
+                    return False
+        self._queue.append(frame)
+        self._ready.set()
+        return True
+
+    def _drop_oldest(self) -> bool:
+        for i, queued in enumerate(self._queue):
+            if queued.droppable:
+                del self._queue[i]
+                self.dropped += 1
+                return True
+        return False
+
+    def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._task.cancel()
+        if code != 1000:
+            # 主动断开，让客户端重连后从最新日志开始
+            asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), self.send_timeout)
+        except Exception:
+            pass
+
+    async def _writer(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self._queue:
+                    payload = self._queue.popleft().payload
+                    if isinstance(payload, bytes):
+                        send = self.websocket.send_bytes(payload)
+                    else:
+                        send = self.websocket.send_text(payload)
+                    await asyncio.wait_for(send, self.send_timeout)
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Admin connection send failed, evicting: {e}")
+            self.close(code=1011)
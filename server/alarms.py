@@ -0,0 +1,338 @@
+"""无识别告警
+
+每个插件会话一个 AlarmTimer，全部由同一个 AlarmEngine 调度: 截止时间放在
+一个最小堆里，单个任务睡到堆顶到期。收到识别结果时 reset() 只记录时间
+(O(1))，不动堆；堆顶到期时发现截止时间已被推后，再按新的截止时间放回
+堆中。每个会话每个阈值周期最多进出堆一次，与识别结果的频率无关。
+
+到期时通过 start() 传入的回调把告警推送到管理端日志流，开启了邮件通知
+的用户再交给 Notifier 在后台发送。告警配置缓存在内存中，保存时更新。
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import smtplib
+import time
+from email.message import EmailMessage
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import AlarmConfig
+
+logger = logging.getLogger(__name__)
+
+# 未配置 SMTP 时只写日志
+ALARM_SMTP_HOST = os.environ.get("ALARM_SMTP_HOST", "")
+ALARM_SMTP_PORT = int(os.environ.get("ALARM_SMTP_PORT", 25))
+ALARM_SMTP_FROM = os.environ.get("ALARM_SMTP_FROM", "live-assistant@localhost")
+ALARM_SMTP_USER = os.environ.get("ALARM_SMTP_USER", "")
+ALARM_SMTP_PASSWORD = os.environ.get("ALARM_SMTP_PASSWORD", "")
+ALARM_SMTP_STARTTLS = os.environ.get("ALARM_SMTP_STARTTLS", "0") == "1"
+# 等待发送的通知上限，超出时丢弃
+ALARM_NOTIFY_QUEUE = int(os.environ.get("ALARM_NOTIFY_QUEUE", 1000))
+
+
+class AlarmSettings(NamedTuple):
+    no_recognition_threshold: int = 300  # 秒，<= 0 表示关闭告警
+    email_notification: bool = False
+    email_address: str = ""
+
+
+class AlarmConfigCache:
+    """按 user_id 缓存告警配置，未缓存时从数据库加载一次"""
+
+    def __init__(self):
+        self._entries: Dict[int, AlarmSettings] = {}
+
+    def get(self, db: Session, user_id: int) -> AlarmSettings:
+        settings = self._entries.get(user_id)
+        if settings is None:
+            settings = self._entries[user_id] = self._load(db, user_id)
+        return settings
+
+    def refresh(self, db: Session, user_id: int) -> AlarmSettings:
+        """其他 worker 保存告警配置后从数据库重新加载 (加载期间本地更新过的不覆盖)"""
+        before = self._entries.get(user_id)
+        settings = self._load(db, user_id)
+        if self._entries.get(user_id) is not before:
+            return self._entries.get(user_id) or settings
+        self._entries[user_id] = settings
+        return settings
+
+    def _load(self, db: Session, user_id: int) -> AlarmSettings:
+        row = db.query(AlarmConfig).filter(AlarmConfig.user_id == user_id).first()
+        if row is None:
+            return AlarmSettings()
+        return AlarmSettings(row.no_recognition_threshold, bool(row.email_notification), row.email_address or "")
+
+    def peek(self, user_id: int) -> Optional[AlarmSettings]:
+        return self._entries.get(user_id)
+
+    def update(self, user_id: int, settings: AlarmSettings):
+        self._entries[user_id] = settings
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+alarm_configs = AlarmConfigCache()
+
+
+# --- 通知发送 ---
+
+class Notification(NamedTuple):
+    to: str
+    subject: str
+    body: str
+
+
+class LogSender:
+    """只记录日志的发送器，未配置 SMTP 时使用"""
+
+    def send(self, notification: Notification):
+        logger.info(f"Alarm notification to {notification.to}: {notification.subject}")
+
+
+class SMTPSender:
+    def __init__(self, host: str, port: int = 25, sender: str = ALARM_SMTP_FROM, username: str = "",
+                 password: str = "", starttls: bool = False, timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, notification: Notification):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = notification.to
+        message["Subject"] = notification.subject
+        message.set_content(notification.body)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+def create_sender():
+    if ALARM_SMTP_HOST:
+        return SMTPSender(ALARM_SMTP_HOST, ALARM_SMTP_PORT, ALARM_SMTP_FROM, ALARM_SMTP_USER,
+                          ALARM_SMTP_PASSWORD, ALARM_SMTP_STARTTLS)
+    return LogSender()
+
+
+class Notifier:
+    """有界队列 + 单个后台任务，在线程中调用 sender.send (SMTP 是阻塞的)
+
+    sender 只需要实现 send(notification)，可以随时替换。
+    """
+
+    def __init__(self, sender=None, max_queue: int = ALARM_NOTIFY_QUEUE):
+        self.sender = sender or create_sender()
+        self.max_queue = max_queue
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._queue = None
+
+    def enqueue(self, notification: Notification) -> bool:
+        if self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait(notification)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            notification = await self._queue.get()
+            try:
+                await loop.run_in_executor(None, self.sender.send, notification)
+                self.sent += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Failed to send alarm notification to {notification.to}: {e}")
+
+
+# --- 定时调度 ---
+
+class AlarmTimer:
+    """一个插件会话的无识别计时器"""
+
+    __slots__ = ("engine", "user_id", "settings", "last_seen", "scheduled", "alarmed", "closed")
+
+    def __init__(self, engine: "AlarmEngine", user_id: int, settings: AlarmSettings):
+        self.engine = engine
+        self.user_id = user_id
+        self.settings = settings
+        self.last_seen = time.monotonic()
+        self.scheduled: Optional[float] = None  # 堆中有效条目的到期时间
+        self.alarmed = False
+        self.closed = False
+
+    @property
+    def threshold(self) -> int:
+        return self.settings.no_recognition_threshold
+
+    def reset(self) -> bool:
+        """收到识别结果时调用；返回 True 表示此前处于告警状态 (已恢复)"""
+        self.last_seen = time.monotonic()
+        if not self.alarmed:
+            return False
+        # 告警后不再调度，恢复时重新入堆
+        self.alarmed = False
+        self.engine._schedule(self)
+        return True
+
+    def close(self):
+        self.engine._close(self)
+
+
+class AlarmEngine:
+    # 失效条目超过该数量且占一半以上时重建堆
+    COMPACT_MIN = 1024
+
+    def __init__(self, notifier: Optional[Notifier] = None):
+        self.notifier = notifier or Notifier()
+        self.fired = 0
+        self._heap: List[Tuple[float, int, AlarmTimer]] = []
+        self._seq = itertools.count()
+        self._stale = 0
+        self._timers: Dict[int, Set[AlarmTimer]] = {}
+        self._on_alarm: Optional[Callable[[AlarmTimer], None]] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> int:
+        return sum(len(timers) for timers in self._timers.values())
+
+    def start(self, on_alarm: Callable[[AlarmTimer], None]):
+        """on_alarm 在事件循环上同步调用，负责推送到管理端"""
+        self._on_alarm = on_alarm
+        self.notifier.start()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.notifier.stop()
+
+    def open(self, user_id: int, settings: AlarmSettings) -> AlarmTimer:
+        timer = AlarmTimer(self, user_id, settings)
+        self._timers.setdefault(user_id, set()).add(timer)
+        self._schedule(timer)
+        return timer
+
+    def update(self, user_id: int, settings: AlarmSettings):
+        """告警配置保存后应用到该用户正在进行的会话"""
+        for timer in self._timers.get(user_id, ()):
+            timer.settings = settings
+            if not timer.alarmed:
+                self._schedule(timer)
+
+    def _close(self, timer: AlarmTimer):
+        if timer.closed:
+            return
+        timer.closed = True
+        if timer.scheduled is not None:
+            self._stale += 1
+        timers = self._timers.get(timer.user_id)
+        if timers is not None:
+            timers.discard(timer)
+            if not timers:
+                del self._timers[timer.user_id]
+
+    def _schedule(self, timer: AlarmTimer):
+        if timer.threshold <= 0:
+            return
+        due = timer.last_seen + timer.threshold
+        # 已有更早的条目时让它到期后再顺延，只有截止时间提前 (调小阈值) 才需要新条目
+        if timer.scheduled is not None and timer.scheduled <= due:
+            return
+        if timer.scheduled is not None:
+            self._stale += 1
+        timer.scheduled = due
+        if not self._heap or due < self._heap[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (due, next(self._seq), timer))
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if not entry[2].closed and entry[0] == entry[2].scheduled]
+        heapq.heapify(self._heap)
+        self._stale = 0
+
+    def _expire(self, now: float):
+        while self._heap and self._heap[0][0] <= now:
+            due, _, timer = heapq.heappop(self._heap)
+            if timer.closed or due != timer.scheduled:
+                # 会话已结束，或已被更早的条目取代
+                self._stale = max(0, self._stale - 1)
+                continue
+            timer.scheduled = None
+            if timer.threshold <= 0:
+                continue  # 告警已关闭
+            if timer.last_seen + timer.threshold > now:
+                # 期间收到过识别结果，按新的截止时间顺延
+                self._schedule(timer)
+                continue
+            timer.alarmed = True
+            self.fired += 1
+            self._fire(timer)
+        if self._stale > self.COMPACT_MIN and self._stale * 2 > len(self._heap):
+            self._compact()
+
+    def _fire(self, timer: AlarmTimer):
+        try:
+            self._on_alarm(timer)
+        except Exception as e:
+            logger.error(f"Alarm callback failed for user {timer.user_id}: {e}")
+        settings = timer.settings
+        if settings.email_notification and settings.email_address:
+            self.notifier.enqueue(Notification(
+                settings.email_address,
+                "直播助手告警: 长时间没有识别结果",
+                f"用户 #{timer.user_id} 的插件会话已连续 {settings.no_recognition_threshold} 秒没有识别结果，"
+                f"请检查直播间音频和插件状态。",
+            ))
+
+    async def _run(self):
+        while True:
+            self._expire(time.monotonic())
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+alarm_engine = AlarmEngine()
@@ -0,0 +1,273 @@
+"""插件音频接入: 重新分帧、背压和静音抑制
+
+插件发来的数据块大小不固定，先写入环形缓冲区，再按 FunASR 期望的帧长
+(默认 60ms，16kHz/16bit 单声道为 1920 字节) 切分。每帧用 NumPy 计算能量，
+持续静音的帧不再发给 ASR；说话开始前保留少量预录帧，说话结束后继续
+发送一段静音，保证 FunASR 自身的断句能正常工作。
+
+切好的帧进入有界队列，由单独的任务发往上游。上游跟不上时按
+AUDIO_BACKPRESSURE 处理: shed 丢弃最旧的帧，pause 暂停读取插件数据。
+
+插件也可以发送原始采集格式 (见 schemas.AudioFormat)，由 AudioConverter
+在进入分帧之前混音并多相重采样为 16kHz 单声道 int16。只接受常见的标准
+采样率: 与 16000 公约数很小的采样率 (如 191999) 上采样倍数高达上万，
+滤波器有几十 MB，构建要数秒。滤波器按 (up, down, taps) 缓存，首次构建
+应在线程中进行 (见 main.py)。
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from functools import lru_cache
+from math import gcd
+from typing import AsyncIterator, Deque, Dict, Tuple
+
+import numpy as np
+
+from metrics import PIPELINE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SECONDS = PIPELINE_SECONDS.labels("queue")
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+AUDIO_FRAME_MS = int(os.environ.get("AUDIO_FRAME_MS", 60))
+# 低于该能量 (dBFS) 的帧视为静音
+AUDIO_VAD_DBFS = float(os.environ.get("AUDIO_VAD_DBFS", -50))
+# 说话结束后继续发送的静音时长，需覆盖 FunASR 的断句静音阈值
+AUDIO_VAD_HANGOVER_MS = int(os.environ.get("AUDIO_VAD_HANGOVER_MS", 1000))
+# 说话开始前补发的静音时长，避免吞掉第一个字
+AUDIO_VAD_PREROLL_MS = int(os.environ.get("AUDIO_VAD_PREROLL_MS", 180))
+# 等待发往上游的最大帧数 (默认约 3 秒)
+AUDIO_MAX_PENDING_FRAMES = int(os.environ.get("AUDIO_MAX_PENDING_FRAMES", 50))
+AUDIO_BACKPRESSURE = os.environ.get("AUDIO_BACKPRESSURE", "shed")  # shed | pause
+AUDIO_VAD_ENABLED = os.environ.get("AUDIO_VAD_ENABLED", "1") != "0"
+# 重采样滤波器长度 (以输出采样计)，越大过渡带越窄、CPU 开销越高
+AUDIO_RESAMPLE_TAPS = int(os.environ.get("AUDIO_RESAMPLE_TAPS", 32))
+
+_SAMPLE_DTYPES = {1: np.uint8, 2: np.dtype("<i2"), 4: np.dtype("<i4")}
+
+# 插件可以声明的采样率 (上采样倍数最大为 11025 的 640)
+SUPPORTED_SAMPLE_RATES = (8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000,
+                          88200, 96000, 176400, 192000)
+
+
+class RingBuffer:
+    """定长字节环形缓冲区，写入超过容量时自动扩容"""
+
+    def __init__(self, capacity: int):
+        self._buf = bytearray(capacity)
+        self._start = 0
+        self.size = 0
+
+    def write(self, data: bytes):
+        n = len(data)
+        if self.size + n > len(self._buf):
+            self._grow(self.size + n)
+        capacity = len(self._buf)
+        end = (self._start + self.size) % capacity
+        first = min(n, capacity - end)
+        self._buf[end:end + first] = data[:first]
+        if first < n:
+            self._buf[:n - first] = data[first:]
+        self.size += n
+
+    def read(self, n: int) -> bytes:
+        capacity = len(self._buf)
+        first = min(n, capacity - self._start)
+        out = bytes(self._buf[self._start:self._start + first])
+        if first < n:
+            out += bytes(self._buf[:n - first])
+        self._start = (self._start + n) % capacity
+        self.size -= n
+        return out
+
+    def _grow(self, needed: int):
+        data = self.read(self.size)
+        self._buf = bytearray(max(needed, len(self._buf) * 2))
+        self._start = 0
+        self._buf[:len(data)] = data
+        self.size = len(data)
+
+
+def frame_dbfs(frame: bytes) -> float:
+    """int16 PCM 帧的 RMS 能量 (dBFS)"""
+    samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+    if samples.size == 0:
+        return -120.0
+    rms = np.sqrt(np.mean(samples * samples))
+    return 20 * np.log10(rms / 32768.0) if rms > 0 else -120.0
+
+
+@lru_cache(maxsize=64)
+def polyphase_filter(up: int, down: int, taps: int) -> np.ndarray:
+    """设计 Kaiser 窗 sinc 低通原型并拆成 up 个相位，返回 (up, taps) 矩阵
+
+    每行已按时间倒序排列，可以直接与按时间正序的输入窗口做点积。结果
+    在会话之间共享，设为只读。
+    """
+    n = up * taps
+    cutoff = 0.5 / max(up, down) * 0.92  # 截止频率 (上采样后的归一化频率)
+    t = np.arange(n) - (n - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(n, 8.0)
+    h *= up / h.sum()
+    bank = np.ascontiguousarray(h.reshape(taps, up).T[:, ::-1], dtype=np.float32)
+    bank.flags.writeable = False
+    return bank
+
+
+class AudioConverter:
+    """把插件声明的 PCM 格式流式转换为 16kHz 单声道 int16
+
+    数据块可以在任意字节处切开，不完整的采样留到下一块；滤波器历史跨块
+    保留，输出与一次性转换整段音频一致。整个过程只有 NumPy 向量运算，
+    输入已经是目标格式时直接透传。
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, channels: int = 1, sample_width: int = SAMPLE_WIDTH,
+                 taps: int = AUDIO_RESAMPLE_TAPS):
+        if sample_rate not in SUPPORTED_SAMPLE_RATES:
+            raise ValueError(f"Unsupported sample rate: {sample_rate}")
+        self.channels = channels
+        self.sample_width = sample_width
+        self.dtype = _SAMPLE_DTYPES[sample_width]
+        self.passthrough = sample_rate == SAMPLE_RATE and channels == 1 and sample_width == SAMPLE_WIDTH
+        g = gcd(SAMPLE_RATE, sample_rate)
+        self.up, self.down = SAMPLE_RATE // g, sample_rate // g
+        # 滤波器长度按 taps 个输出采样的时长计算，降采样比越大每相位抽头越多
+        self.taps = -(-taps * max(self.up, self.down) // self.up)
+        self._filter = polyphase_filter(self.up, self.down, self.taps) if self.up != self.down else None
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._pos = 0  # 下一个输出采样在上采样域中相对当前块起点的位置
+        self._carry = b""
+        self._block = sample_width * channels
+
+    def convert(self, data: bytes) -> bytes:
+        if self.passthrough:
+            return data
+        view = memoryview(data)
+        if self._carry:
+            view = memoryview(self._carry + data)
+        usable = len(view) - len(view) % self._block
+        self._carry = bytes(view[usable:])
+        if not usable:
+            return b""
+        samples = np.frombuffer(view[:usable], dtype=self.dtype).astype(np.float32)
+        if self.sample_width == 1:
+            samples = (samples - 128) * 256
+        elif self.sample_width == 4:
+            samples *= 1 / 65536
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        if self._filter is not None:
+            samples = self._resample(samples)
+        return np.clip(np.rint(samples), -32768, 32767).astype("<i2").tobytes()
+
+    def _resample(self, block: np.ndarray) -> np.ndarray:
+        n = len(block)
+        span = n * self.up
+        count = -(-(span - self._pos) // self.down) if span > self._pos else 0
+        buf = np.concatenate((self._history, block))
+        self._history = buf[len(buf) - (self.taps - 1):]
+        if not count:
+            self._pos -= span
+            return block[:0]
+        t = self._pos + self.down * np.arange(count)
+        self._pos += count * self.down - span
+        # 第 i 个输出对应输入窗口 block[idx-taps+1 .. idx]，即 buf[idx .. idx+taps-1]
+        windows = np.lib.stride_tricks.sliding_window_view(buf, self.taps)[t // self.up]
+        return np.einsum("ij,ij->i", windows, self._filter[t % self.up])
+
+
+class AudioIngest:
+    def __init__(self, frame_ms: int = AUDIO_FRAME_MS, vad_enabled: bool = AUDIO_VAD_ENABLED,
+                 vad_dbfs: float = AUDIO_VAD_DBFS, hangover_ms: int = AUDIO_VAD_HANGOVER_MS,
+                 preroll_ms: int = AUDIO_VAD_PREROLL_MS, max_pending: int = AUDIO_MAX_PENDING_FRAMES,
+                 backpressure: str = AUDIO_BACKPRESSURE):
+        self.frame_bytes = SAMPLE_RATE * SAMPLE_WIDTH * frame_ms // 1000
+        self.vad_enabled = vad_enabled
+        self.vad_dbfs = vad_dbfs
+        self.hangover_frames = hangover_ms // frame_ms
+        self.backpressure = backpressure
+        self.max_pending = max_pending
+        self.bytes_in = 0
+        self.bytes_forwarded = 0
+        self.frames_forwarded = 0
+        self.frames_suppressed = 0
+        self.frames_shed = 0
+        self._ring = RingBuffer(self.frame_bytes * 8)
+        self._preroll: Deque[bytes] = deque(maxlen=max(preroll_ms // frame_ms, 0))
+        self._silent_run = self.hangover_frames + 1  # 初始视为静音状态
+        self._pending: Deque[Tuple[float, bytes]] = deque()  # (入队时间, 帧)
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def counters(self) -> Dict[str, int]:
+        return {
+            "bytes_in": self.bytes_in,
+            "bytes_forwarded": self.bytes_forwarded,
+            "frames_forwarded": self.frames_forwarded,
+            "frames_suppressed": self.frames_suppressed,
+            "frames_shed": self.frames_shed,
+        }
+
+    async def push(self, data: bytes):
+        """写入插件数据；pause 模式下队列满时等待上游消化"""
+        self.bytes_in += len(data)
+        self._ring.write(data)
+        while self._ring.size >= self.frame_bytes:
+            frame = self._ring.read(self.frame_bytes)
+            for out in self._gate(frame):
+                if self.backpressure == "pause":
+                    await self._space.wait()
+                self._enqueue(out)
+
+    def _gate(self, frame: bytes):
+        """能量门限: 返回本帧需要发送的帧 (可能包含预录帧)"""
+        if not self.vad_enabled:
+            return (frame,)
+        if frame_dbfs(frame) >= self.vad_dbfs:
+            frames = (*self._preroll, frame) if self._silent_run > self.hangover_frames else (frame,)
+            self._preroll.clear()
+            self._silent_run = 0
+            return frames
+        self._silent_run += 1
+        if self._silent_run <= self.hangover_frames:
+            return (frame,)
+        if self._preroll.maxlen:
+            if len(self._preroll) == self._preroll.maxlen:
+                self.frames_suppressed += 1
+            self._preroll.append(frame)
+        else:
+            self.frames_suppressed += 1
+        return ()
+
+    def _enqueue(self, frame: bytes):
+        if len(self._pending) >= self.max_pending:
+            # shed: 丢弃最旧的帧，保证转发的是最新的音频
+            self._pending.popleft()
+            self.frames_shed += 1
+        self._pending.append((time.perf_counter(), frame))
+        if len(self._pending) >= self.max_pending:
+            self._space.clear()
+        self._ready.set()
+
+    async def frames(self) -> AsyncIterator[bytes]:
+        while True:
+            await self._ready.wait()
+            while self._pending:
+                queued_at, frame = self._pending.popleft()
+                QUEUE_SECONDS.observe(time.perf_counter() - queued_at)
+                self._space.set()
+                self.bytes_forwarded += len(frame)
+                self.frames_forwarded += 1
+                yield frame
+            self._ready.clear()
@@ -1,37 +1,32 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 
-from database import SessionLocal
+from database import run_db
 from models import User
+from passwords import get_password_hash, password_hasher, verify_password
 from schemas import TokenData
+from user_cache import user_cache
 
 # 密钥配置 (生产环境应从环境变量读取)
 SECRET_KEY = "your-secret-key-keep-it-secret"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 def get_user(db: Session, username: str):
     return db.query(User).filter(User.username == username).first()
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user(db, username)
-    if not user:
+async def authenticate_user(username: str, password: str):
+    user = await run_db(get_user, username)
+    if not user or not user.is_active:
         return False
-    if not verify_password(password, user.hashed_password):
+    # bcrypt 在独立进程池中校验，不占用事件循环和数据库线程
+    if not await password_hasher.verify(password, user.hashed_password):
         return False
     return user
 
@@ -45,16 +40,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-from database import SessionLocal
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -68,7 +54,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(db, username=token_data.username)
+    user = user_cache.get(token_data.username)
     if user is None:
+        generation = user_cache.generation
+        user = await run_db(get_user, token_data.username)
+        if user is None:
+            raise credentials_exception
+        user_cache.put(token_data.username, user, generation)
+    # 停用的用户即使命中缓存也立即拒绝
+    if not user.is_active:
         raise credentials_exception
     return user
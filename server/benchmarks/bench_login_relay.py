@@ -0,0 +1,119 @@
+"""负载测试: 集中登录时插件 WebSocket 的转发延迟
+
+与 load_rest_relay.py 相同的环境 (本地 FunASR 替身 + 独立进程的服务端)，
+插件客户端持续测量 "发送音频帧 -> 收到点击指令" 的往返延迟；期间反复
+发起 100 个并发登录。分别在 PASSWORD_WORKERS=0 (bcrypt 在事件循环上
+计算，即改动前的行为) 和进程池两种配置下各跑一遍。
+
+用法 (在 server 目录下):
+    python benchmarks/bench_login_relay.py [--plugins 20] [--logins 100] [--duration 10] [--workers 0,2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from load_rest_relay import KEYWORD, LAUNCHER, SERVER_DIR, percentile, plugin_client, wait_http
+
+
+async def login_burst(base_http, logins, stop, login_ms):
+    async with httpx.AsyncClient(base_url=base_http, timeout=60,
+                                 limits=httpx.Limits(max_connections=logins)) as client:
+        async def login():
+            start = time.perf_counter()
+            r = await client.post("/api/token", data={"username": "admin", "password": "admin123"})
+            r.raise_for_status()
+            login_ms.append((time.perf_counter() - start) * 1000)
+
+        while not stop.is_set():
+            await asyncio.gather(*(login() for _ in range(logins)))
+
+
+async def run_phase(args, base_http, base_ws, logins):
+    stop = asyncio.Event()
+    latencies, login_ms = [], []
+    tasks = [asyncio.create_task(plugin_client(base_ws, args.interval, stop, latencies)) for _ in range(args.plugins)]
+    if logins:
+        tasks.append(asyncio.create_task(login_burst(base_http, logins, stop, login_ms)))
+    await asyncio.sleep(args.duration)
+    stop.set()
+    _, pending = await asyncio.wait(tasks, timeout=60)
+    for task in pending:
+        task.cancel()
+    return {
+        "samples": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2) if latencies else None,
+        "logins": len(login_ms),
+        "login_p50_ms": round(statistics.median(login_ms), 1) if login_ms else None,
+    }
+
+
+async def run_config(args, workers):
+    tmp = tempfile.mkdtemp()
+    os.makedirs(os.path.join(tmp, "client", "dist", "assets"))
+    os.makedirs(os.path.join(tmp, "server"))
+    funasr_port, port = args.port + 1, args.port
+    # 基准测试只衡量哈希开销，放开登录限流和排队上限
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/bench.db", FUNASR_URLS=f"ws://127.0.0.1:{funasr_port}",
+               MATCH_LINK_COOLDOWN_MS="0", PASSWORD_WORKERS=str(workers), PASSWORD_MAX_PENDING="100000",
+               LOGIN_IP_BURST="1000000", LOGIN_USER_BURST="1000000")
+    procs = [
+        subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, "benchmarks", "fake_funasr.py"), "--port", str(funasr_port)]),
+        subprocess.Popen(
+            [sys.executable, "-c", LAUNCHER.format(server_dir=SERVER_DIR, seed_logs=0, port=port)],
+            cwd=os.path.join(tmp, "server"), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ),
+    ]
+    try:
+        base_http, base_ws = f"http://127.0.0.1:{port}", f"ws://127.0.0.1:{port}"
+        await wait_http(f"{base_http}/api/stats")
+        async with httpx.AsyncClient(base_url=base_http) as client:
+            r = await client.post("/api/token", data={"username": "admin", "password": "admin123"})
+            await client.post("/api/config", json=[{"id": 1, "keywords": [KEYWORD]}],
+                              headers={"Authorization": f"Bearer {r.json()['access_token']}"})
+        results = {}
+        for name, logins in (("idle", 0), ("logins", args.logins)):
+            results[name] = await run_phase(args, base_http, base_ws, logins)
+            print(f"workers={workers} {name:>6}: " + " ".join(f"{k}={v}" for k, v in results[name].items()))
+        return results
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+async def run(args):
+    results = {}
+    for workers in (int(w) for w in args.workers.split(",")):
+        results[f"workers={workers}"] = await run_config(args, workers)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--plugins", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=100, help="每轮并发登录数")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=0.05, help="每个插件发送帧的间隔 (秒)")
+    parser.add_argument("--workers", default="0,2", help="逗号分隔的 PASSWORD_WORKERS 取值")
+    parser.add_argument("--port", type=int, default=18720)
+    parser.add_argument("--output", help="结果保存为 JSON")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""关键词匹配基准测试: 原始 `keyword in text` 循环 vs Aho-Corasick 自动机
+
+linear / automaton 两列分别强制走 KeywordMatcher 的逐个查找和自动机
+路径，两者的交叉点即 LINEAR_SCAN_MAX 的取值依据。
+
+用法 (在 server 目录下):
+    python benchmarks/bench_matcher.py [--texts 2000] [--sizes 10,1000,10000]
+    python benchmarks/bench_matcher.py --sizes 4,8,16,24,32,48,64,96,128   (交叉点)
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matcher import KeywordMatcher  # noqa: E402
+
+# 常用汉字区间，足够生成互不相同的关键词
+CJK_START, CJK_END = 0x4E00, 0x4E00 + 3000
+
+
+def random_word(rng, min_len, max_len):
+    return "".join(chr(rng.randint(CJK_START, CJK_END)) for _ in range(rng.randint(min_len, max_len)))
+
+
+def make_keyword_map(rng, size):
+    keyword_map = {}
+    while len(keyword_map) < size:
+        keyword_map[random_word(rng, 3, 6)] = len(keyword_map) % 200 + 1
+    return keyword_map
+
+
+def make_texts(rng, keyword_map, count):
+    keywords = list(keyword_map)
+    texts = []
+    for i in range(count):
+        text = random_word(rng, 20, 40)
+        # 约 1/4 的识别结果包含关键词
+        if i % 4 == 0:
+            pos = rng.randint(0, len(text))
+            text = text[:pos] + rng.choice(keywords) + text[pos:]
+        texts.append(text)
+    return texts
+
+
+def naive_first_match(keyword_map, text):
+    for keyword, link_id in keyword_map.items():
+        if keyword in text:
+            return keyword, link_id
+    return None
+
+
+def bench(fn, texts):
+    start = time.perf_counter()
+    for text in texts:
+        fn(text)
+    return (time.perf_counter() - start) / len(texts) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--sizes", default="10,1000,10000")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'keywords':>10} {'build ms':>10} {'naive us':>10} {'matcher us':>11} {'speedup':>8} "
+          f"{'linear us':>10} {'automaton us':>13}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        keyword_map = make_keyword_map(rng, size)
+        texts = make_texts(rng, keyword_map, args.texts)
+
+        start = time.perf_counter()
+        matcher = KeywordMatcher(keyword_map)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        # 两种实现的触发结果必须一致
+        for text in texts:
+            hit = matcher.first_match(text)
+            expected = naive_first_match(keyword_map, text)
+            assert (hit and (hit.keyword, hit.link_id)) == (expected or None), text
+
+        naive_us = bench(lambda t: naive_first_match(keyword_map, t), texts)
+        ac_us = bench(matcher.first_match, texts)
+
+        linear = matcher._linear
+        matcher._linear = True
+        linear_us = bench(matcher.first_match, texts)
+        matcher._linear = False
+        automaton_us = bench(matcher.first_match, texts)
+        matcher._linear = linear
+        print(f"{size:>10} {build_ms:>10.1f} {naive_us:>10.2f} {ac_us:>11.2f} {naive_us / ac_us:>7.1f}x "
+              f"{linear_us:>10.2f} {automaton_us:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""拼音匹配基准测试: 精确匹配 vs 音节自动机 vs 逐个关键词比较拼音
+
+识别结果中约 1/4 含关键词，其中一半把关键词的一个字换成同音字。对比:
+    exact   全部关键词按字匹配 (现有行为，同音字漏触发)
+    pinyin  全部关键词开启拼音匹配 (逐字转换一次 + 单次扫描)
+    naive   每条结果转换为拼音后逐个关键词 `in` 比较
+并统计各自的命中数。需要安装 pypinyin。
+
+用法 (在 server 目录下):
+    python benchmarks/bench_pinyin.py [--texts 2000] [--sizes 1000,5000,10000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pinyin  # noqa: E402
+from bench_matcher import bench, make_keyword_map, random_word  # noqa: E402
+from matcher import KeywordMatcher  # noqa: E402
+from pinyin import keyword_pinyin, parse_pinyin, to_syllables  # noqa: E402
+
+CJK_START, CJK_END = 0x4E00, 0x4E00 + 3000
+
+
+def homophones():
+    """{字: [同音的其他字]}"""
+    by_syllable = defaultdict(list)
+    for code in range(CJK_START, CJK_END + 1):
+        ch = chr(code)
+        by_syllable[to_syllables(ch)[0]].append(ch)
+    return {ch: [other for other in chars if other != ch] for chars in by_syllable.values() for ch in chars}
+
+
+def make_texts(rng, keyword_map, count, alternatives):
+    keywords = list(keyword_map)
+    texts = []
+    for i in range(count):
+        text = random_word(rng, 20, 40)
+        if i % 4 == 0:
+            keyword = rng.choice(keywords)
+            if i % 8 == 0:
+                # 把一个有同音字的字替换掉
+                positions = [p for p, ch in enumerate(keyword) if alternatives.get(ch)]
+                if positions:
+                    p = rng.choice(positions)
+                    keyword = keyword[:p] + rng.choice(alternatives[keyword[p]]) + keyword[p + 1:]
+            pos = rng.randint(0, len(text))
+            text = text[:pos] + keyword + text[pos:]
+        texts.append(text)
+    return texts
+
+
+def naive_first_match(pinyin_keywords, text):
+    syllables = " " + " ".join(to_syllables(text)) + " "
+    for keyword, (value, link_id) in pinyin_keywords.items():
+        if value in syllables:
+            return keyword, link_id
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--sizes", default="1000,5000,10000")
+    args = parser.parse_args()
+    if not pinyin.available:
+        sys.exit("pypinyin is not installed")
+
+    rng = random.Random(42)
+    alternatives = homophones()
+    print(f"{'keywords':>10} {'build ms':>9} {'exact us':>9} {'pinyin us':>10} {'cold us':>8} {'naive us':>9} "
+          f"{'exact hits':>11} {'pinyin hits':>12}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        keyword_map = make_keyword_map(rng, size)
+        texts = make_texts(rng, keyword_map, args.texts, alternatives)
+
+        # 保存配置时转换一次并存储的拼音
+        stored = {keyword: keyword_pinyin(keyword) for keyword in keyword_map}
+        start = time.perf_counter()
+        pinyin_matcher = KeywordMatcher(keyword_map, {k: parse_pinyin(v) for k, v in stored.items()})
+        build_ms = (time.perf_counter() - start) * 1e3
+        exact_matcher = KeywordMatcher(keyword_map)
+        naive_keywords = {k: (f" {v} ", link_id) for (k, link_id), v in zip(keyword_map.items(), stored.values())}
+
+        # 结果必须与逐个比较拼音一致
+        pinyin_hits = exact_hits = 0
+        for text in texts:
+            hit = pinyin_matcher.first_match(text)
+            expected = naive_first_match(naive_keywords, text)
+            assert (hit and (hit.keyword, hit.link_id)) == (expected or None), text
+            pinyin_hits += hit is not None
+            exact_hits += exact_matcher.first_match(text) is not None
+
+        # 冷缓存: 清空逐字转换缓存后第一次扫描
+        pinyin._cache.clear()
+        cold_us = bench(pinyin_matcher.first_match, texts)
+        exact_us = bench(exact_matcher.first_match, texts)
+        pinyin_us = bench(pinyin_matcher.first_match, texts)
+        naive_us = bench(lambda t: naive_first_match(naive_keywords, t), texts)
+        print(f"{size:>10} {build_ms:>9.1f} {exact_us:>9.2f} {pinyin_us:>10.2f} {cold_us:>8.2f} {naive_us:>9.2f} "
+              f"{exact_hits:>11} {pinyin_hits:>12}")
+
+
+if __name__ == "__main__":
+    main()
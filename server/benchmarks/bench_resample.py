@@ -0,0 +1,71 @@
+"""音频格式转换基准测试: 每秒音频的转换耗时
+
+按插件常见的采集格式生成 10 秒测试音，以 20ms 的数据块流式送入
+AudioConverter，输出转换每秒音频所需的 CPU 时间，以及单核可以支撑的
+实时流数量。
+
+用法 (在 server 目录下):
+    python benchmarks/bench_resample.py [--seconds 10] [--chunk-ms 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio import AudioConverter  # noqa: E402
+
+FORMATS = [
+    # (采样率, 声道数, 采样字节数)
+    (16000, 1, 2),
+    (16000, 2, 2),
+    (8000, 1, 2),
+    (22050, 1, 2),
+    (44100, 2, 2),
+    (48000, 1, 2),
+    (48000, 2, 2),
+    (48000, 2, 4),
+]
+
+
+def make_audio(rng, sample_rate, channels, sample_width, seconds):
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    signal = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * rng.standard_normal(len(t))
+    signal = np.repeat(signal[:, None], channels, axis=1)
+    if sample_width == 1:
+        return (signal * 127 + 128).astype(np.uint8).tobytes()
+    dtype = "<i2" if sample_width == 2 else "<i4"
+    return (signal * np.iinfo(dtype).max).astype(dtype).tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--chunk-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'format':>18} {'taps':>5} {'us/stream-s':>12} {'realtime x':>11}")
+    for sample_rate, channels, sample_width in FORMATS:
+        data = make_audio(rng, sample_rate, channels, sample_width, args.seconds)
+        chunk = sample_rate * channels * sample_width * args.chunk_ms // 1000
+        chunks = [data[i:i + chunk] for i in range(0, len(data), chunk)]
+
+        converter = AudioConverter(sample_rate, channels, sample_width)
+        start = time.perf_counter()
+        out = sum(len(converter.convert(c)) for c in chunks)
+        elapsed = time.perf_counter() - start
+
+        # 输出应为 16kHz 单声道 int16
+        assert abs(out - 32000 * args.seconds) <= 2 * 32, out
+        per_second_us = elapsed / args.seconds * 1e6
+        name = f"{sample_rate}Hz/{channels}ch/{sample_width * 8}bit"
+        taps = converter.taps if converter.up != converter.down else 0
+        print(f"{name:>18} {taps:>5} {per_second_us:>12.1f} {args.seconds / elapsed:>10.0f}x")
+
+
+if __name__ == "__main__":
+    main()
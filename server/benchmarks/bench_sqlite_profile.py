@@ -0,0 +1,157 @@
+"""SQLite 存储配置基准测试: 调优前后热点查询耗时对比
+
+先按旧表结构 (只有主键和 username 索引、默认 PRAGMA) 生成一个大库，
+测一轮查询；再复制一份，通过 migrations.run_migrations() 加上复合索引，
+在 WAL/mmap 等 PRAGMA 下重测。
+
+用法 (在 server 目录下):
+    python benchmarks/bench_sqlite_profile.py [--rows 10000000] [--users 100] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event  # noqa: E402
+
+from database import set_sqlite_pragmas  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+# 调优前 (Base.metadata.create_all 生成) 的表结构
+BASELINE_SCHEMA = """
+CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR, hashed_password VARCHAR,
+                    is_active BOOLEAN, is_superuser BOOLEAN);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE INDEX ix_users_id ON users (id);
+CREATE TABLE configs (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER REFERENCES users (id),
+                      link_id INTEGER, keywords TEXT);
+CREATE INDEX ix_configs_id ON configs (id);
+CREATE TABLE logs (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER REFERENCES users (id),
+                   timestamp DATETIME, type VARCHAR, message VARCHAR, details TEXT);
+CREATE INDEX ix_logs_id ON logs (id);
+CREATE TABLE audits (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER REFERENCES users (id),
+                     timestamp DATETIME, action VARCHAR, details VARCHAR, ip_address VARCHAR);
+CREATE INDEX ix_audits_id ON audits (id);
+CREATE TABLE alarm_configs (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER UNIQUE REFERENCES users (id),
+                            no_recognition_threshold INTEGER, email_notification BOOLEAN, email_address VARCHAR);
+CREATE INDEX ix_alarm_configs_id ON alarm_configs (id);
+"""
+
+TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+DAYS = 90
+NOW = datetime.now()
+
+QUERIES = {
+    "stats today": (
+        "SELECT count(*) FROM logs WHERE user_id = ? AND type = 'success' AND timestamp >= ?",
+        lambda uid: (uid, datetime.combine(NOW.date(), datetime.min.time()).strftime(TS_FORMAT)),
+    ),
+    "history latest 100": (
+        "SELECT * FROM logs WHERE user_id = ? ORDER BY timestamp DESC LIMIT 100",
+        lambda uid: (uid,),
+    ),
+    "history 1-day range": (
+        "SELECT * FROM logs WHERE user_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp DESC LIMIT 100",
+        lambda uid: (uid, (NOW - timedelta(days=30)).strftime(TS_FORMAT), (NOW - timedelta(days=29)).strftime(TS_FORMAT)),
+    ),
+    "audits latest 50": (
+        "SELECT * FROM audits WHERE user_id = ? ORDER BY timestamp DESC LIMIT 50",
+        lambda uid: (uid,),
+    ),
+}
+
+
+def generate(path, rows, users):
+    rng = random.Random(1)
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    # 只影响造数速度，不参与计时
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany("INSERT INTO users (id, username) VALUES (?, ?)", [(u, f"user{u}") for u in range(1, users + 1)])
+    span = DAYS * 86400
+    types = ["info", "info", "info", "success", "warning"]
+
+    def log_rows(count):
+        for i in range(count):
+            ts = NOW - timedelta(seconds=span * (count - i) / count)
+            kind = rng.choice(types)
+            yield rng.randint(1, users), ts.strftime(TS_FORMAT), kind, f"{kind} message {i}"
+
+    chunk = 200000
+    gen = log_rows(rows)
+    for start in range(0, rows, chunk):
+        batch = [next(gen) for _ in range(min(chunk, rows - start))]
+        conn.executemany("INSERT INTO logs (user_id, timestamp, type, message) VALUES (?, ?, ?, ?)", batch)
+        conn.commit()
+    conn.executemany(
+        "INSERT INTO audits (user_id, timestamp, action, details, ip_address) VALUES (?, ?, 'login', '', 'unknown')",
+        ((u, t) for u, t, _, _ in log_rows(rows // 10)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def time_queries(conn, users, repeat):
+    rng = random.Random(2)
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        timings = []
+        for _ in range(repeat):
+            uid = rng.randint(1, users)
+            start = time.perf_counter()
+            conn.execute(sql, params(uid)).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = statistics.median(timings)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--dir", help="数据库文件目录，默认使用临时目录")
+    args = parser.parse_args()
+
+    tmp = args.dir or tempfile.mkdtemp()
+    before, after = os.path.join(tmp, "before.db"), os.path.join(tmp, "after.db")
+    try:
+        start = time.perf_counter()
+        generate(before, args.rows, args.users)
+        print(f"generated {args.rows} logs in {time.perf_counter() - start:.1f}s")
+        shutil.copy(before, after)
+
+        conn = sqlite3.connect(before)
+        baseline = time_queries(conn, args.users, args.repeat)
+        conn.close()
+
+        engine = create_engine(f"sqlite:///{after}")
+        event.listen(engine, "connect", set_sqlite_pragmas)
+        start = time.perf_counter()
+        run_migrations(engine)
+        print(f"migrations applied in {time.perf_counter() - start:.1f}s")
+        engine.dispose()
+
+        conn = sqlite3.connect(after)
+        set_sqlite_pragmas(conn)
+        tuned = time_queries(conn, args.users, args.repeat)
+        conn.close()
+
+        print(f"{'query':<22} {'before ms':>10} {'after ms':>10} {'speedup':>9}")
+        for name in QUERIES:
+            print(f"{name:<22} {baseline[name]:>10.2f} {tuned[name]:>10.3f} {baseline[name] / tuned[name]:>8.0f}x")
+    finally:
+        if not args.dir:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""本地 FunASR 替身服务，用于基准测试
+
+默认 (回显) 模式: 收到的二进制帧如果是 UTF-8 文本 (可用 \x00 补齐到一帧音频的
+长度)，就把它当作识别结果原样返回 (`{"text": ..., "mode": "2pass-offline",
+"is_final": true}`)，其余音频帧忽略。测试客户端因此可以精确控制每一帧对应
+的识别文本。
+
+脚本模式 (--script): 把所有二进制帧都当作音频，每个连接每收到
+--frames-per-line 帧就按顺序回放脚本中的下一句 (循环)，模拟真实的语音流。
+脚本为 JSON 字符串数组，或每行一句的文本文件。
+
+两种模式下结果都在 --delay-ms 加上 ±--jitter-ms 的随机抖动之后发出，
+同一连接内的结果保持顺序。
+
+用法:
+    python benchmarks/fake_funasr.py [--host 127.0.0.1] [--port 10095] [--delay-ms 0] [--jitter-ms 0]
+                                     [--script lines.json --frames-per-line 25]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import websockets
+
+
+def encode_text(text, frame_bytes=1920):
+    """把文本编码为一帧 (默认 60ms) 长度的二进制数据"""
+    data = text.encode("utf-8")
+    return data + b"\x00" * (-len(data) % frame_bytes)
+
+
+def decode_text(frame):
+    if not isinstance(frame, bytes):
+        return None
+    try:
+        return frame.rstrip(b"\x00").decode("utf-8") or None
+    except UnicodeDecodeError:
+        return None
+
+
+def load_script(path):
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    try:
+        lines = json.loads(content)
+    except ValueError:
+        lines = [line.strip() for line in content.splitlines()]
+    return [line for line in lines if line]
+
+
+def result(text):
+    return json.dumps({"text": text, "mode": "2pass-offline", "is_final": True}, ensure_ascii=False)
+
+
+async def handler(ws, delay, jitter=0.0, script=None, frames_per_line=25):
+    # 结果按到期时间依次发出，抖动不会打乱顺序
+    outbox: asyncio.Queue = asyncio.Queue()
+
+    async def sender():
+        while True:
+            due, message = await outbox.get()
+            wait = due - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await ws.send(message)
+
+    def schedule(text):
+        due = time.monotonic() + max(0.0, delay + random.uniform(-jitter, jitter))
+        outbox.put_nowait((due, result(text)))
+
+    task = asyncio.create_task(sender()) if delay or jitter else None
+    frames = 0
+    try:
+        async for frame in ws:
+            if not isinstance(frame, bytes):
+                continue  # 会话参数等文本帧
+            if script:
+                frames += 1
+                if frames % frames_per_line:
+                    continue
+                text = script[(frames // frames_per_line - 1) % len(script)]
+            else:
+                text = decode_text(frame)
+                if text is None:
+                    continue
+            if task is None:
+                await ws.send(result(text))
+            else:
+                schedule(text)
+    finally:
+        if task is not None:
+            task.cancel()
+
+
+async def serve(host, port, delay=0.0, jitter=0.0, script=None, frames_per_line=25):
+    async with websockets.serve(lambda ws: handler(ws, delay, jitter, script, frames_per_line),
+                                host, port, max_size=None):
+        await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=10095)
+    parser.add_argument("--delay-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--script", help="按句回放的识别脚本 (JSON 数组或每行一句)")
+    parser.add_argument("--frames-per-line", type=int, default=25, help="脚本模式下每句对应的音频帧数")
+    args = parser.parse_args()
+    script = load_script(args.script) if args.script else None
+    asyncio.run(serve(args.host, args.port, args.delay_ms / 1000, args.jitter_ms / 1000, script, args.frames_per_line))
+
+
+if __name__ == "__main__":
+    main()
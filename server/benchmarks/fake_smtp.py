@@ -0,0 +1,82 @@
+"""本地 SMTP 替身服务，用于测试告警邮件
+
+只实现投递一封邮件所需的最小命令集 (EHLO/HELO、MAIL、RCPT、DATA、RSET、
+NOOP、QUIT)，不做认证和 TLS。收到的邮件打印到标准输出，指定 --mbox 时
+追加写入该文件。
+
+用法:
+    python benchmarks/fake_smtp.py [--host 127.0.0.1] [--port 8025] [--mbox /tmp/alarms.mbox]
+    ALARM_SMTP_HOST=127.0.0.1 ALARM_SMTP_PORT=8025 uvicorn main:app
+"""
+import argparse
+import asyncio
+from datetime import datetime
+from email import message_from_bytes, policy
+
+
+async def handler(reader, writer, mbox):
+    async def reply(line):
+        writer.write(line.encode() + b"\r\n")
+        await writer.drain()
+
+    await reply("220 fake-smtp ready")
+    sender, recipients = None, []
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        command = line.decode("utf-8", "replace").strip()
+        verb = command[:4].upper()
+        if verb in ("EHLO", "HELO"):
+            await reply("250 fake-smtp")
+        elif verb == "MAIL":
+            sender, recipients = command.split(":", 1)[1].strip(), []
+            await reply("250 OK")
+        elif verb == "RCPT":
+            recipients.append(command.split(":", 1)[1].strip())
+            await reply("250 OK")
+        elif verb == "DATA":
+            await reply("354 End data with <CR><LF>.<CR><LF>")
+            lines = []
+            while True:
+                line = await reader.readline()
+                if not line or line in (b".\r\n", b".\n"):
+                    break
+                lines.append(line[1:] if line.startswith(b"..") else line)
+            data = b"".join(lines)
+            message = message_from_bytes(data, policy=policy.default)
+            print(f"[{datetime.now():%H:%M:%S}] {sender} -> {', '.join(recipients)}: {message['Subject']}", flush=True)
+            if mbox:
+                with open(mbox, "ab") as f:
+                    f.write(f"From {sender} {datetime.now():%c}\n".encode() + data.replace(b"\r\n", b"\n") + b"\n")
+            await reply("250 OK queued")
+        elif verb == "RSET":
+            sender, recipients = None, []
+            await reply("250 OK")
+        elif verb == "NOOP":
+            await reply("250 OK")
+        elif verb == "QUIT":
+            await reply("221 Bye")
+            break
+        else:
+            await reply("502 Command not implemented")
+    writer.close()
+
+
+async def serve(host, port, mbox=None):
+    server = await asyncio.start_server(lambda r, w: handler(r, w, mbox), host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--mbox", help="收到的邮件追加写入该文件")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.mbox))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""负载测试: 多路并发直播流的触发延迟、吞吐和服务端资源占用
+
+三部分组成:
+  * fake_funasr.py 脚本模式 —— 每个 FunASR 连接每收到 --frames-per-line 帧
+    音频就回放脚本中的下一句，带可配置的延迟和抖动；
+  * 模拟插件 —— 每个用户一个，按实时节奏向 /ws/plugin/{user_id} 推送 PCM
+    (正弦音，不会被静音抑制)，记录 "一句话的最后一帧发出 -> 收到点击指令"
+    的延迟；
+  * 模拟管理端 —— 每个用户 --admins-per-user 个，连接 /ws/admin/{user_id}，
+    统计收到的 success / info 日志，和插件收到的点击数对比得出丢失的广播。
+
+服务端在独立进程中运行 (预先写入足够的用户和关键词配置)，按 --streams
+依次测量各并发档位，报告客户端延迟分位数、每秒触发数、丢失的广播、
+服务端 CPU 和 RSS (读取 /proc，仅 Linux)，以及 /metrics 中各阶段耗时的
+分位数。结果保存为 JSON，便于在不同提交之间对比。
+
+用法 (在 server 目录下):
+    python benchmarks/load_harness.py [--streams 10,100,1000] [--duration 30] [--admins-per-user 1]
+                                      [--delay-ms 80] [--jitter-ms 40] [--output results.json]
+"""
+import argparse
+import array
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+
+import httpx
+import websockets
+
+from load_rest_relay import SERVER_DIR, percentile, wait_http
+
+FRAME_MS = 60
+FRAME_BYTES = 16000 * 2 * FRAME_MS // 1000
+
+LINKS = [(1, "保温杯"), (2, "连衣裙"), (3, "蓝牙耳机"), (4, "洗面奶")]
+FILLER = ["欢迎刚进直播间的朋友", "点个关注不迷路", "有问题可以打在公屏上", "库存不多了抓紧时间"]
+# 含关键词的句子与闲聊交替，每句对应触发的链接 (None 表示不触发)
+SCRIPT = [line for i, (_, keyword) in enumerate(LINKS) for line in (f"家人们看一下这款{keyword}今天特价", FILLER[i])]
+LINE_LINKS = [link_id for link_id, _ in LINKS for link_id in (link_id, None)]
+
+LAUNCHER = """
+import sys
+sys.path.insert(0, {server_dir!r})
+from init_db import init_db
+init_db()
+from database import engine
+from models import Config, Keyword, User
+from sqlalchemy import insert, select
+with engine.begin() as conn:
+    hashed = conn.execute(select(User.hashed_password).where(User.username == "admin")).scalar_one()
+    conn.execute(insert(User.__table__), [{{"id": 2 + i, "username": f"load{{i}}", "hashed_password": hashed,
+                                            "is_active": True, "is_superuser": False}} for i in range({users})])
+    conn.execute(insert(Config.__table__), [{{"user_id": 2 + i, "link_id": link_id, "position": position}}
+                                            for i in range({users})
+                                            for position, (link_id, _) in enumerate({links!r})])
+    conn.execute(insert(Keyword.__table__), [{{"user_id": 2 + i, "link_id": link_id, "keyword": keyword,
+                                               "position": 0}}
+                                             for i in range({users}) for link_id, keyword in {links!r}])
+import main, uvicorn
+uvicorn.run(main.app, host="127.0.0.1", port={port}, log_level="warning", backlog=4096)
+"""
+
+
+def tone(frames):
+    """约 -21 dBFS 的 440Hz 正弦音，保证不会被静音抑制"""
+    n = frames * FRAME_BYTES // 2
+    return array.array("h", (int(3000 * math.sin(2 * math.pi * 440 * i / 16000)) for i in range(n))).tobytes()
+
+
+class ProcessSampler:
+    """从 /proc 读取进程的 CPU 时间和 RSS"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return float("nan")
+        return (int(fields[11]) + int(fields[12])) / self.ticks  # utime + stime
+
+    def rss_mb(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return float("nan")
+
+
+class LevelStats:
+    def __init__(self):
+        self.latencies = []
+        self.expected = 0  # 应触发的句子数
+        self.clicks = 0  # 配对到句子的点击
+        self.unmatched_clicks = 0  # 超过一个脚本周期才到达的点击
+        self.lines = 0  # 插件发完的句子数 (每句产生一条 info 日志)
+        self.connect_errors = 0
+        self.admin_success = 0
+        self.admin_info = 0
+        self.admins_connected = 0
+
+
+async def plugin_client(base_ws, user_id, args, chunk, slots, start, stop, stats):
+    frame_interval = FRAME_MS / 1000
+    line_seconds = args.frames_per_line * frame_interval
+    cycle = len(SCRIPT) * line_seconds
+    sent_at = defaultdict(deque)  # link_id -> 等待点击的句子的发送时间
+
+    async def receive(ws):
+        async for message in ws:
+            now = time.perf_counter()
+            data = json.loads(message)
+            if data.get("action") != "click":
+                continue
+            queue = sent_at[data["link_id"]]
+            # 同一链接每个脚本周期出现一次，超过一个周期仍未点击的句子视为丢失
+            while queue and now - queue[0] > cycle:
+                queue.popleft()
+            if queue:
+                stats.latencies.append((now - queue.popleft()) * 1000)
+                stats.clicks += 1
+            else:
+                stats.unmatched_clicks += 1
+
+    try:
+        async with slots:
+            ws = await websockets.connect(f"{base_ws}/ws/plugin/{user_id}", open_timeout=120)
+    except Exception:
+        stats.connect_errors += 1
+        return
+    receiver = asyncio.create_task(receive(ws))
+    try:
+        await start.wait()
+        # 随机错开各路的句子边界
+        await asyncio.sleep(random.uniform(0, line_seconds))
+        frames, next_at = 0, time.monotonic()
+        while not stop.is_set():
+            await ws.send(chunk)
+            now = time.perf_counter()
+            first, frames = frames + 1, frames + args.chunk_frames
+            for boundary in range(-(-first // args.frames_per_line) * args.frames_per_line, frames + 1,
+                                  args.frames_per_line):
+                line = boundary // args.frames_per_line - 1
+                stats.lines += 1
+                link_id = LINE_LINKS[line % len(SCRIPT)]
+                if link_id is not None:
+                    sent_at[link_id].append(now)
+                    stats.expected += 1
+            next_at = max(next_at + args.chunk_frames * frame_interval, time.monotonic())
+            await asyncio.sleep(next_at - time.monotonic())
+        # 等待在途的识别结果和点击
+        await asyncio.sleep(args.drain)
+    finally:
+        receiver.cancel()
+        await ws.close()
+
+
+async def admin_client(base_ws, user_id, slots, done, stats):
+    try:
+        async with slots:
+            ws = await websockets.connect(f"{base_ws}/ws/admin/{user_id}", open_timeout=120)
+    except Exception:
+        stats.connect_errors += 1
+        return
+    stats.admins_connected += 1
+
+    async def receive():
+        async for message in ws:
+            batch = json.loads(message)
+            for log in batch if isinstance(batch, list) else [batch]:
+                if log.get("type") == "success":
+                    stats.admin_success += 1
+                elif log.get("type") == "info":
+                    stats.admin_info += 1
+
+    receiver = asyncio.create_task(receive())
+    try:
+        await done.wait()
+    finally:
+        receiver.cancel()
+        await ws.close()
+
+
+METRIC_LINE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+
+async def scrape(client):
+    """解析 /metrics，返回 {(名称, 标签串): 数值}"""
+    samples = {}
+    for line in (await client.get("/metrics")).text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            samples[(match.group(1), match.group(2) or "")] = float(match.group(3))
+    return samples
+
+
+def stage_quantiles(before, after, quantiles=(50, 99)):
+    """根据两次抓取之间的直方图桶增量估算各阶段耗时分位数 (毫秒，取桶上界)"""
+    buckets = defaultdict(list)
+    for (name, labels), value in after.items():
+        if name != "live_assistant_pipeline_stage_seconds_bucket":
+            continue
+        stage = re.search(r'stage="([^"]+)"', labels).group(1)
+        le = float(re.search(r'le="([^"]+)"', labels).group(1))
+        buckets[stage].append((le, value - before.get((name, labels), 0)))
+    result = {}
+    for stage, counts in sorted(buckets.items()):
+        counts.sort()
+        total = counts[-1][1]
+        if not total:
+            continue
+        result[stage] = {"count": int(total)}
+        for q in quantiles:
+            bound = next(le for le, cumulative in counts if cumulative >= total * q / 100)
+            result[stage][f"p{q}_ms"] = round(bound * 1000, 2) if math.isfinite(bound) else None
+    return result
+
+
+def counter_delta(before, after, name):
+    return after.get((name, ""), 0) - before.get((name, ""), 0)
+
+
+async def run_level(args, streams, base_http, base_ws, chunk, server, funasr):
+    stats = LevelStats()
+    start, stop, done = asyncio.Event(), asyncio.Event(), asyncio.Event()
+    users = range(2, 2 + streams)
+    slots = asyncio.Semaphore(args.connect_concurrency)  # 同时进行的握手数
+    admins = [asyncio.create_task(admin_client(base_ws, u, slots, done, stats))
+              for u in users for _ in range(args.admins_per_user)]
+    plugins = [asyncio.create_task(plugin_client(base_ws, u, args, chunk, slots, start, stop, stats)) for u in users]
+    # 等全部连接建立 (或失败) 后再开始计时
+    async with httpx.AsyncClient(base_url=base_http, timeout=60) as client:
+        deadline = time.monotonic() + 300
+        while time.monotonic() < deadline:
+            before = await scrape(client)
+            connected = (before.get(("live_assistant_plugin_sockets", ""), 0)
+                         + before.get(("live_assistant_admin_sockets", ""), 0))
+            if connected + stats.connect_errors >= streams * (1 + args.admins_per_user):
+                break
+            await asyncio.sleep(0.5)
+
+        client_cpu, server_cpu, funasr_cpu = time.process_time(), server.cpu_seconds(), funasr.cpu_seconds()
+        began = time.monotonic()
+        start.set()
+        rss = [server.rss_mb()]
+        while time.monotonic() - began < args.duration:
+            await asyncio.sleep(0.5)
+            rss.append(server.rss_mb())
+        elapsed = time.monotonic() - began
+        server_cpu = server.cpu_seconds() - server_cpu
+        client_cpu = time.process_time() - client_cpu
+        funasr_cpu = funasr.cpu_seconds() - funasr_cpu
+        stop.set()
+        await asyncio.wait(plugins, timeout=args.drain + 60)
+        # 日志广播有合并窗口，再等一会儿让管理端收完
+        await asyncio.sleep(1)
+        after = await scrape(client)
+    done.set()
+    await asyncio.wait(admins, timeout=30)
+    for task in plugins + admins:
+        task.cancel()
+
+    latencies = stats.latencies
+    triggers = stats.clicks + stats.unmatched_clicks
+    expected_success = triggers * args.admins_per_user
+    return {
+        "streams": streams,
+        "admins": stats.admins_connected,
+        "connect_errors": stats.connect_errors,
+        "duration_s": round(elapsed, 1),
+        "triggers": triggers,
+        "triggers_per_s": round(triggers / elapsed, 1),
+        "missed_triggers": max(0, stats.expected - triggers),
+        "unmatched_clicks": stats.unmatched_clicks,
+        "latency_ms": {
+            "p50": round(statistics.median(latencies), 1) if latencies else None,
+            "p90": round(percentile(latencies, 90), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "max": round(max(latencies), 1) if latencies else None,
+        },
+        # success 日志不允许丢弃，info 日志在管理端积压时按策略丢弃
+        "dropped_broadcasts": {
+            "success": max(0, expected_success - stats.admin_success),
+            "info": max(0, stats.lines * args.admins_per_user - stats.admin_info),
+        },
+        "server": {
+            "cpu_pct": round(server_cpu / elapsed * 100, 1),
+            "rss_mb": round(statistics.median(rss), 1),
+            "rss_peak_mb": round(max(rss), 1),
+            "logs_dropped": int(counter_delta(before, after, "live_assistant_logs_dropped_total")),
+            "pubsub_dropped": int(counter_delta(before, after, "live_assistant_pubsub_dropped_total")),
+            "funasr_reconnects": int(counter_delta(before, after, "live_assistant_funasr_reconnects_total")),
+            "stages_ms": stage_quantiles(before, after),
+        },
+        # 三者共用本机 CPU，客户端或替身吃满时延迟不再只反映服务端
+        "client_cpu_pct": round(client_cpu / elapsed * 100, 1),
+        "funasr_cpu_pct": round(funasr_cpu / elapsed * 100, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    levels = [int(s) for s in args.streams.split(",")]
+    tmp = tempfile.mkdtemp()
+    os.makedirs(os.path.join(tmp, "client", "dist", "assets"))
+    os.makedirs(os.path.join(tmp, "server"))
+    script_path = os.path.join(tmp, "script.json")
+    with open(script_path, "w", encoding="utf-8") as f:
+        json.dump(SCRIPT, f, ensure_ascii=False)
+    funasr_port, port = args.port + 1, args.port
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/bench.db", FUNASR_URLS=f"ws://127.0.0.1:{funasr_port}")
+    procs = [
+        subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, "benchmarks", "fake_funasr.py"),
+                          "--port", str(funasr_port), "--script", script_path,
+                          "--frames-per-line", str(args.frames_per_line),
+                          "--delay-ms", str(args.delay_ms), "--jitter-ms", str(args.jitter_ms)]),
+        subprocess.Popen(
+            [sys.executable, "-c", LAUNCHER.format(server_dir=SERVER_DIR, users=max(levels), links=LINKS, port=port)],
+            cwd=os.path.join(tmp, "server"), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ),
+    ]
+    results = {
+        "revision": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "port")},
+        "levels": {},
+    }
+    try:
+        base_http, base_ws = f"http://127.0.0.1:{port}", f"ws://127.0.0.1:{port}"
+        await wait_http(f"{base_http}/metrics", timeout=120)
+        funasr, server = ProcessSampler(procs[0].pid), ProcessSampler(procs[1].pid)
+        chunk = tone(args.chunk_frames)
+        for streams in levels:
+            level = await run_level(args, streams, base_http, base_ws, chunk, server, funasr)
+            results["levels"][str(streams)] = level
+            print(f"streams={streams:>5}: triggers/s={level['triggers_per_s']} latency_ms={level['latency_ms']} "
+                  f"missed={level['missed_triggers']} dropped={level['dropped_broadcasts']} "
+                  f"server_cpu={level['server']['cpu_pct']}% rss={level['server']['rss_peak_mb']}MB "
+                  f"client_cpu={level['client_cpu_pct']}% funasr_cpu={level['funasr_cpu_pct']}%")
+            await asyncio.sleep(2)  # 等待上一档的连接全部关闭
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", default="10,100,1000", help="逗号分隔的并发流数量，每档一轮")
+    parser.add_argument("--duration", type=float, default=30, help="每档的测量时长 (秒)")
+    parser.add_argument("--admins-per-user", type=int, default=1)
+    parser.add_argument("--delay-ms", type=float, default=80, help="FunASR 替身的识别延迟")
+    parser.add_argument("--jitter-ms", type=float, default=40, help="识别延迟的随机抖动 (±)")
+    parser.add_argument("--frames-per-line", type=int, default=24, help="每句话对应的 60ms 音频帧数")
+    parser.add_argument("--chunk-frames", type=int, default=4, help="插件每次发送的帧数")
+    parser.add_argument("--drain", type=float, default=3, help="停止推流后等待在途结果的时间 (秒)")
+    parser.add_argument("--connect-concurrency", type=int, default=50)
+    parser.add_argument("--port", type=int, default=18740)
+    parser.add_argument("--output", help="结果保存为 JSON")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
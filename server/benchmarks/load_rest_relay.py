@@ -0,0 +1,166 @@
+"""负载测试: REST 接口被高频调用时，插件 WebSocket 的转发延迟
+
+启动本地 FunASR 替身和一个独立进程的服务端，插件客户端持续发送帧并
+测量 "发送音频帧 -> 收到点击指令" 的往返延迟，先空载测一轮，再在
+多个 REST 客户端持续请求 /api/stats、/api/logs/history 等接口时测一轮。
+
+用法 (在 server 目录下):
+    python benchmarks/load_rest_relay.py [--plugins 20] [--rest-clients 20] [--duration 10] [--seed-logs 200000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import websockets
+
+from fake_funasr import encode_text
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KEYWORD = "触发词"
+
+LAUNCHER = """
+import sys, random
+from datetime import datetime, timedelta
+sys.path.insert(0, {server_dir!r})
+from init_db import init_db
+init_db()
+from database import engine
+from models import Log
+from sqlalchemy import insert
+rows = [{{"user_id": 1, "type": random.choice(["info", "success"]), "message": "seed",
+          "timestamp": datetime.now() - timedelta(seconds=i)}} for i in range({seed_logs})]
+with engine.begin() as conn:
+    for i in range(0, len(rows), 10000):
+        conn.execute(insert(Log.__table__), rows[i:i + 10000])
+import main, uvicorn
+uvicorn.run(main.app, host="127.0.0.1", port={port}, log_level="warning")
+"""
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def wait_http(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+async def plugin_client(base_ws, interval, stop, latencies):
+    async with websockets.connect(f"{base_ws}/ws/plugin/1") as ws:
+        i = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            await ws.send(encode_text(f"第{i}句{KEYWORD}"))
+            await ws.recv()
+            latencies.append((time.perf_counter() - start) * 1000)
+            i += 1
+            await asyncio.sleep(interval)
+
+
+async def rest_client(base_http, token, stop, counter):
+    headers = {"Authorization": f"Bearer {token}"}
+    paths = ["/api/stats", "/api/logs/history?limit=100", "/api/audits", "/api/config", "/api/alarm-config"]
+    async with httpx.AsyncClient(base_url=base_http, headers=headers, timeout=30) as client:
+        i = 0
+        while not stop.is_set():
+            if i % 10 == 9:
+                await client.post("/api/config", json=[{"id": 1, "keywords": [KEYWORD]}])
+            else:
+                await client.get(paths[i % len(paths)])
+            counter[0] += 1
+            i += 1
+
+
+async def run_phase(args, base_http, base_ws, token, rest_clients):
+    stop = asyncio.Event()
+    latencies, counter = [], [0]
+    tasks = [asyncio.create_task(plugin_client(base_ws, args.interval, stop, latencies)) for _ in range(args.plugins)]
+    tasks += [asyncio.create_task(rest_client(base_http, token, stop, counter)) for _ in range(rest_clients)]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    # 服务端卡死时请求可能一直不返回，限时等待后直接取消
+    _, pending = await asyncio.wait(tasks, timeout=10)
+    for task in pending:
+        task.cancel()
+    return latencies, counter[0] / args.duration
+
+
+async def run(args):
+    tmp = tempfile.mkdtemp()
+    os.makedirs(os.path.join(tmp, "client", "dist", "assets"))
+    os.makedirs(os.path.join(tmp, "server"))
+    funasr_port, port = args.port + 1, args.port
+    # 每句都含关键词，关闭链接冷却让每句都触发点击
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/bench.db", FUNASR_URLS=f"ws://127.0.0.1:{funasr_port}",
+               MATCH_LINK_COOLDOWN_MS="0")
+    procs = [
+        subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, "benchmarks", "fake_funasr.py"), "--port", str(funasr_port)]),
+        subprocess.Popen(
+            [sys.executable, "-c", LAUNCHER.format(server_dir=SERVER_DIR, seed_logs=args.seed_logs, port=port)],
+            cwd=os.path.join(tmp, "server"), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ),
+    ]
+    try:
+        base_http, base_ws = f"http://127.0.0.1:{port}", f"ws://127.0.0.1:{port}"
+        await wait_http(f"{base_http}/api/stats", timeout=300)
+        async with httpx.AsyncClient(base_url=base_http) as client:
+            r = await client.post("/api/token", data={"username": "admin", "password": "admin123"})
+            token = r.json()["access_token"]
+            await client.post("/api/config", json=[{"id": 1, "keywords": [KEYWORD]}],
+                              headers={"Authorization": f"Bearer {token}"})
+
+        results = {}
+        for name, rest_clients in (("idle", 0), ("rest_load", args.rest_clients)):
+            latencies, rps = await run_phase(args, base_http, base_ws, token, rest_clients)
+            results[name] = {
+                "samples": len(latencies),
+                "p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+                "p99_ms": round(percentile(latencies, 99), 2),
+                "max_ms": round(max(latencies), 2) if latencies else None,
+                "rest_rps": round(rps, 1),
+            }
+            print(f"{name:>10}: " + " ".join(f"{k}={v}" for k, v in results[name].items()))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--plugins", type=int, default=20)
+    parser.add_argument("--rest-clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=0.05, help="每个插件发送帧的间隔 (秒)")
+    parser.add_argument("--seed-logs", type=int, default=200000)
+    parser.add_argument("--port", type=int, default=18700)
+    parser.add_argument("--output", help="结果保存为 JSON")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import itertools
+from typing import Dict, NamedTuple, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from keyword_store import load_matcher_maps
+from matcher import KeywordMatcher
+
+
+class CompiledConfig(NamedTuple):
+    version: int
+    matcher: KeywordMatcher
+
+
+class ConfigCache:
+    """按 user_id 缓存编译好的关键词自动机
+
+    update_config 保存后调用 update() 递增版本号，正在运行的插件会话在
+    下一条识别结果时发现版本变化并换用新的自动机，无需重连。其他 worker
+    保存的配置经发布/订阅通知后由 refresh() 从数据库重新加载。
+    """
+
+    def __init__(self):
+        self._entries: Dict[int, CompiledConfig] = {}
+        # 全局递增，失效后重新加载也不会与旧版本号重复
+        self._versions = itertools.count(1)
+
+    def get(self, db: Session, user_id: int) -> CompiledConfig:
+        """获取用户当前配置，未缓存时从数据库加载一次"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._store(user_id, *load_matcher_maps(db, user_id))
+        return entry
+
+    def peek(self, user_id: int) -> Optional[CompiledConfig]:
+        return self._entries.get(user_id)
+
+    def update(self, user_id: int, keyword_map: Dict[str, int],
+               pinyin_map: Optional[Dict[str, Sequence[str]]] = None) -> CompiledConfig:
+        """配置保存后重新编译并递增版本号"""
+        return self._store(user_id, keyword_map, pinyin_map)
+
+    def refresh(self, db: Session, user_id: int) -> Optional[CompiledConfig]:
+        """从数据库重新加载并递增版本号 (在数据库线程调用)
+
+        加载期间本 worker 已经更新或失效过的，以那次的结果为准，不覆盖。
+        """
+        before = self._entries.get(user_id)
+        maps = load_matcher_maps(db, user_id)
+        if self._entries.get(user_id) is not before:
+            return self._entries.get(user_id)
+        return self._store(user_id, *maps)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _store(self, user_id: int, keyword_map: Dict[str, int],
+               pinyin_map: Optional[Dict[str, Sequence[str]]] = None) -> CompiledConfig:
+        entry = CompiledConfig(next(self._versions), KeywordMatcher(keyword_map, pinyin_map))
+        self._entries[user_id] = entry
+        return entry
+
+
+config_cache = ConfigCache()
@@ -1,12 +1,95 @@
-from sqlalchemy import create_engine
+import asyncio
+import fcntl
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+# 默认使用本地 SQLite，也可通过 DATABASE_URL 指向 Postgres 等数据库
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./sql_app.db")
+
+# 数据库线程池大小，与连接池保持一致
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+
+# SQLite 连接参数: mmap 与页缓存大小 (缓存为负数时单位是 KiB)
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", -64 * 1024))
 
+is_sqlite = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+connect_args = {"check_same_thread": False} if is_sqlite else {}
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args=connect_args, pool_size=DB_POOL_SIZE
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def set_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """WAL 模式下读写互不阻塞，synchronous=NORMAL 只在检查点时 fsync"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+if is_sqlite:
+    event.listen(engine, "connect", set_sqlite_pragmas)
+# expire_on_commit=False: 会话关闭后返回的对象仍可被序列化
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 Base = declarative_base()
+
+# 同步 SQLAlchemy 查询统一在该线程池中执行，不阻塞事件循环上的音频转发
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+async def run_db(fn, *args):
+    """在数据库线程池中以新会话执行 fn(db, *args) 并返回结果"""
+    def call():
+        with SessionLocal() as db:
+            return fn(db, *args)
+    return await asyncio.get_running_loop().run_in_executor(db_executor, call)
+
+async def iterate_db(fn, *args):
+    """在数据库线程池中逐块迭代 fn(db, *args) 返回的迭代器，会话在迭代结束后关闭"""
+    loop = asyncio.get_running_loop()
+    db = await loop.run_in_executor(db_executor, SessionLocal)
+    try:
+        chunks = await loop.run_in_executor(db_executor, lambda: iter(fn(db, *args)))
+        while True:
+            chunk = await loop.run_in_executor(db_executor, next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        await loop.run_in_executor(db_executor, db.close)
+
+def lock_path(name: str) -> str:
+    """跨进程锁文件: SQLite 放在数据库文件旁边，其他数据库按连接串放在临时目录"""
+    if is_sqlite:
+        path = SQLALCHEMY_DATABASE_URL.split(":///", 1)[-1]
+        if path and path != ":memory:":
+            return f"{os.path.abspath(path)}.{name}.lock"
+    digest = hashlib.sha1(SQLALCHEMY_DATABASE_URL.encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"live-assistant-{digest}-{name}.lock")
+
+@contextmanager
+def process_lock(name: str, blocking: bool = True) -> Iterator[bool]:
+    """同一台机器上使用同一数据库的 worker 之间互斥 (flock，进程退出时自动释放)
+
+    blocking=False 时拿不到锁立即返回 False。跨机器部署需要另行保证只有一处执行。
+    """
+    fd = os.open(lock_path(name), os.O_CREAT | os.O_RDWR, 0o600)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
@@ -1,9 +1,10 @@
-from database import engine, SessionLocal, Base
+from database import SessionLocal
+from migrations import run_migrations
 from models import User
 from auth import get_password_hash
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    run_migrations()
     db = SessionLocal()
     
     # 检查是否已存在管理员
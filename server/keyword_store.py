@@ -0,0 +1,199 @@
+"""关键词配置的存储
+
+每个链接一行 Config (position 为链接在配置中的顺序)，关键词拆分到
+keywords 表，每个 (用户, 链接, 关键词) 一行 (position 为链接内的顺序)。
+匹配优先级按 (链接顺序, 链接内顺序) 展开，与原先按提交顺序逐个解析
+JSON 的规则一致。
+
+保存时与数据库中已有的记录比较，只批量插入新增的行、删除移除的行，
+顺序变化时批量更新 position，由调用方在同一个事务中提交。
+
+开启拼音匹配的链接 (Config.pinyin_match)，其关键词按拼音编译 (见
+pinyin.py)。拼音在插入关键词时转换一次存入 keywords.pinyin，加载时
+直接使用，切换匹配方式不需要重新转换。
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+import pinyin
+from models import Config, Keyword, User
+
+# 单条 DELETE ... IN 语句最多携带的 id 数
+DELETE_CHUNK = 500
+
+
+class Link(NamedTuple):
+    link_id: int
+    keywords: List[str]
+    pinyin_match: bool = False
+
+
+Links = List[Link]
+
+
+class SaveStats(NamedTuple):
+    links_added: int
+    links_removed: int
+    keywords_added: int
+    keywords_removed: int
+    reordered: int
+
+
+def normalize(configs: Iterable[Tuple[int, Iterable[str], bool]]) -> Links:
+    """[(链接ID, [关键词], 拼音匹配)] 转为 Link 列表
+
+    重复的链接合并到第一次出现的位置，链接内重复的关键词只保留一个。
+    """
+    merged: Dict[int, Link] = {}
+    for link_id, keywords, pinyin_match in configs:
+        link = merged.get(link_id)
+        if link is None:
+            link = merged[link_id] = Link(link_id, [], bool(pinyin_match))
+        elif pinyin_match and not link.pinyin_match:
+            link = merged[link_id] = link._replace(pinyin_match=True)
+        for keyword in keywords:
+            if keyword not in link.keywords:
+                link.keywords.append(keyword)
+    return list(merged.values())
+
+
+def build_keyword_map(links: Links) -> Dict[str, int]:
+    """{关键词: 链接ID}，插入顺序即优先级；多个链接配置了同一关键词时后面的链接生效"""
+    return {keyword: link.link_id for link in links for keyword in link.keywords}
+
+
+def build_matcher_maps(links: Links, stored_pinyin: Optional[Dict[str, str]] = None
+                       ) -> Tuple[Dict[str, int], Dict[str, Tuple[str, ...]]]:
+    """KeywordMatcher 的参数: ({关键词: 链接ID}, {按拼音匹配的关键词: 音节序列})
+
+    stored_pinyin 为数据库中保存的拼音，缺失时 (如保存时未安装 pypinyin) 现场转换。
+    """
+    keyword_map = build_keyword_map(links)
+    pinyin_links = {link.link_id for link in links if link.pinyin_match}
+    pinyin_map = {}
+    if pinyin_links:
+        stored_pinyin = stored_pinyin or {}
+        for keyword, link_id in keyword_map.items():
+            if link_id in pinyin_links and keyword:
+                pinyin_map[keyword] = pinyin.parse_pinyin(stored_pinyin.get(keyword) or pinyin.keyword_pinyin(keyword))
+    return keyword_map, pinyin_map
+
+
+def load_links(db: Session, user_id: int) -> Links:
+    links = {link_id: Link(link_id, [], bool(pinyin_match)) for link_id, pinyin_match in db.execute(
+        select(Config.link_id, Config.pinyin_match).where(Config.user_id == user_id)
+        .order_by(Config.position, Config.id))}
+    rows = db.execute(select(Keyword.link_id, Keyword.keyword).where(Keyword.user_id == user_id)
+                      .order_by(Keyword.link_id, Keyword.position, Keyword.id))
+    for link_id, keyword in rows:
+        if link_id not in links:
+            links[link_id] = Link(link_id, [])
+        links[link_id].keywords.append(keyword)
+    return list(links.values())
+
+
+def load_matcher_maps(db: Session, user_id: int) -> Tuple[Dict[str, int], Dict[str, Tuple[str, ...]]]:
+    links = load_links(db, user_id)
+    pinyin_links = [link.link_id for link in links if link.pinyin_match]
+    stored_pinyin = None
+    if pinyin_links:
+        stored_pinyin = dict(db.execute(select(Keyword.keyword, Keyword.pinyin).where(
+            Keyword.user_id == user_id, Keyword.link_id.in_(pinyin_links), Keyword.pinyin.is_not(None))).all())
+    return build_matcher_maps(links, stored_pinyin)
+
+
+def _delete_ids(db: Session, model, ids: List[int]):
+    for i in range(0, len(ids), DELETE_CHUNK):
+        db.execute(delete(model).where(model.id.in_(ids[i:i + DELETE_CHUNK])))
+
+
+def _apply(db: Session, model, removed: List[int], added: List[dict], changed: List[dict]):
+    if removed:
+        _delete_ids(db, model, removed)
+    if added:
+        db.execute(insert(model), added)
+    if changed:
+        db.execute(update(model), changed)
+
+
+def save_links(db: Session, user_id: int, links: Links) -> SaveStats:
+    """将用户配置更新为 links (已 normalize)，只写入有变化的行，不提交
+
+    reordered 统计顺序或匹配方式有变化的行。
+
+    SQLite 上调用方应先在同一事务中执行一次写入 (如审计记录) 取得写锁，
+    否则并发保存可能基于过期的读取结果插入重复行；其他数据库锁住用户行。
+    """
+    db.execute(select(User.id).where(User.id == user_id).with_for_update())
+
+    existing_links = {link_id: (row_id, position, bool(pinyin_match))
+                      for row_id, link_id, position, pinyin_match in db.execute(
+                          select(Config.id, Config.link_id, Config.position, Config.pinyin_match)
+                          .where(Config.user_id == user_id))}
+    existing_keywords = {(link_id, keyword): (row_id, position) for row_id, link_id, keyword, position in db.execute(
+        select(Keyword.id, Keyword.link_id, Keyword.keyword, Keyword.position).where(Keyword.user_id == user_id))}
+
+    wanted_links = {link.link_id: (position, link.pinyin_match) for position, link in enumerate(links)}
+    wanted_keywords = {(link.link_id, keyword): position
+                       for link in links for position, keyword in enumerate(link.keywords)}
+
+    # 链接: 顺序和匹配方式
+    removed = [row_id for link_id, (row_id, _, _) in existing_links.items() if link_id not in wanted_links]
+    added = [{"user_id": user_id, "link_id": link_id, "position": position, "pinyin_match": pinyin_match}
+             for link_id, (position, pinyin_match) in wanted_links.items() if link_id not in existing_links]
+    changed = [{"id": existing_links[link_id][0], "position": position, "pinyin_match": pinyin_match}
+               for link_id, (position, pinyin_match) in wanted_links.items()
+               if link_id in existing_links and existing_links[link_id][1:] != (position, pinyin_match)]
+    _apply(db, Config, removed, added, changed)
+    reordered = len(changed)
+
+    # 关键词: 新增的关键词在这里转换一次拼音
+    removed = [row_id for key, (row_id, _) in existing_keywords.items() if key not in wanted_keywords]
+    added = [{"user_id": user_id, "link_id": link_id, "keyword": keyword, "position": position,
+              "pinyin": pinyin.keyword_pinyin(keyword) if pinyin.available else None}
+             for (link_id, keyword), position in wanted_keywords.items() if (link_id, keyword) not in existing_keywords]
+    changed = [{"id": existing_keywords[key][0], "position": position}
+               for key, position in wanted_keywords.items()
+               if key in existing_keywords and existing_keywords[key][1] != position]
+    _apply(db, Keyword, removed, added, changed)
+    reordered += len(changed)
+
+    return SaveStats(
+        links_added=len(wanted_links.keys() - existing_links.keys()),
+        links_removed=len(existing_links.keys() - wanted_links.keys()),
+        keywords_added=len(wanted_keywords.keys() - existing_keywords.keys()),
+        keywords_removed=len(existing_keywords.keys() - wanted_keywords.keys()),
+        reordered=reordered,
+    )
+
+
+def find_conflicts(db: Session, user_id: Optional[int], keywords: Optional[Sequence[str]] = None) -> List[dict]:
+    """按关键词索引查找冲突
+
+    未指定 keywords 时返回被多个链接配置的关键词；指定时返回这些关键词
+    当前所属的链接 (保存前检查)。user_id 为 None 时检索全部用户。
+    link_ids 按匹配优先级排列，effective_link_id 为实际触发的链接。
+    """
+    query = select(Keyword.user_id, Keyword.keyword, Keyword.link_id).join(
+        Config, and_(Config.user_id == Keyword.user_id, Config.link_id == Keyword.link_id), isouter=True)
+    if user_id is not None:
+        query = query.where(Keyword.user_id == user_id)
+    if keywords:
+        query = query.where(Keyword.keyword.in_(list(keywords)))
+    else:
+        duplicated = select(Keyword.user_id, Keyword.keyword).group_by(Keyword.user_id, Keyword.keyword) \
+            .having(func.count() > 1)
+        if user_id is not None:
+            duplicated = duplicated.where(Keyword.user_id == user_id)
+        duplicated = duplicated.subquery()
+        query = query.join(duplicated, and_(duplicated.c.user_id == Keyword.user_id,
+                                            duplicated.c.keyword == Keyword.keyword))
+    query = query.order_by(Keyword.user_id, Keyword.keyword, Config.position, Keyword.link_id)
+
+    conflicts: Dict[Tuple[int, str], List[int]] = {}
+    for owner, keyword, link_id in db.execute(query):
+        conflicts.setdefault((owner, keyword), []).append(link_id)
+    return [{"user_id": owner, "keyword": keyword, "link_ids": link_ids, "effective_link_id": link_ids[-1]}
+            for (owner, keyword), link_ids in conflicts.items()]
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import insert
+
+from database import engine
+from metrics import PIPELINE_SECONDS
+from models import Log
+
+logger = logging.getLogger(__name__)
+
+PERSIST_SECONDS = PIPELINE_SECONDS.labels("persist")
+
+
+class LogWriter:
+    """触发日志异步批量落库 (write-behind)
+
+    识别循环只把日志放进有界队列，后台任务攒够 batch_size 条或等待
+    flush_interval 秒后，在专用线程里用一次 executemany 插入，避免每次
+    触发都在事件循环上 commit/fsync。队列满时丢弃并计数。stop() 取走队列
+    中剩余的日志写入，之后提交的日志没有人写，直接丢弃并记录。
+    """
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 200, flush_interval: float = 0.2):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Optional[asyncio.Future] = None
+        self._batch: List[dict] = []
+        # 单线程执行器保证批次按顺序写入
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-writer")
+
+    def submit(self, user_id: int, type: str, message: str, details: Optional[str] = None,
+               link_id: Optional[int] = None, timestamp: Optional[datetime] = None) -> bool:
+        """提交一条日志，队列满或未运行时丢弃并返回 False"""
+        if self._queue is None:
+            self.dropped += 1
+            logger.warning(f"Log writer not running, dropped {type} log for user {user_id}: {message}")
+            return False
+        row = {"user_id": user_id, "timestamp": timestamp or datetime.now(), "type": type,
+               "message": message, "details": details, "link_id": link_id}
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Log queue full, dropped {self.dropped} logs so far")
+            return False
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写入队列中剩余的日志"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._pending is not None:
+            await self._pending
+        # 先摘下队列，最后一批写入期间提交的日志不会留在无人处理的队列里
+        queue, self._queue = self._queue, None
+        rows, self._batch = self._batch, []
+        while not queue.empty():
+            rows.append(queue.get_nowait())
+        if rows:
+            await self._flush(rows)
+        logger.info(f"Log writer stopped: written={self.written} dropped={self.dropped}")
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _run(self):
+        while True:
+            self._batch.append(await self._queue.get())
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            rows, self._batch = self._batch, []
+            # shield: 关闭时正在写入的批次继续完成，由 stop() 等待
+            self._pending = asyncio.ensure_future(self._flush(rows))
+            await asyncio.shield(self._pending)
+
+    async def _flush(self, rows: List[dict]):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._write_batch, rows)
+            self.written += len(rows)
+            self.batches += 1
+            now = datetime.now()
+            for row in rows:
+                PERSIST_SECONDS.observe((now - row["timestamp"]).total_seconds())
+        except Exception as e:
+            self.dropped += len(rows)
+            logger.error(f"Failed to write {len(rows)} logs: {e}")
+
+    def _write_batch(self, rows: List[dict]):
+        with engine.begin() as conn:
+            conn.execute(insert(Log.__table__), rows)
+
+
+log_writer = LogWriter(
+    max_queue=int(os.environ.get("LOG_QUEUE_SIZE", 10000)),
+    batch_size=int(os.environ.get("LOG_BATCH_SIZE", 200)),
+    flush_interval=int(os.environ.get("LOG_FLUSH_MS", 200)) / 1000,
+)
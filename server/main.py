@@ -1,28 +1,46 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-import osicFiles
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import math
+import os
+import time
+import uvicorn
 from sqlalchemy.orm import Session
+from pydantic import ValidationError
 import json
 import asyncio
 import logging
-from typing import List, Dict
+from typing import List, Dict, Optional, Set
 from datetime import datetime, timedelta
 
-from database import engine, SessionLocal, Base
-from models import User, Config, Log, Audit, AlarmConfig
-from auth import get_current_user, create_access_token, authenticate_user, get_password_hash
-from schemas import Token, UserLogin, ConfigUpdate, LogQuery, UserCreate, UserResponse, AlarmConfigUpdate
+from database import run_db, iterate_db
+from migrations import run_migrations
+from models import User, Log, Audit, AlarmConfig
+from auth import get_current_user, create_access_token, authenticate_user, ACCESS_TOKEN_EXPIRE_MINUTES
+from passwords import password_hasher
+from ratelimit import login_limiter
+from schemas import Token, UserLogin, ConfigUpdate, LogQuery, AuditQuery, UserCreate, UserResponse, AlarmConfigUpdate, AudioFormat
+from config_cache import config_cache
+from keyword_store import build_matcher_maps, find_conflicts, load_links, normalize, save_links
+from matcher import StreamingMatcher
+from user_cache import user_cache
+from log_writer import log_writer
+from stats import trigger_stats, STATS_FLUSH_SECONDS
+from history import fetch_page, export_chunks
+from upstream import UpstreamSession, funasr_pool
+from audio import AudioConverter, AudioIngest
+from admin_stream import AdminConnection, LogBatcher, encode_frame, negotiate_format
+from pubsub import RESYNC, create_backend
+from metrics import PIPELINE_SECONDS, profiler, registry
+from static_assets import StaticAssets, find_static_dir
+from retention import RETENTION_INTERVAL_HOURS, retention_job
+from alarms import AlarmSettings, alarm_configs, alarm_engine
 
 # 初始化日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 创建数据库表
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(title="Live Assistant API")
 
 # CORS配置
@@ -32,31 +50,113 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# 依赖项：获取数据库会话
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@app.on_event("startup")
+async def on_startup():
+    # 密码哈希进程池最先启动 (fork 时不带上其他后台线程)
+    password_hasher.start()
+    static_assets.load()
+    # 建表与索引由迁移负责
+    run_migrations()
+    log_writer.start()
+    await trigger_stats.start(STATS_FLUSH_SECONDS)
+    funasr_pool.start()
+    await manager.start()
+    alarm_engine.start(on_no_recognition)
+    retention_job.start(RETENTION_INTERVAL_HOURS * 3600)
+    if os.environ.get("METRICS_PROFILER") == "1":
+        # 在事件循环线程中调用，采样的就是事件循环
+        profiler.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # 写入尚未落库的触发日志和统计
+    await log_writer.stop()
+    await trigger_stats.stop()
+    await funasr_pool.close()
+    await alarm_engine.stop()
+    await retention_job.stop()
+    await manager.stop()
+    password_hasher.shutdown()
+    profiler.stop()
 
 # 全局连接管理器
 class ConnectionManager:
+    """本 worker 的插件和管理端连接
+
+    日志经发布/订阅后端 (见 pubsub.py) 转发，多个 worker 或多台机器部署时，
+    管理端也能收到连接在其他 worker 上的插件产生的日志。关键词、告警配置
+    和用户的缓存修改后同样经后端通知其他 worker。
+    """
+
     def __init__(self):
         # 插件连接: {user_id: [WebSocket]}
         self.plugin_connections: Dict[int, List[WebSocket]] = {}
-        # 管理端连接: {user_id: [WebSocket]}
-        self.admin_connections: Dict[int, List[WebSocket]] = {}
-        # FunASR连接地址
-        self.funasr_url = "ws://10.98.98.5:10095"
+        # 管理端连接: {user_id: [AdminConnection]}
+        self.admin_connections: Dict[int, List[AdminConnection]] = {}
+        self.pubsub = create_backend()
+        # 合并短时间内的日志，每批只发布一次
+        self.log_batcher = LogBatcher(self.pubsub.publish)
+        # 收到其他 worker 的通知后重新加载配置的任务
+        self._reloads: Set[asyncio.Task] = set()
+
+    async def start(self):
+        await self.pubsub.start(self._deliver_logs, self._on_remote_change)
+        # 用户的修改在数据库线程提交，转到事件循环发出通知
+        loop = asyncio.get_running_loop()
+        user_cache.on_commit = lambda user_id: loop.call_soon_threadsafe(self.pubsub.notify, "user", user_id)
+
+    async def stop(self):
+        user_cache.on_commit = None
+        await self.pubsub.close()
+
+    def _on_remote_change(self, kind: str, user_id: int):
+        """其他 worker 修改了用户的配置 (config / alarm) 或用户本身 (user)
+
+        失效本 worker 的缓存，有在线插件会话的用户立即重新加载，会话在
+        下一条识别结果时换用新配置。
+        """
+        if kind == RESYNC:
+            user_cache.clear()
+            config_cache.clear()
+            alarm_configs.clear()
+            for live_user in list(self.plugin_connections):
+                self._reload(live_user, config=True, alarm=True)
+        elif kind == "config":
+            config_cache.invalidate(user_id)
+            self._reload(user_id, config=True)
+        elif kind == "alarm":
+            alarm_configs.invalidate(user_id)
+            self._reload(user_id, alarm=True)
+        elif kind == "user":
+            user_cache.invalidate_user(user_id)
+            config_cache.invalidate(user_id)
+            alarm_configs.invalidate(user_id)
+
+    def _reload(self, user_id: int, config: bool = False, alarm: bool = False):
+        if user_id not in self.plugin_connections:
+            return
+        task = asyncio.create_task(self._refresh(user_id, config, alarm))
+        self._reloads.add(task)
+        task.add_done_callback(self._reloads.discard)
+
+    async def _refresh(self, user_id: int, config: bool, alarm: bool):
+        try:
+            if config:
+                await run_db(config_cache.refresh, user_id)
+            if alarm:
+                alarm_engine.update(user_id, await run_db(alarm_configs.refresh, user_id))
+        except Exception as e:
+            logger.error(f"Failed to reload config for user {user_id}: {e}")
 
     async def connect_plugin(self, websocket: WebSocket, user_id: int):
         await websocket.accept()
         if user_id not in self.plugin_connections:
             self.plugin_connections[user_id] = []
         self.plugin_connections[user_id].append(websocket)
+        self._report_presence(user_id)
         logger.info(f"Plugin connected for user {user_id}")
 
     def disconnect_plugin(self, websocket: WebSocket, user_id: int):
@@ -65,50 +165,176 @@ class ConnectionManager:
                 self.plugin_connections[user_id].remove(websocket)
             if not self.plugin_connections[user_id]:
                 del self.plugin_connections[user_id]
+            self._report_presence(user_id)
         logger.info(f"Plugin disconnected for user {user_id}")
 
-    async def connect_admin(self, websocket: WebSocket, user_id: int):
+    async def connect_admin(self, websocket: WebSocket, user_id: int, format: str = "json"):
         await websocket.accept()
         if user_id not in self.admin_connections:
             self.admin_connections[user_id] = []
-        self.admin_connections[user_id].append(websocket)
-        logger.info(f"Admin connected for user {user_id}")
+            self.pubsub.subscribe(user_id)
+        self.admin_connections[user_id].append(AdminConnection(websocket, format))
+        self._report_presence(user_id)
+        logger.info(f"Admin connected for user {user_id} ({format})")
 
     def disconnect_admin(self, websocket: WebSocket, user_id: int):
         if user_id in self.admin_connections:
-            if websocket in self.admin_connections[user_id]:
-                self.admin_connections[user_id].remove(websocket)
-            if not self.admin_connections[user_id]:
-                del self.admin_connections[user_id]
+            for conn in self.admin_connections[user_id]:
+                if conn.websocket is websocket:
+                    conn.close()
+            self._remove_closed_admins(user_id)
         logger.info(f"Admin disconnected for user {user_id}")
 
-    async def broadcast_log(self, user_id: int, log_data: dict):
-        """向用户的管理端广播日志"""
-        if user_id in self.admin_connections:
-            for connection in self.admin_connections[user_id]:
-                try:
-                    await connection.send_json(log_data)
-                except Exception as e:
-                    logger.error(f"Failed to send log to admin: {e}")
+    def _remove_closed_admins(self, user_id: int):
+        connections = [c for c in self.admin_connections.get(user_id, []) if not c.closed]
+        if connections:
+            self.admin_connections[user_id] = connections
+        elif self.admin_connections.pop(user_id, None) is not None:
+            self.pubsub.unsubscribe(user_id)
+        self._report_presence(user_id)
+
+    def _report_presence(self, user_id: int):
+        self.pubsub.set_presence(
+            user_id,
+            len(self.plugin_connections.get(user_id, [])),
+            len(self.admin_connections.get(user_id, []))
+        )
+
+    def presence(self, user_id: int) -> dict:
+        """所有 worker 上该用户的插件和管理端连接数"""
+        return self.pubsub.presence(user_id)._asdict()
+
+    def broadcast_log(self, user_id: int, log_data: dict):
+        """向用户的管理端广播日志 (只入队，不等待发送)"""
+        if self.pubsub.presence(user_id).admins:
+            self.log_batcher.add(user_id, log_data)
+
+    def _deliver_logs(self, user_id: int, batch: List[dict]):
+        # 同一批日志每种格式只序列化一次，本 worker 的所有连接共享
+        frames = {}
+        evicted = False
+        for conn in self.admin_connections.get(user_id, []):
+            frame = frames.get(conn.format)
+            if frame is None:
+                frame = frames[conn.format] = encode_frame(batch, conn.format)
+            if not conn.enqueue(frame):
+                evicted = True
+        if evicted:
+            self._remove_closed_admins(user_id)
 
 manager = ConnectionManager()
 
+# --- 监控指标 ---
+
+# 正在进行的插件音频会话，用于统计转发队列深度
+active_ingests = set()
+
+STAGE_INGEST, STAGE_FORWARD, STAGE_ASR, STAGE_MATCH, STAGE_CLICK, STAGE_BROADCAST, STAGE_TRIGGER = (
+    PIPELINE_SECONDS.labels(stage)
+    for stage in ("ingest", "forward", "asr", "match", "click", "broadcast", "trigger")
+)
+
+registry.gauge("live_assistant_plugin_sockets", "Open plugin WebSocket connections on this worker",
+               lambda: sum(len(c) for c in manager.plugin_connections.values()))
+registry.gauge("live_assistant_admin_sockets", "Open admin WebSocket connections on this worker",
+               lambda: sum(len(c) for c in manager.admin_connections.values()))
+registry.gauge("live_assistant_admin_send_backlog", "Frames waiting in admin send queues",
+               lambda: sum(conn.backlog for c in manager.admin_connections.values() for conn in c))
+registry.gauge("live_assistant_audio_pending_frames", "Audio frames waiting to be forwarded to FunASR",
+               lambda: sum(ingest.pending for ingest in active_ingests))
+registry.gauge("live_assistant_log_queue_depth", "Trigger logs waiting to be written",
+               lambda: log_writer.queue_depth)
+registry.counter("live_assistant_logs_written_total", "Trigger logs written to the database",
+                 lambda: log_writer.written)
+registry.counter("live_assistant_logs_dropped_total", "Trigger logs dropped (queue full or write failed)",
+                 lambda: log_writer.dropped)
+registry.gauge("live_assistant_funasr_sessions", "Active upstream sessions per FunASR endpoint",
+               lambda: {e.url: e.active for e in funasr_pool.endpoints}, labelname="endpoint")
+registry.counter("live_assistant_funasr_reconnects_total", "Upstream reconnects after a lost FunASR connection",
+                 lambda: funasr_pool.reconnects)
+registry.counter("live_assistant_user_cache_hits_total", "Token-to-user cache hits", lambda: user_cache.hits)
+registry.counter("live_assistant_user_cache_misses_total", "Token-to-user cache misses", lambda: user_cache.misses)
+registry.gauge("live_assistant_password_pending", "Password hashes running or queued",
+               lambda: password_hasher.pending)
+registry.counter("live_assistant_pubsub_dropped_total", "Log batches dropped by the pub/sub backend",
+                 lambda: manager.pubsub.dropped)
+registry.counter("live_assistant_retention_rows_deleted_total", "Rows archived and deleted by the retention job",
+                 lambda: dict(retention_job.rows_deleted), labelname="table")
+registry.gauge("live_assistant_alarm_timers", "Plugin sessions watched for missing recognition results",
+               lambda: alarm_engine.active)
+registry.counter("live_assistant_alarms_fired_total", "No-recognition alarms raised", lambda: alarm_engine.fired)
+registry.counter("live_assistant_alarm_notifications_total", "Alarm notifications by outcome",
+                 lambda: {"sent": alarm_engine.notifier.sent, "failed": alarm_engine.notifier.failed,
+                          "dropped": alarm_engine.notifier.dropped}, labelname="result")
+
+def on_no_recognition(timer):
+    # 告警推送到管理端日志流并落库，邮件由告警引擎交给 Notifier 发送
+    message = f"告警: 已连续 {timer.threshold} 秒没有识别结果，请检查直播间音频和插件"
+    manager.broadcast_log(timer.user_id, {
+        "id": str(datetime.now().timestamp()),
+        "timestamp": datetime.now().strftime("%H:%M:%S"),
+        "type": "warning",
+        "message": message
+    })
+    log_writer.submit(timer.user_id, "warning", message)
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus 文本格式
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/debug/profiler")
+async def get_profile(current_user: User = Depends(get_current_user)):
+    # 折叠格式的调用栈采样 (flamegraph.pl / speedscope 可直接读取)
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return PlainTextResponse(profiler.collapsed())
+
+@app.post("/api/debug/profiler")
+async def toggle_profiler(enabled: bool, interval_ms: float = 10, reset: bool = False,
+                          current_user: User = Depends(get_current_user)):
+    # 运行时开关事件循环的采样分析
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if reset:
+        profiler.reset()
+    if enabled:
+        profiler.start(max(interval_ms, 1) / 1000)
+    else:
+        profiler.stop()
+    return profiler.status()
+
 # --- 认证接口 ---
 
 @app.post("/api/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    # 按来源 IP 和用户名的失败次数限流，超出时不再计算 bcrypt
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = login_limiter.check(client_ip, form_data.username)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
+        login_limiter.failed(client_ip, form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    # 记录登录审计
-    audit = Audit(user_id=user.id, action="login", details="User logged in", ip_address="unknown")
-    db.add(audit)
-    db.commit()
+    login_limiter.succeeded(client_ip, form_data.username)
+
+    def audit_login(db: Session):
+        # 记录登录审计
+        audit = Audit(user_id=user.id, action="login", details="User logged in", ip_address="unknown")
+        db.add(audit)
+        db.commit()
+
+    await run_db(audit_login)
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -120,246 +346,412 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 # --- 配置管理接口 ---
 
 @app.get("/api/config")
-async def get_config(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    configs = db.query(Config).filter(Config.user_id == current_user.id).all()
-    return [{"id": c.link_id, "keywords": json.loads(c.keywords)} for c in configs]
+async def get_config(current_user: User = Depends(get_current_user)):
+    def query(db: Session):
+        return [{"id": link.link_id, "keywords": link.keywords, "pinyin_match": link.pinyin_match}
+                for link in load_links(db, current_user.id)]
+    return await run_db(query)
 
 @app.post("/api/config")
-async def update_config(configs: List[ConfigUpdate], current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # 清除旧配置
-    db.query(Config).filter(Config.user_id == current_user.id).delete()
-    
-    # 添加新配置
-    for c in configs:
-        new_config = Config(user_id=current_user.id, link_id=c.id, keywords=json.dumps(c.keywords))
-        db.add(new_config)
-    
-    # 记录审计日志
-    audit = Audit(user_id=current_user.id, action="update_config", details=f"Updated {len(configs)} links", ip_address="unknown")
-    db.add(audit)
-    
-    db.commit()
-    return {"status": "success"}
+async def update_config(configs: List[ConfigUpdate], current_user: User = Depends(get_current_user)):
+    links = normalize((c.id, c.keywords, c.pinyin_match) for c in configs)
+
+    def save(db: Session):
+        # 先写审计记录: SQLite 在第一条写语句处开启事务并取得写锁，
+        # 之后的读取和差异写入不会与并发的保存交错
+        audit = Audit(user_id=current_user.id, action="update_config", details=f"Updated {len(links)} links", ip_address="unknown")
+        db.add(audit)
+        db.flush()
+
+        # 只写入与已保存配置的差异
+        stats = save_links(db, current_user.id, links)
+        audit.details += f" (+{stats.keywords_added} -{stats.keywords_removed} keywords)"
+        db.commit()
+        return stats
+
+    stats = await run_db(save)
+
+    # 重新编译关键词，在线的插件会话在下一条识别结果时生效
+    config_cache.update(current_user.id, *build_matcher_maps(links))
+    manager.pubsub.notify("config", current_user.id)
+    return {"status": "success", "changes": stats._asdict()}
+
+@app.get("/api/config/conflicts")
+async def get_config_conflicts(keyword: Optional[List[str]] = Query(None), all_users: bool = False,
+                               current_user: User = Depends(get_current_user)):
+    """未指定 keyword 时返回被多个链接配置的关键词，指定时返回这些关键词已配置在哪些链接上
+
+    超级管理员可用 all_users=true 检索全部用户。
+    """
+    if all_users and not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    user_id = None if all_users else current_user.id
+    return await run_db(find_conflicts, user_id, keyword)
 
 # --- 日志查询接口 ---
 
 @app.get("/api/logs/history")
-async def get_history_logs(limit: int = 100, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    logs = db.query(Log).filter(Log.user_id == current_user.id).order_by(Log.timestamp.desc()).limit(limit).all()
+async def get_history_logs(response: Response, params: LogQuery = Depends(), current_user: User = Depends(get_current_user)):
+    # 游标分页：下一页游标放在 X-Next-Cursor 响应头中
+    logs, next_cursor = await run_db(fetch_page, Log, current_user.id, params)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return logs
 
+@app.get("/api/logs/export")
+async def export_logs(format: str = "ndjson", params: LogQuery = Depends(), current_user: User = Depends(get_current_user)):
+    return export_response(Log, current_user.id, params, format)
+
+def export_response(model, user_id: int, params: LogQuery, fmt: str):
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Unsupported export format")
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"{model.__tablename__}.{fmt}"
+    return StreamingResponse(
+        iterate_db(export_chunks, model, user_id, params, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
 @app.get("/api/stats")
-async def get_stats(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # 简单统计：今日触发次数
-    today = datetime.now().date()
-    today_start = datetime.combine(today, datetime.min.time())
-    
-    trigger_count = db.query(Log).filter(
-        Log.user_id == current_user.id, 
-        Log.type == "success",
-        Log.timestamp >= today_start
-    ).count()
-    
-    return {"today_triggers": trigger_count}
+async def get_stats(current_user: User = Depends(get_current_user)):
+    # 今日触发次数、按小时分布和各链接次数 (内存计数，不扫描日志)
+    return trigger_stats.snapshot(current_user.id)
+
+@app.get("/api/presence")
+async def get_presence(current_user: User = Depends(get_current_user)):
+    # 当前在线的插件和管理端连接数 (汇总所有 worker)
+    return manager.presence(current_user.id)
 
 @app.get("/api/audits")
-async def get_audits(limit: int = 50, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    audits = db.query(Audit).filter(Audit.user_id == current_user.id).order_by(Audit.timestamp.desc()).limit(limit).all()
+async def get_audits(response: Response, params: AuditQuery = Depends(), current_user: User = Depends(get_current_user)):
+    audits, next_cursor = await run_db(fetch_page, Audit, current_user.id, params)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return audits
 
+@app.get("/api/audits/export")
+async def export_audits(format: str = "ndjson", params: AuditQuery = Depends(), current_user: User = Depends(get_current_user)):
+    return export_response(Audit, current_user.id, params, format)
+
 # --- 用户管理接口 (仅超级管理员) ---
 
 @app.get("/api/users", response_model=List[UserResponse])
-async def get_users(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_users(current_user: User = Depends(get_current_user)):
     if not current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Not authorized")
-    return db.query(User).all()
+    return await run_db(lambda db: db.query(User).all())
 
 @app.post("/api/users", response_model=UserResponse)
-async def create_user(user: UserCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, current_user: User = Depends(get_current_user)):
     if not current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user:
-        raise HTTPException(status_code=400, detail="Username already registered")
-    
-    new_user = User(
-        username=user.username,
-        hashed_password=get_password_hash(user.password),
-        is_superuser=user.is_superuser
-    )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    
-    # 记录审计
-    audit = Audit(user_id=current_user.id, action="create_user", details=f"Created user {user.username}", ip_address="unknown")
-    db.add(audit)
-    db.commit()
+    hashed_password = await password_hasher.hash(user.password)
+
+    def create(db: Session):
+        db_user = db.query(User).filter(User.username == user.username).first()
+        if db_user:
+            raise HTTPException(status_code=400, detail="Username already registered")
+        
+        new_user = User(
+            username=user.username,
+            hashed_password=hashed_password,
+            is_superuser=user.is_superuser
+        )
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
+        
+        # 记录审计
+        audit = Audit(user_id=current_user.id, action="create_user", details=f"Created user {user.username}", ip_address="unknown")
+        db.add(audit)
+        db.commit()
+        return new_user
     
-    return new_user
+    return await run_db(create)
 
 @app.delete("/api/users/{user_id}")
-async def delete_user(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_user(user_id: int, current_user: User = Depends(get_current_user)):
     if not current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    db.delete(user)
-    
-    # 记录审计
-    audit = Audit(user_id=current_user.id, action="delete_user", details=f"Deleted user {user.username}", ip_address="unknown")
-    db.add(audit)
-    db.commit()
+    def delete(db: Session):
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        db.delete(user)
+        
+        # 记录审计
+        audit = Audit(user_id=current_user.id, action="delete_user", details=f"Deleted user {user.username}", ip_address="unknown")
+        db.add(audit)
+        db.commit()
     
+    # 其他 worker 由 user_cache.on_commit 通知
+    await run_db(delete)
+    config_cache.invalidate(user_id)
+    alarm_configs.invalidate(user_id)
+    user_cache.invalidate_user(user_id)
     return {"status": "success"}
 
 # --- 告警配置接口 ---
 
 @app.get("/api/alarm-config")
-async def get_alarm_config(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    config = db.query(AlarmConfig).filter(AlarmConfig.user_id == current_user.id).first()
-    if not config:
-        return {"no_recognition_threshold": 300, "email_notification": False, "email_address": ""}
-    return config
+async def get_alarm_config(current_user: User = Depends(get_current_user)):
+    settings = alarm_configs.peek(current_user.id)
+    if settings is None:
+        settings = await run_db(alarm_configs.get, current_user.id)
+    return settings._asdict()
 
 @app.post("/api/alarm-config")
-async def update_alarm_config(config: AlarmConfigUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_config = db.query(AlarmConfig).filter(AlarmConfig.user_id == current_user.id).first()
-    if not db_config:
-        db_config = AlarmConfig(user_id=current_user.id)
-        db.add(db_config)
-    
-    db_config.no_recognition_threshold = config.no_recognition_threshold
-    db_config.email_notification = config.email_notification
-    db_config.email_address = config.email_address
-    
-    db.commit()
+async def update_alarm_config(config: AlarmConfigUpdate, current_user: User = Depends(get_current_user)):
+    def save(db: Session):
+        db_config = db.query(AlarmConfig).filter(AlarmConfig.user_id == current_user.id).first()
+        if not db_config:
+            db_config = AlarmConfig(user_id=current_user.id)
+            db.add(db_config)
+        
+        db_config.no_recognition_threshold = config.no_recognition_threshold
+        db_config.email_notification = config.email_notification
+        db_config.email_address = config.email_address
+        
+        db.commit()
+
+    await run_db(save)
+    # 更新缓存并应用到正在进行的插件会话
+    settings = AlarmSettings(config.no_recognition_threshold, config.email_notification, config.email_address or "")
+    alarm_configs.update(current_user.id, settings)
+    alarm_engine.update(current_user.id, settings)
+    manager.pubsub.notify("alarm", current_user.id)
     return {"status": "success"}
 
+# --- 数据保留 ---
+
+@app.get("/api/retention")
+async def get_retention(current_user: User = Depends(get_current_user)):
+    # 保留策略和最近一次运行的报告 (移动行数、归档大小、释放字节数、持锁时间)
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {
+        "running": retention_job.running,
+        "archive_dir": retention_job.archive_dir,
+        "policies": {p.model.__tablename__: p.days for p in retention_job.policies},
+        "last_report": retention_job.last_report,
+    }
+
+@app.post("/api/retention/run", status_code=202)
+async def run_retention(current_user: User = Depends(get_current_user)):
+    # 立即在后台执行一次，结果通过 GET /api/retention 查看
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if retention_job.running:
+        raise HTTPException(status_code=409, detail="Retention job already running")
+    retention_job.run_in_background()
+    return {"status": "started"}
+
 # --- 静态文件托管 (SPA) ---
 
-# 挂载静态文件目录
-if os.path.exists("client/dist"):
-    app.mount("/assets", StaticFiles(directory="client/dist/assets"), name="assets")
-    # 挂载其他可能的静态资源目录，如 images
-    if os.path.exists("client/dist/images"):
-        app.mount("/images", StaticFiles(directory="client/dist/images"), name="images")
-
-    @app.get("/{full_path:path}")
-    async def serve_spa(full_path: str):
-        # 如果请求的是 API 或 WebSocket，不处理（由上面的路由处理）
-        if full_path.startswith("api") or full_path.startswith("ws"):
-            return None # 应该由具体的路由处理，这里只是为了避免覆盖
-        
-        # 检查文件是否存在于 dist 根目录 (如 favicon.ico, robots.txt)
-        file_path = os.path.join("client/dist", full_path)
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            return FileResponse(file_path)
-            
-        # 否则返回 index.html (SPA 路由)
-        return FileResponse("client/dist/index.html")
+# 构建目录在启动时索引一次，文件和预压缩变体的查找都在内存中完成
+static_assets = StaticAssets(find_static_dir())
+
+@app.get("/{full_path:path}")
+async def serve_spa(full_path: str, request: Request):
+    # 未匹配到的 API 路径直接 404，不回退到 index.html
+    if full_path.startswith(("api/", "ws/")) or full_path in ("api", "ws"):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    # dist 中的文件 (assets/ 下的打包产物、favicon.ico、robots.txt 等)
+    asset = static_assets.lookup(full_path)
+    if asset is not None:
+        return static_assets.response(request, asset)
+    # 带哈希的打包产物不存在时不能回退，否则会被当作脚本长期缓存
+    if full_path.startswith("assets/") or static_assets.index is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    # 否则返回 index.html (SPA 路由)
+    return static_assets.response(request, static_assets.index)
 
 # --- WebSocket 核心逻辑 ---
 
 @app.websocket("/ws/plugin/{user_id}")
-async def websocket_plugin_endpoint(websocket: WebSocket, user_id: int, db: Session = Depends(get_db)):
-    # 验证用户是否存在（简单验证，实际应使用Token）
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+async def websocket_plugin_endpoint(websocket: WebSocket, user_id: int):
+    # 只在连接时短暂使用数据库会话，不在整个连接期间占用
+    def load(db: Session):
+        # 验证用户是否存在（简单验证，实际应使用Token）
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            return None
+        # 获取用户配置 (已编译的关键词自动机，按版本缓存) 和告警配置
+        return config_cache.get(db, user_id), alarm_configs.get(db, user_id)
+
+    loaded = await run_db(load)
+    if loaded is None:
         await websocket.close(code=4001)
         return
+    compiled, alarm_settings = loaded
 
     await manager.connect_plugin(websocket, user_id)
-    
-    # 获取用户配置
-    configs = db.query(Config).filter(Config.user_id == user_id).all()
-    keyword_map = {}
-    for c in configs:
-        keywords = json.loads(c.keywords)
-        for k in keywords:
-            keyword_map[k] = c.link_id
+    # 连续 no_recognition_threshold 秒没有识别结果时告警
+    alarm = alarm_engine.open(user_id, alarm_settings)
+
+    # 连接到 FunASR (断线时自动重连，期间音频先缓存)
+    upstream = UpstreamSession(funasr_pool)
+    upstream.start()
+    logger.info(f"Started FunASR session for user {user_id}")
+
+    # 启动接收 FunASR 结果的任务
+    streaming = StreamingMatcher(compiled.matcher)
+    last_forward_at = 0.0  # 最近一帧发给 FunASR 的时间，用于估算识别耗时
+
+    async def receive_from_funasr():
+        nonlocal compiled
+        try:
+            async for message in upstream.messages():
+                received_at = time.perf_counter()
+                if last_forward_at:
+                    STAGE_ASR.observe(received_at - last_forward_at)
+                data = json.loads(message)
+                text = data.get("text", "")
+                # 2pass-online/online 为中间结果 (增量文本)，offline/2pass-offline 为整句最终结果
+                partial = data.get("mode") in ("online", "2pass-online")
+
+                if text:
+                    if alarm.reset():
+                        manager.broadcast_log(user_id, {
+                            "id": str(datetime.now().timestamp()),
+                            "timestamp": datetime.now().strftime("%H:%M:%S"),
+                            "type": "info",
+                            "message": "识别已恢复"
+                        })
+                    if data.get("mode") != "2pass-online":
+                        # 记录识别日志 (2pass 的中间片段随后会以整句再出现一次)
+                        log_entry = {
+                            "id": str(datetime.now().timestamp()),
+                            "timestamp": datetime.now().strftime("%H:%M:%S"),
+                            "type": "info",
+                            "message": f"识别: {text}"
+                        }
+                        manager.broadcast_log(user_id, log_entry)
+
+                    # 配置已更新则换用新的自动机
+                    latest = config_cache.peek(user_id)
+                    if latest is not None and latest.version != compiled.version:
+                        compiled = latest
+                        streaming.matcher = compiled.matcher
+                        logger.info(f"Reloaded keyword config v{compiled.version} for user {user_id}")
+
+                    # 关键词匹配 (一次只触发一个，已触发过或冷却中的不重复触发)
+                    match_start = time.perf_counter()
+                    if partial:
+                        hit = streaming.feed_partial(text, data.get("confidence"))
+                        text = streaming.text
+                    else:
+                        hit = streaming.feed_final(text)
+                    STAGE_MATCH.observe(time.perf_counter() - match_start)
+                    if hit:
+                        keyword, link_id = hit.keyword, hit.link_id
+                        # 拼音匹配命中的是同音字，日志中同时给出原文
+                        matched = text[hit.start:hit.end]
+                        label = f"'{keyword}'" if matched == keyword else f"'{keyword}' (识别为 '{matched}')"
+                        # 触发点击
+                        click_start = time.perf_counter()
+                        await websocket.send_json({"action": "click", "link_id": link_id})
+                        clicked_at = time.perf_counter()
+                        STAGE_CLICK.observe(clicked_at - click_start)
+                        STAGE_TRIGGER.observe(clicked_at - received_at)
+                            
+                        # 记录成功日志
+                        success_log = {
+                            "id": str(datetime.now().timestamp()),
+                            "timestamp": datetime.now().strftime("%H:%M:%S"),
+                            "type": "success",
+                            "message": f"触发: {label} -> 点击链接 #{link_id}"
+                        }
+                        manager.broadcast_log(user_id, success_log)
+                        STAGE_BROADCAST.observe(time.perf_counter() - clicked_at)
+                            
+                        # 持久化日志 (后台批量写入) 并更新统计
+                        triggered_at = datetime.now()
+                        log_writer.submit(
+                            user_id,
+                            "success",
+                            f"触发: {label} -> 点击链接 #{link_id}",
+                            json.dumps({"keyword": keyword, "matched": matched, "text": text, "partial": partial}),
+                            link_id=link_id,
+                            timestamp=triggered_at
+                        )
+                        trigger_stats.record(user_id, link_id, triggered_at)
+        except Exception as e:
+            logger.error(f"Error receiving from FunASR: {e}")
+
+    funasr_task = asyncio.create_task(receive_from_funasr())
+
+    # 音频按 FunASR 帧长重新分帧、过滤静音后由单独的任务转发
+    ingest = AudioIngest()
+    active_ingests.add(ingest)
+
+    async def forward_audio():
+        nonlocal last_forward_at
+        async for frame in ingest.frames():
+            start = time.perf_counter()
+            await upstream.send(frame)
+            last_forward_at = time.perf_counter()
+            STAGE_FORWARD.observe(last_forward_at - start)
+
+    forward_task = asyncio.create_task(forward_audio())
 
     try:
-        # 连接到 FunASR
-        import websockets
-        async with websockets.connect(manager.funasr_url) as funasr_ws:
-            logger.info(f"Connected to FunASR for user {user_id}")
-            
-            # 启动接收 FunASR 结果的任务
-            async def receive_from_funasr():
-                try:
-                    async for message in funasr_ws:
-                        data = json.loads(message)
-                        text = data.get("text", "")
-                        
-                        if text:
-                            # 记录识别日志
-                            log_entry = {
-                                "id": str(datetime.now().timestamp()),
-                                "timestamp": datetime.now().strftime("%H:%M:%S"),
-                                "type": "info",
-                                "message": f"识别: {text}"
-                            }
-                            await manager.broadcast_log(user_id, log_entry)
-                            
-                            # 关键词匹配
-                            for keyword, link_id in keyword_map.items():
-                                if keyword in text:
-                                    # 触发点击
-                                    await websocket.send_json({"action": "click", "link_id": link_id})
-                                    
-                                    # 记录成功日志
-                                    success_log = {
-                                        "id": str(datetime.now().timestamp()),
-                                        "timestamp": datetime.now().strftime("%H:%M:%S"),
-                                        "type": "success",
-                                        "message": f"触发: '{keyword}' -> 点击链接 #{link_id}"
-                                    }
-                                    await manager.broadcast_log(user_id, success_log)
-                                    
-                                    # 持久化日志
-                                    db_log = Log(
-                                        user_id=user_id,
-                                        type="success",
-                                        message=f"触发: '{keyword}' -> 点击链接 #{link_id}",
-                                        details=json.dumps({"keyword": keyword, "text": text})
-                                    )
-                                    db.add(db_log)
-                                    db.commit()
-                                    break # 一次只触发一个
-                except Exception as e:
-                    logger.error(f"Error receiving from FunASR: {e}")
-
-            funasr_task = asyncio.create_task(receive_from_funasr())
-
-            # 主循环：接收插件音频数据转发给 FunASR
-            while True:
-                data = await websocket.receive_bytes()
-                await funasr_ws.send(data)
+        # 插件可在第一个文本帧中声明音频格式，未声明时按 16kHz 单声道 int16 处理
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        audio_format = AudioFormat()
+        if message.get("text") is not None:
+            try:
+                audio_format = AudioFormat.model_validate_json(message["text"])
+            except ValidationError as e:
+                logger.warning(f"Rejected audio format from user {user_id}: {e}")
+                await websocket.close(code=1003)
+                return
+            logger.info(f"Plugin audio format for user {user_id}: {audio_format}")
+            data = None
+        else:
+            data = message.get("bytes")
+        # 重采样滤波器首次构建需要几毫秒到几十毫秒，不放在事件循环上
+        converter = await asyncio.to_thread(AudioConverter, **audio_format.model_dump())
+
+        # 主循环：接收插件音频数据
+        while True:
+            if data:
+                start = time.perf_counter()
+                await ingest.push(converter.convert(data))
+                STAGE_INGEST.observe(time.perf_counter() - start)
+            data = await websocket.receive_bytes()
 
     except WebSocketDisconnect:
-        manager.disconnect_plugin(websocket, user_id)
+        pass
     except Exception as e:
         logger.error(f"Plugin connection error: {e}")
+    finally:
         manager.disconnect_plugin(websocket, user_id)
+        alarm.close()
+        active_ingests.discard(ingest)
+        forward_task.cancel()
+        await upstream.close()
+        funasr_task.cancel()
+        logger.info(f"Audio session ended for user {user_id}: {ingest.counters()}, matches: {streaming.counters()}")
 
 @app.websocket("/ws/admin/{user_id}")
-async def websocket_admin_endpoint(websocket: WebSocket, user_id: int):
+async def websocket_admin_endpoint(websocket: WebSocket, user_id: int, format: Optional[str] = Query(None)):
     # 实际应验证 Token
-    await manager.connect_admin(websocket, user_id)
+    # 日志以数组形式批量推送，format=msgpack 时使用二进制 msgpack 帧
+    await manager.connect_admin(websocket, user_id, negotiate_format(format))
     try:
         while True:
             await websocket.receive_text() # 保持连接
     except WebSocketDisconnect:
         manager.disconnect_admin(websocket, user_id)
 
-# 静态文件服务 (最后挂载)
-app.mount("/", StaticFiles(directory="../client/dist", html=True), name="static")
-
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,280 @@
+import os
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+from pinyin import to_syllables
+
+# 关键词较少时逐个 `in` 查找 (C 实现) 比逐字符走自动机更快，交叉点约 80~96 个 (见 bench_matcher.py)
+LINEAR_SCAN_MAX = 64
+
+# 流式识别的中间结果是否可以直接触发
+MATCH_PARTIALS = os.environ.get("MATCH_PARTIALS", "1") != "0"
+# 中间结果只触发不短于该长度的关键词，更短的等待最终结果确认
+MATCH_PARTIAL_MIN_LEN = int(os.environ.get("MATCH_PARTIAL_MIN_LEN", 2))
+# 上游给出置信度时，中间结果低于该值不触发
+MATCH_PARTIAL_MIN_CONFIDENCE = float(os.environ.get("MATCH_PARTIAL_MIN_CONFIDENCE", 0))
+# 同一链接两次点击的最小间隔 (毫秒)
+MATCH_LINK_COOLDOWN_MS = int(os.environ.get("MATCH_LINK_COOLDOWN_MS", 2000))
+# 只有中间结果、迟迟没有最终结果时，缓存的句子超过该长度后截断
+MATCH_MAX_SEGMENT_CHARS = 4096
+
+
+class Match(NamedTuple):
+    start: int  # 命中在文本中的起始位置
+    end: int  # 命中结束位置 (不含)
+    keyword: str
+    link_id: int
+    priority: int  # 关键词的配置顺序，数值越小越优先
+
+
+class Automaton:
+    """Aho-Corasick 状态机，模式是任意可哈希元素的序列
+
+    KeywordMatcher 用它按字匹配原文、按音节匹配拼音；每个模式对应关键词
+    的全局优先级下标，两个状态机共用一套优先级。
+    """
+
+    def __init__(self):
+        self.size = 0
+        # 状态转移表、失败指针、每个状态上结束的关键词
+        self._goto: List[Dict[Hashable, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        # 沿失败链可达的最高优先级 (scan_best 只需要这个)
+        self._best: List[int] = []
+
+    def __bool__(self):
+        return self.size > 0
+
+    def add(self, pattern: Sequence[Hashable], index: int):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(index)
+        self.size += 1
+
+    def build(self, no_hit: int):
+        """no_hit 为关键词总数，表示没有命中"""
+        goto, fail, out = self._goto, self._fail, self._out
+        best = [min(o) if o else no_hit for o in out]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                # BFS 保证失败指针指向的状态已处理完毕
+                out[nxt] = out[nxt] + out[fail[nxt]]
+                best[nxt] = min(best[nxt], best[fail[nxt]])
+        self._best = best
+
+    def scan(self, seq: Sequence[Hashable]) -> List[Tuple[int, int]]:
+        """单次扫描返回全部命中 [(结束位置, 关键词下标)]"""
+        hits = []
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(seq):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in out[state]:
+                hits.append((i + 1, index))
+        return hits
+
+    def scan_best(self, seq: Sequence[Hashable], limit: int) -> Tuple[int, int]:
+        """返回优先级高于 limit 的最佳命中 (关键词下标, 最早的结束位置)，没有时下标为 limit"""
+        goto, fail, best_of = self._goto, self._fail, self._best
+        best, end = limit, 0
+        state = 0
+        for i, ch in enumerate(seq):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if best_of[state] < best:
+                # 优先级严格提高时才更新，记录的是该关键词第一次出现的位置
+                best, end = best_of[state], i + 1
+                if best == 0:
+                    break
+        return best, end
+
+
+class KeywordMatcher:
+    """Aho-Corasick 关键词自动机
+
+    keyword_map 的插入顺序即关键词优先级，与原先遍历 keyword_map 逐个
+    `keyword in text` 的规则保持一致：一段文本命中多个关键词时，只有
+    优先级最高的那个触发。
+
+    pinyin_map 中的关键词 ({关键词: 音节序列}) 按拼音匹配，编译进音节
+    状态机；识别结果只在存在这类关键词时逐字转换一次。
+    """
+
+    def __init__(self, keyword_map: Dict[str, int], pinyin_map: Optional[Dict[str, Sequence[str]]] = None):
+        pinyin_map = pinyin_map or {}
+        self.keywords: List[str] = []
+        self.link_ids: List[int] = []
+        self.max_len = 0
+        self.exact = Automaton()
+        self.pinyin = Automaton()
+
+        for keyword, link_id in keyword_map.items():
+            # 空关键词会命中任意文本，直接忽略
+            if not keyword:
+                continue
+            syllables = pinyin_map.get(keyword)
+            if syllables and len(syllables) == len(keyword):
+                self.pinyin.add(syllables, len(self.keywords))
+            else:
+                self.exact.add(keyword, len(self.keywords))
+            self.keywords.append(keyword)
+            self.link_ids.append(link_id)
+            self.max_len = max(self.max_len, len(keyword))
+        self.exact.build(len(self.keywords))
+        self.pinyin.build(len(self.keywords))
+        # 构建时确定走哪条路径，first_match 中不再逐次判断 (Automaton 的 len 是 Python 调用)
+        self._linear = len(self.keywords) <= LINEAR_SCAN_MAX and not self.pinyin
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def _match(self, end: int, index: int) -> Match:
+        keyword = self.keywords[index]
+        return Match(end - len(keyword), end, keyword, self.link_ids[index], index)
+
+    def find_all(self, text: str) -> List[Match]:
+        """单次扫描返回全部命中 (按结束位置排序)"""
+        hits = self.exact.scan(text) if self.exact else []
+        if self.pinyin:
+            hits += self.pinyin.scan(to_syllables(text))
+            hits.sort()
+        return [self._match(end, index) for end, index in hits]
+
+    def first_match(self, text: str) -> Optional[Match]:
+        """返回应当触发的命中 (优先级最高的关键词)，没有命中返回 None"""
+        if self._linear:
+            for index, keyword in enumerate(self.keywords):
+                # `in` 比 find 快一倍，绝大多数关键词不命中，命中后再取位置
+                if keyword in text:
+                    start = text.find(keyword)
+                    return Match(start, start + len(keyword), keyword, self.link_ids[index], index)
+            return None
+
+        best, end = len(self.keywords), 0
+        if self.exact:
+            best, end = self.exact.scan_best(text, best)
+        if self.pinyin and best:
+            pinyin_best, pinyin_end = self.pinyin.scan_best(to_syllables(text), best)
+            if pinyin_best < best:
+                best, end = pinyin_best, pinyin_end
+        if best == len(self.keywords):
+            return None
+        return self._match(end, best)
+
+
+class StreamingMatcher:
+    """单个插件会话的增量匹配
+
+    FunASR 2pass 模式先逐段推送中间结果 (增量文本)，一句话结束后再推送
+    修正过的整句最终结果。中间结果累积为当前句子，每次只扫描新增部分
+    (向前多取最长关键词长度 - 1 个字，跨段的关键词也能命中)；满足条件时
+    直接在中间结果上触发，不必等整句结束。最终结果只在它的触发关键词
+    没有被本句的中间结果触发过时才触发。任何触发都受链接冷却时间限制。
+    """
+
+    def __init__(self, matcher: KeywordMatcher, fire_partials: bool = MATCH_PARTIALS,
+                 partial_min_len: int = MATCH_PARTIAL_MIN_LEN,
+                 min_confidence: float = MATCH_PARTIAL_MIN_CONFIDENCE,
+                 cooldown: float = MATCH_LINK_COOLDOWN_MS / 1000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.matcher = matcher
+        self.fire_partials = fire_partials
+        self.partial_min_len = partial_min_len
+        self.min_confidence = min_confidence
+        self.cooldown = cooldown
+        self.clock = clock
+        self.text = ""  # 当前句子已收到的中间结果
+        self._scanned = 0  # text 中已扫描过的长度
+        self._fired: Counter = Counter()  # 本句中间结果已触发的关键词
+        self._last_fire: Dict[int, float] = {}
+        self.partial_triggers = 0
+        self.final_triggers = 0
+        self.deduped = 0
+        self.cooled_down = 0
+
+    def counters(self) -> Dict[str, int]:
+        return {
+            "partial_triggers": self.partial_triggers,
+            "final_triggers": self.final_triggers,
+            "deduped": self.deduped,
+            "cooled_down": self.cooled_down,
+        }
+
+    def feed_partial(self, delta: str, confidence: Optional[float] = None) -> Optional[Match]:
+        """追加一段中间结果，返回应当立即触发的命中
+
+        命中的 start/end 是在追加后的 self.text 中的位置。
+        """
+        if len(self.text) + len(delta) > MATCH_MAX_SEGMENT_CHARS:
+            # 在匹配之前截断，返回的位置对应截断后的文本
+            self._truncate()
+        base = max(0, self._scanned - (self.matcher.max_len - 1))
+        self.text += delta
+        hits = [m._replace(start=m.start + base, end=m.end + base)
+                for m in self.matcher.find_all(self.text[base:]) if m.end + base > self._scanned]
+        self._scanned = len(self.text)
+
+        if not self.fire_partials or (confidence is not None and confidence < self.min_confidence):
+            return None
+        hits = [m for m in hits if len(m.keyword) >= self.partial_min_len]
+        if not hits:
+            return None
+        hit = min(hits, key=lambda m: m.priority)
+        if not self._allow(hit.link_id):
+            return None
+        self._fired[hit.keyword] += 1
+        self.partial_triggers += 1
+        return hit
+
+    def feed_final(self, text: str) -> Optional[Match]:
+        """一句话的最终结果，返回应当触发的命中并开始新的句子"""
+        fired = self._fired
+        self.text, self._scanned, self._fired = "", 0, Counter()
+        hit = self.matcher.first_match(text)
+        if hit is None:
+            return None
+        if fired[hit.keyword]:
+            # 中间结果已经为同一个关键词点击过
+            self.deduped += 1
+            return None
+        if not self._allow(hit.link_id):
+            return None
+        self.final_triggers += 1
+        return hit
+
+    def _allow(self, link_id: int) -> bool:
+        now = self.clock()
+        last = self._last_fire.get(link_id)
+        if last is not None and now - last < self.cooldown:
+            self.cooled_down += 1
+            return False
+        self._last_fire[link_id] = now
+        return True
+
+    def _truncate(self):
+        # 只保留跨段匹配需要的尾部
+        keep = self.matcher.max_len - 1
+        self.text = self.text[len(self.text) - keep:] if keep else ""
+        self._scanned = len(self.text)
+
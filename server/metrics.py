@@ -0,0 +1,204 @@
+"""进程内指标和 Prometheus 文本格式导出
+
+热路径上只做 bisect + 计数，不加锁 (所有观测都在事件循环线程或单个
+写日志线程中进行，偶发的竞争只会让计数差一)。状态类指标 (连接数、
+队列深度、重连次数) 在抓取时通过回调读取，平时没有任何开销。
+
+另带一个采样分析器: 后台线程定期抓取事件循环线程的调用栈，输出
+折叠格式 (可直接交给 flamegraph.pl / speedscope)，运行时开关。
+"""
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Union
+
+# 秒，覆盖从亚毫秒的匹配到秒级的 ASR 和落库
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Sample = Union[float, Dict[str, float]]
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一格为 +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelname: Optional[str] = None,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelname = labelname
+        self.buckets = tuple(buckets)
+        self._children: Dict[str, _HistogramChild] = {}
+
+    def labels(self, value: str = "") -> _HistogramChild:
+        """返回某个标签值的子指标，热路径上应提前取好并复用"""
+        child = self._children.get(value)
+        if child is None:
+            child = self._children[value] = _HistogramChild(self.buckets)
+        return child
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for value, child in sorted(self._children.items()):
+            label = f'{self.labelname}="{_escape(value)}",' if self.labelname else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{label}le="{_format_value(bound)}"}} {cumulative}'
+            plain = f"{{{label[:-1]}}}" if label else ""
+            yield f"{self.name}_sum{plain} {child.sum!r}"
+            yield f"{self.name}_count{plain} {cumulative}"
+
+
+class CallbackMetric:
+    """抓取时调用 fn 取值；fn 返回 {标签值: 数值} 时按 labelname 展开"""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Sample], kind: str = "gauge",
+                 labelname: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+        self.labelname = labelname
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        value = self.fn()
+        if isinstance(value, dict):
+            for label, v in sorted(value.items()):
+                yield f'{self.name}{{{self.labelname}="{_escape(str(label))}"}} {_format_value(v)}'
+        else:
+            yield f"{self.name} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def histogram(self, name: str, help: str, labelname: Optional[str] = None,
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelname, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, fn: Callable[[], Sample], labelname: Optional[str] = None):
+        self._metrics.append(CallbackMetric(name, help, fn, "gauge", labelname))
+
+    def counter(self, name: str, help: str, fn: Callable[[], Sample], labelname: Optional[str] = None):
+        self._metrics.append(CallbackMetric(name, help, fn, "counter", labelname))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# 触发链路各阶段耗时:
+#   ingest    收到插件音频块 -> 转换、分帧并入队
+#   queue     帧在转发队列中等待
+#   forward   帧发送给 FunASR
+#   asr       最近一帧发出 -> 收到识别结果
+#   match     关键词匹配
+#   click     点击指令发给插件
+#   broadcast 触发日志交给管理端广播
+#   persist   触发 -> 日志写入数据库
+#   trigger   收到识别结果 -> 点击指令发出
+PIPELINE_SECONDS = registry.histogram(
+    "live_assistant_pipeline_stage_seconds", "Latency of each stage of the trigger pipeline", "stage")
+
+
+class SamplingProfiler:
+    """定期采样目标线程调用栈的分析器，开启期间每次采样约几十微秒"""
+
+    MAX_DEPTH = 64
+
+    def __init__(self):
+        self.interval = 0.01
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self._stacks: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._target: Optional[int] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = 0.01, target: Optional[int] = None):
+        """开始采样 target 线程 (默认为调用方所在线程，即事件循环)"""
+        if self.running:
+            return
+        self.interval = interval
+        self._target = target or threading.get_ident()
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        self._stacks = Counter()
+        self.samples = 0
+
+    def collapsed(self) -> str:
+        """折叠格式: 每行 "帧;帧;帧 次数"，根在前"""
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def status(self) -> dict:
+        return {"running": self.running, "interval_ms": self.interval * 1000,
+                "samples": self.samples, "started_at": self.started_at}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            while frame is not None and len(stack) < self.MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+profiler = SamplingProfiler()
+
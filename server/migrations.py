@@ -0,0 +1,223 @@
+"""数据库迁移
+
+按版本号顺序执行，已执行的版本记录在 schema_migrations 表中。服务启动
+和 init_db.py 都会调用 run_migrations()，不再在导入时 create_all。
+新增迁移时在 MIGRATIONS 末尾追加，不要修改已发布的迁移。全部迁移执行
+后的表结构应与 models 一致 (tests/test_migrations.py 会检查)。
+"""
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import (Boolean, Column, Date, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+                        UniqueConstraint, bindparam, delete, inspect, insert, select, text, update)
+
+from database import engine as default_engine, process_lock
+import pinyin
+
+logger = logging.getLogger(__name__)
+
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String),
+    Column("applied_at", DateTime, default=datetime.now),
+)
+
+# 每个迁移使用自己的表结构快照，不引用 models: 模型以后的修改不能改变
+# 已发布迁移的行为。外键引用的表只需要定义被引用的列。
+
+
+def users_stub(metadata):
+    return Table("users", metadata, Column("id", Integer, primary_key=True))
+
+
+def add_column(conn, table_name, column):
+    """补充缺失的列 (列定义为迁移时的快照)"""
+    if column.name in {c["name"] for c in inspect(conn).get_columns(table_name)}:
+        return
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}"))
+
+
+def create_index(conn, name, table_name, *columns, unique=False):
+    metadata = MetaData()
+    table = Table(table_name, metadata, *(Column(c) for c in columns))
+    Index(name, *(table.c[c] for c in columns), unique=unique).create(bind=conn, checkfirst=True)
+
+
+def create_initial_schema(conn):
+    """初始版本的表结构，已有数据库中表已存在时会被跳过"""
+    metadata = MetaData()
+    Table("users", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("username", String, unique=True, index=True),
+          Column("hashed_password", String),
+          Column("is_active", Boolean),
+          Column("is_superuser", Boolean))
+    Table("configs", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("user_id", Integer, ForeignKey("users.id")),
+          Column("link_id", Integer),
+          Column("keywords", Text))
+    Table("logs", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("user_id", Integer, ForeignKey("users.id")),
+          Column("timestamp", DateTime),
+          Column("type", String),
+          Column("message", String),
+          Column("details", Text, nullable=True))
+    Table("audits", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("user_id", Integer, ForeignKey("users.id")),
+          Column("timestamp", DateTime),
+          Column("action", String),
+          Column("details", String),
+          Column("ip_address", String))
+    Table("alarm_configs", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("user_id", Integer, ForeignKey("users.id"), unique=True),
+          Column("no_recognition_threshold", Integer),
+          Column("email_notification", Boolean),
+          Column("email_address", String, nullable=True))
+    metadata.create_all(bind=conn)
+
+
+def create_query_indexes(conn):
+    create_index(conn, "ix_logs_user_timestamp", "logs", "user_id", "timestamp")
+    create_index(conn, "ix_logs_user_type_timestamp", "logs", "user_id", "type", "timestamp")
+    create_index(conn, "ix_audits_user_timestamp", "audits", "user_id", "timestamp")
+
+
+def create_trigger_rollups(conn):
+    add_column(conn, "logs", Column("link_id", Integer, nullable=True))
+    metadata = MetaData()
+    users_stub(metadata)
+    Table("trigger_rollups", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("user_id", Integer, ForeignKey("users.id")),
+          Column("day", Date),
+          Column("hour", Integer),
+          Column("link_id", Integer),
+          Column("count", Integer),
+          UniqueConstraint("user_id", "day", "hour", "link_id", name="uq_trigger_rollups_cell")
+          ).create(bind=conn, checkfirst=True)
+
+
+def create_keywords_table(conn):
+    """把 configs.keywords 中的 JSON 拆分到 keywords 表，同一用户重复的链接行合并为一行"""
+    add_column(conn, "configs", Column("position", Integer))
+    metadata = MetaData()
+    users_stub(metadata)
+    configs = Table("configs", metadata,
+                    Column("id", Integer, primary_key=True),
+                    Column("user_id", Integer),
+                    Column("link_id", Integer),
+                    Column("keywords", Text),
+                    Column("position", Integer))
+    keywords_table = Table(
+        "keywords", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("user_id", Integer, ForeignKey("users.id")),
+        Column("link_id", Integer),
+        Column("keyword", String),
+        Column("position", Integer),
+        UniqueConstraint("user_id", "link_id", "keyword", name="uq_keywords_user_link_keyword"),
+        Index("ix_keywords_user_keyword", "user_id", "keyword"),
+        Index("ix_keywords_keyword", "keyword"),
+    )
+    keywords_table.create(bind=conn, checkfirst=True)
+
+    rows = conn.execute(select(configs.c.id, configs.c.user_id, configs.c.link_id, configs.c.keywords)
+                        .order_by(configs.c.user_id, configs.c.id)).all()
+    by_user = defaultdict(list)
+    for row in rows:
+        by_user[row.user_id].append(row)
+
+    merged, positions, keywords = [], [], []
+    for user_id, user_rows in by_user.items():
+        # 重复的链接合并到第一次出现的行，链接内重复的关键词只保留一个
+        first_row, links = {}, {}
+        for row in user_rows:
+            if row.link_id in first_row:
+                merged.append(row.id)
+            else:
+                first_row[row.link_id] = row.id
+            bucket = links.setdefault(row.link_id, [])
+            for keyword in json.loads(row.keywords or "[]"):
+                if keyword not in bucket:
+                    bucket.append(keyword)
+        for position, (link_id, link_keywords) in enumerate(links.items()):
+            positions.append({"row_id": first_row[link_id], "link_position": position})
+            keywords.extend({"user_id": user_id, "link_id": link_id, "keyword": keyword, "position": i}
+                            for i, keyword in enumerate(link_keywords))
+
+    if merged:
+        conn.execute(delete(configs).where(configs.c.id.in_(merged)))
+    if positions:
+        conn.execute(update(configs).where(configs.c.id == bindparam("row_id"))
+                     .values(position=bindparam("link_position")), positions)
+    if keywords:
+        conn.execute(insert(keywords_table), keywords)
+    logger.info(f"Migrated {len(keywords)} keywords from {len(rows)} config rows")
+
+
+def add_pinyin_match(conn):
+    """链接的拼音匹配开关，并为已有关键词转换拼音 (未安装 pypinyin 时留空，加载时再转换)"""
+    add_column(conn, "configs", Column("pinyin_match", Boolean))
+    add_column(conn, "keywords", Column("pinyin", String, nullable=True))
+    if not pinyin.available:
+        return
+    keywords = Table("keywords", MetaData(),
+                     Column("id", Integer, primary_key=True),
+                     Column("keyword", String),
+                     Column("pinyin", String))
+    rows = conn.execute(select(keywords.c.id, keywords.c.keyword).where(keywords.c.pinyin.is_(None))).all()
+    if rows:
+        conn.execute(update(keywords).where(keywords.c.id == bindparam("row_id"))
+                     .values(pinyin=bindparam("syllables")),
+                     [{"row_id": row.id, "syllables": pinyin.keyword_pinyin(row.keyword)} for row in rows])
+
+
+MIGRATIONS = [
+    (1, "initial schema", create_initial_schema),
+    (2, "composite indexes for logs and audits", create_query_indexes),
+    (3, "trigger rollups and logs.link_id", create_trigger_rollups),
+    (4, "normalized keywords table", create_keywords_table),
+    (5, "pinyin match mode", add_pinyin_match),
+]
+
+
+def run_migrations(engine=None):
+    """执行所有未执行的迁移，返回本次执行的版本号列表
+
+    多个 worker 同时启动时持文件锁依次执行，后拿到锁的发现已全部执行过。
+    多台机器共用一个数据库时应在启动 worker 之前单独执行 `python migrations.py`。
+    """
+    with process_lock("migrations"):
+        return _run_migrations(engine or default_engine)
+
+
+def _run_migrations(engine):
+    applied_now = []
+    with engine.begin() as conn:
+        migration_metadata.create_all(bind=conn)
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        # 每个迁移单独一个事务
+        with engine.begin() as conn:
+            logger.info(f"Applying migration {version}: {name}")
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(version=version, name=name))
+        applied_now.append(version)
+    return applied_now
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Applied migrations: {run_migrations() or 'none'}")
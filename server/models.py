@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text
+from sqlalchemy import Boolean, Column, Date, ForeignKey, Index, Integer, String, DateTime, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -13,6 +13,7 @@ class User(Base):
     is_superuser = Column(Boolean, default=False)
 
     configs = relationship("Config", back_populates="owner")
+    keywords = relationship("Keyword", back_populates="owner")
     alarm_config = relationship("AlarmConfig", uselist=False, back_populates="owner")
     logs = relationship("Log", back_populates="owner")
     audits = relationship("Audit", back_populates="owner")
@@ -23,10 +24,32 @@ class Config(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     link_id = Column(Integer)
-    keywords = Column(Text) # JSON string: ["keyword1", "keyword2"]
+    keywords = Column(Text) # 旧版的 JSON 字符串，迁移 4 起关键词保存在 keywords 表，不再写入
+    position = Column(Integer, default=0) # 链接在配置中的顺序，决定匹配优先级
+    pinyin_match = Column(Boolean, default=False) # 该链接的关键词按拼音匹配
 
     owner = relationship("User", back_populates="configs")
 
+class Keyword(Base):
+    __tablename__ = "keywords"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    link_id = Column(Integer)
+    keyword = Column(String)
+    position = Column(Integer, default=0) # 链接内的顺序
+    pinyin = Column(String, nullable=True) # 保存时转换的不带声调拼音，空格分隔
+
+    owner = relationship("User", back_populates="keywords")
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "link_id", "keyword", name="uq_keywords_user_link_keyword"),
+        # 冲突检测: 同一用户下按关键词分组
+        Index("ix_keywords_user_keyword", "user_id", "keyword"),
+        # 跨用户查找关键词的所有者
+        Index("ix_keywords_keyword", "keyword"),
+    )
+
 class Log(Base):
     __tablename__ = "logs"
 
@@ -36,9 +59,17 @@ class Log(Base):
     type = Column(String) # info, success, warning, error
     message = Column(String)
     details = Column(Text, nullable=True)
+    link_id = Column(Integer, nullable=True) # 触发日志对应的链接
 
     owner = relationship("User", back_populates="logs")
 
+    __table_args__ = (
+        # 历史日志按用户倒序分页
+        Index("ix_logs_user_timestamp", "user_id", "timestamp"),
+        # 今日触发统计
+        Index("ix_logs_user_type_timestamp", "user_id", "type", "timestamp"),
+    )
+
 class Audit(Base):
     __tablename__ = "audits"
 
@@ -51,6 +82,10 @@ class Audit(Base):
 
     owner = relationship("User", back_populates="audits")
 
+    __table_args__ = (
+        Index("ix_audits_user_timestamp", "user_id", "timestamp"),
+    )
+
 class AlarmConfig(Base):
     __tablename__ = "alarm_configs"
 
@@ -61,3 +96,17 @@ class AlarmConfig(Base):
     email_address = Column(String, nullable=True)
 
     owner = relationship("User", back_populates="alarm_config")
+
+class TriggerRollup(Base):
+    __tablename__ = "trigger_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    day = Column(Date)
+    hour = Column(Integer)
+    link_id = Column(Integer) # 0 表示未记录链接的旧日志
+    count = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", "hour", "link_id", name="uq_trigger_rollups_cell"),
+    )
@@ -0,0 +1,93 @@
+"""密码哈希的独立进程池
+
+bcrypt 每次计算需要几十到几百毫秒 CPU。放在事件循环或数据库线程里，
+上班时集中登录会拖慢所有插件的音频转发。这里交给单独的进程池计算，
+工作进程以较低优先级运行，排队的任务数有上限，超过时直接返回 503。
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+# 工作进程数，0 表示在调用方直接计算 (不推荐，仅用于对比测试)
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# 正在计算和排队的哈希任务上限
+PASSWORD_MAX_PENDING = int(os.environ.get("PASSWORD_MAX_PENDING", 64))
+# 工作进程的 nice 值，让音频转发优先获得 CPU
+PASSWORD_NICE = int(os.environ.get("PASSWORD_NICE", 10))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+
+def _init_worker(niceness: int):
+    try:
+        os.nice(niceness)
+    except OSError:
+        pass
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_WORKERS, max_pending: int = PASSWORD_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """启动时调用，在其他后台线程启动之前 fork 出全部工作进程
+
+        不用 spawn: 它会在每个工作进程里重新导入 main.py (整个应用)。
+        """
+        if self.workers and self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_worker,
+                initargs=(PASSWORD_NICE,),
+            )
+            # fork 模式下首次提交任务时一次性创建所有工作进程
+            self._executor.submit(os.getpid)
+            logger.info(f"Password hasher started with {self.workers} worker processes")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+        if not self.workers:
+            return fn(*args)
+        self.start()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,69 @@
+"""拼音匹配用的逐字转换
+
+识别结果常把商品关键词转写成同音不同字 (如 "保温杯" -> "保温悲")。开启
+拼音匹配的链接，其关键词在保存配置时转换为不带声调的拼音音节序列，
+编译进按音节匹配的自动机；识别结果同样逐字转换一次后扫描。
+
+转换按字进行，一个字对应一个音节 (多音字取默认读音)，原文与音节序列
+的下标一一对应，命中位置可以直接换算回原文。非汉字转为小写，空白转为
+"_"，音节中不含空格，可以用空格拼接后存储。每个字的转换结果缓存在内存
+中，常用字很快全部命中缓存。
+
+pypinyin 为可选依赖，未安装时每个字按自身处理，拼音匹配退化为精确匹配。
+"""
+import logging
+import os
+from typing import Dict, List, Tuple
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # pragma: no cover - 可选依赖
+    lazy_pinyin = None
+
+logger = logging.getLogger(__name__)
+
+# 缓存的字数上限，超出后新字不再缓存 (常用汉字只有几千个)
+PINYIN_CACHE_MAX = int(os.environ.get("PINYIN_CACHE_MAX", 65536))
+
+available = lazy_pinyin is not None
+if not available:
+    logger.warning("pypinyin not installed, pinyin matching falls back to exact matching")
+
+_cache: Dict[str, str] = {}
+
+
+def _convert(ch: str) -> str:
+    if ch.isspace():
+        return "_"
+    if lazy_pinyin is not None:
+        syllable = lazy_pinyin(ch, style=Style.NORMAL)[0]
+        if syllable != ch:
+            return syllable
+    return ch.lower()
+
+
+def char_syllable(ch: str) -> str:
+    syllable = _cache.get(ch)
+    if syllable is None:
+        syllable = _convert(ch)
+        if len(_cache) < PINYIN_CACHE_MAX:
+            _cache[ch] = syllable
+    return syllable
+
+
+def to_syllables(text: str) -> List[str]:
+    """逐字转换为音节列表，长度与 text 相同"""
+    try:
+        # 常见情况下所有字都已缓存，map 比逐字判断快
+        return list(map(_cache.__getitem__, text))
+    except KeyError:
+        return [char_syllable(ch) for ch in text]
+
+
+def keyword_pinyin(keyword: str) -> str:
+    """保存到 keywords.pinyin 的形式: 空格分隔的音节"""
+    return " ".join(to_syllables(keyword))
+
+
+def parse_pinyin(value: str) -> Tuple[str, ...]:
+    return tuple(value.split(" "))
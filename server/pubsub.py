@@ -0,0 +1,498 @@
+"""管理端日志的发布/订阅后端和在线统计
+
+ConnectionManager 把合并好的日志批次交给后端发布，后端再把批次交回
+订阅了该用户的 worker，由它序列化并推给本地的管理端连接。每个 worker
+上报自己持有的插件和管理端连接数，后端汇总出每个用户的在线数。
+
+各 worker 的关键词、告警配置和用户缓存是进程内的，某个 worker 修改后
+通过 notify(kind, user_id) 通知其他 worker 失效或重新加载。与 broker
+断开期间可能漏掉通知，重连后收到一次 RESYNC，应丢弃全部缓存。
+
+PUBSUB_BACKEND:
+    local  单进程 (默认)，直接回调，没有额外开销
+    unix   多个 worker 通过本机 Unix socket 上的 broker 转发。第一个启动的
+           worker 持有文件锁并在进程内运行 broker，它退出后由其他 worker
+           接替；也可以用 `python pubsub.py` 单独运行 broker
+    redis  多机部署，使用 Redis pub/sub (需要安装 redis)
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import socket
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_BACKEND = os.environ.get("PUBSUB_BACKEND", "local")
+PUBSUB_SOCKET = os.environ.get("PUBSUB_SOCKET", "/tmp/live-assistant-pubsub.sock")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.environ.get("REDIS_PREFIX", "live-assistant")
+# 发往 broker 的数据积压超过该字节数时丢弃新的日志批次
+PUBSUB_MAX_BUFFER = int(os.environ.get("PUBSUB_MAX_BUFFER", 4 * 1024 * 1024))
+
+# 单行消息的最大长度
+LINE_LIMIT = 16 * 1024 * 1024
+
+Deliver = Callable[[int, List[dict]], None]
+# (kind, user_id): 其他 worker 修改了该用户的某类数据
+Notify = Callable[[str, int], None]
+
+RESYNC = "resync"
+
+
+class Presence(NamedTuple):
+    plugins: int
+    admins: int
+
+
+NOBODY = Presence(0, 0)
+
+
+def _dumps(message: dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+class LocalBackend:
+    """单进程后端: 发布直接回调本进程的订阅者"""
+
+    def __init__(self):
+        self.dropped = 0
+        self._deliver: Optional[Deliver] = None
+        self._subscribed: Set[int] = set()
+        self._presence: Dict[int, Presence] = {}
+
+    async def start(self, deliver: Deliver, notify: Optional[Notify] = None):
+        self._deliver = deliver
+
+    async def close(self):
+        pass
+
+    def notify(self, kind: str, user_id: int):
+        # 只有一个进程，没有需要通知的 worker
+        pass
+
+    def subscribe(self, user_id: int):
+        self._subscribed.add(user_id)
+
+    def unsubscribe(self, user_id: int):
+        self._subscribed.discard(user_id)
+
+    def publish(self, user_id: int, batch: List[dict]):
+        if user_id in self._subscribed:
+            self._deliver(user_id, batch)
+
+    def set_presence(self, user_id: int, plugins: int, admins: int):
+        if plugins or admins:
+            self._presence[user_id] = Presence(plugins, admins)
+        else:
+            self._presence.pop(user_id, None)
+
+    def presence(self, user_id: int) -> Presence:
+        return self._presence.get(user_id, NOBODY)
+
+
+class Broker:
+    """按用户转发日志批次、汇总在线数的 broker (换行分隔的 JSON 协议)
+
+    客户端发送:
+        {"op": "sub" | "unsub", "user": 1}
+        {"op": "pub", "user": 1, "batch": [...]}
+        {"op": "presence", "user": 1, "plugins": 2, "admins": 1}  (该客户端的绝对数)
+        {"op": "event", "user": 1, "kind": "config"}
+    broker 把 pub 原样转发给订阅了该用户的客户端，event 转发给除发送者
+    以外的所有客户端，在线数变化时向所有客户端推送汇总后的 presence。
+    客户端断开后它上报的在线数随之清除。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._server = None
+        self._clients: Dict[asyncio.StreamWriter, Tuple[Set[int], Dict[int, Presence]]] = {}
+
+    async def start(self):
+        if os.path.exists(self.path):
+            # 持有锁的前一个 broker 已退出，socket 文件是残留的
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, self.path, limit=LINE_LIMIT)
+        logger.info(f"Pub/sub broker listening on {self.path}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for writer in list(self._clients):
+            writer.close()
+
+    def _total(self, user_id: int) -> Presence:
+        plugins = admins = 0
+        for _, presence in self._clients.values():
+            p = presence.get(user_id, NOBODY)
+            plugins += p.plugins
+            admins += p.admins
+        return Presence(plugins, admins)
+
+    def _broadcast_presence(self, user_id: int):
+        total = self._total(user_id)
+        line = _dumps({"op": "presence", "user": user_id, "plugins": total.plugins, "admins": total.admins})
+        for writer in self._clients:
+            writer.write(line)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscribed: Set[int] = set()
+        presence: Dict[int, Presence] = {}
+        # 新客户端先收到当前全部在线数
+        users = {u for _, p in self._clients.values() for u in p}
+        for user_id in users:
+            total = self._total(user_id)
+            writer.write(_dumps({"op": "presence", "user": user_id,
+                                 "plugins": total.plugins, "admins": total.admins}))
+        self._clients[writer] = (subscribed, presence)
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                op, user_id = message["op"], message["user"]
+                if op == "pub":
+                    for other, (subs, _) in self._clients.items():
+                        if user_id in subs:
+                            other.write(line)
+                elif op == "event":
+                    for other in self._clients:
+                        if other is not writer:
+                            other.write(line)
+                elif op == "sub":
+                    subscribed.add(user_id)
+                elif op == "unsub":
+                    subscribed.discard(user_id)
+                elif op == "presence":
+                    presence[user_id] = Presence(message["plugins"], message["admins"])
+                    self._broadcast_presence(user_id)
+        except (ConnectionError, ValueError, KeyError) as e:
+            logger.warning(f"Pub/sub client dropped: {e}")
+        finally:
+            del self._clients[writer]
+            writer.close()
+            for user_id in presence:
+                self._broadcast_presence(user_id)
+
+
+class UnixSocketBackend:
+    """通过本机 Unix socket broker 在多个 worker 之间转发
+
+    断线期间发布的日志直接丢弃 (计入 dropped)，订阅和在线数在重连后
+    按当前状态重新上报，期间的 notify 在重连后补发。
+    """
+
+    def __init__(self, path: str = PUBSUB_SOCKET, max_buffer: int = PUBSUB_MAX_BUFFER):
+        self.path = path
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._deliver: Optional[Deliver] = None
+        self._notify: Optional[Notify] = None
+        self._subscribed: Set[int] = set()
+        self._local: Dict[int, Presence] = {}
+        self._presence: Dict[int, Presence] = {}
+        # 断线期间的通知，同一用户的同类通知只保留一条
+        self._pending: Dict[Tuple[str, int], None] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._broker: Optional[Broker] = None
+        self._lock_fd: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver, notify: Optional[Notify] = None):
+        self._deliver = deliver
+        self._notify = notify
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._broker is not None:
+            await self._broker.close()
+            self._broker = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def subscribe(self, user_id: int):
+        self._subscribed.add(user_id)
+        self._send({"op": "sub", "user": user_id})
+
+    def unsubscribe(self, user_id: int):
+        self._subscribed.discard(user_id)
+        self._send({"op": "unsub", "user": user_id})
+
+    def publish(self, user_id: int, batch: List[dict]):
+        writer = self._writer
+        if writer is None or writer.transport.get_write_buffer_size() > self.max_buffer:
+            self.dropped += 1
+            return
+        writer.write(_dumps({"op": "pub", "user": user_id, "batch": batch}))
+
+    def notify(self, kind: str, user_id: int):
+        if self._writer is None:
+            self._pending[(kind, user_id)] = None
+            return
+        self._send({"op": "event", "user": user_id, "kind": kind})
+
+    def set_presence(self, user_id: int, plugins: int, admins: int):
+        if plugins or admins:
+            self._local[user_id] = Presence(plugins, admins)
+        else:
+            self._local.pop(user_id, None)
+        self._send({"op": "presence", "user": user_id, "plugins": plugins, "admins": admins})
+
+    def presence(self, user_id: int) -> Presence:
+        if self._writer is None:
+            # 与 broker 断开时至少反映本 worker 的连接
+            return self._local.get(user_id, NOBODY)
+        return self._presence.get(user_id, NOBODY)
+
+    def _send(self, message: dict):
+        if self._writer is not None:
+            self._writer.write(_dumps(message))
+
+    def _try_host_broker(self) -> bool:
+        """拿到文件锁的 worker 负责运行 broker，进程退出时锁自动释放"""
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _run(self):
+        attempt = 0
+        connected = False
+        while True:
+            try:
+                if self._broker is None and self._try_host_broker():
+                    broker = Broker(self.path)
+                    await broker.start()
+                    self._broker = broker
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+            except OSError as e:
+                # broker 正在切换，稍后重试
+                attempt += 1
+                logger.debug(f"Pub/sub broker unavailable: {e}")
+                await asyncio.sleep(min(0.1 * attempt, 2))
+                continue
+            attempt = 0
+            self._presence = {}
+            self._writer = writer
+            for user_id in self._subscribed:
+                self._send({"op": "sub", "user": user_id})
+            for user_id, p in self._local.items():
+                self._send({"op": "presence", "user": user_id, "plugins": p.plugins, "admins": p.admins})
+            pending, self._pending = self._pending, {}
+            for kind, user_id in pending:
+                self._send({"op": "event", "user": user_id, "kind": kind})
+            if connected and self._notify is not None:
+                # 断线期间其他 worker 的通知已经丢失
+                self._notify(RESYNC, 0)
+            connected = True
+            try:
+                await self._read(reader)
+            except (ConnectionError, ValueError) as e:
+                logger.warning(f"Pub/sub connection lost: {e}")
+            finally:
+                self._writer = None
+                writer.close()
+            logger.info("Reconnecting to pub/sub broker")
+
+    async def _read(self, reader: asyncio.StreamReader):
+        async for line in reader:
+            message = json.loads(line)
+            user_id = message["user"]
+            if message["op"] == "pub":
+                if user_id in self._subscribed:
+                    self._deliver(user_id, message["batch"])
+            elif message["op"] == "presence":
+                self._presence[user_id] = Presence(message["plugins"], message["admins"])
+            elif message["op"] == "event":
+                if self._notify is not None:
+                    self._notify(message["kind"], user_id)
+
+
+class RedisBackend:
+    """多机部署: 日志走 Redis pub/sub，在线数存在每个用户的 hash 中
+
+    hash 的字段是 worker 标识，值为该 worker 的连接数；worker 通过带过期
+    时间的心跳键表明存活，汇总时忽略心跳已过期的 worker。notify 发布到
+    events 频道，带上 worker 标识，收到自己发出的通知时忽略。
+    """
+
+    HEARTBEAT_SECONDS = 10
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_PREFIX):
+        self.url = url
+        self.prefix = prefix
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.dropped = 0
+        self._deliver: Optional[Deliver] = None
+        self._notify: Optional[Notify] = None
+        self._redis = None
+        self._pubsub = None
+        self._subscribed: Set[int] = set()
+        self._local: Dict[int, Presence] = {}
+        self._presence: Dict[int, Presence] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def _channel(self, user_id: int) -> str:
+        return f"{self.prefix}:logs:{user_id}"
+
+    async def start(self, deliver: Deliver, notify: Optional[Notify] = None):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("PUBSUB_BACKEND=redis requires the redis package (pip install redis)")
+        self._deliver = deliver
+        self._notify = notify
+        self._redis = aioredis.from_url(self.url)
+        self._pubsub = self._redis.pubsub()
+        await self._heartbeat_once()
+        await self._pubsub.subscribe(f"{self.prefix}:presence", f"{self.prefix}:events")
+        # 订阅之后再读取已有的在线数，之后的变化由 presence 频道通知
+        await self._load_presence()
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._heartbeat())]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._redis is not None:
+            for user_id in list(self._local):
+                await self._write_presence(user_id, Presence(0, 0))
+            await self._redis.delete(f"{self.prefix}:worker:{self.worker_id}")
+            await self._pubsub.close()
+            await self._redis.close()
+
+    def subscribe(self, user_id: int):
+        self._subscribed.add(user_id)
+        self._spawn(self._pubsub.subscribe(self._channel(user_id)))
+
+    def unsubscribe(self, user_id: int):
+        self._subscribed.discard(user_id)
+        self._spawn(self._pubsub.unsubscribe(self._channel(user_id)))
+
+    def publish(self, user_id: int, batch: List[dict]):
+        self._spawn(self._redis.publish(self._channel(user_id), json.dumps(batch, ensure_ascii=False)))
+
+    def notify(self, kind: str, user_id: int):
+        message = json.dumps({"kind": kind, "user": user_id, "worker": self.worker_id})
+        self._spawn(self._redis.publish(f"{self.prefix}:events", message))
+
+    def set_presence(self, user_id: int, plugins: int, admins: int):
+        presence = Presence(plugins, admins)
+        if plugins or admins:
+            self._local[user_id] = presence
+        else:
+            self._local.pop(user_id, None)
+        self._spawn(self._write_presence(user_id, presence))
+
+    def presence(self, user_id: int) -> Presence:
+        return self._presence.get(user_id, self._local.get(user_id, NOBODY))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        task.add_done_callback(self._log_failure)
+
+    def _log_failure(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.dropped += 1
+            logger.warning(f"Redis pub/sub operation failed: {task.exception()}")
+
+    async def _write_presence(self, user_id: int, presence: Presence):
+        key = f"{self.prefix}:presence:{user_id}"
+        if presence.plugins or presence.admins:
+            await self._redis.hset(key, self.worker_id, f"{presence.plugins},{presence.admins}")
+        else:
+            await self._redis.hdel(key, self.worker_id)
+        await self._redis.publish(f"{self.prefix}:presence", str(user_id))
+
+    async def _refresh_presence(self, user_id: int):
+        fields = await self._redis.hgetall(f"{self.prefix}:presence:{user_id}")
+        workers = list(fields)
+        alive = await self._redis.mget([f"{self.prefix}:worker:{w.decode()}" for w in workers]) if workers else []
+        plugins = admins = 0
+        for worker, value, beat in zip(workers, fields.values(), alive):
+            if beat is None:
+                continue
+            p, a = value.decode().split(",")
+            plugins += int(p)
+            admins += int(a)
+        self._presence[user_id] = Presence(plugins, admins)
+
+    async def _load_presence(self):
+        prefix = f"{self.prefix}:presence:"
+        async for key in self._redis.scan_iter(match=prefix + "*"):
+            user_id = key.decode()[len(prefix):]
+            if user_id.isdigit():
+                await self._refresh_presence(int(user_id))
+
+    async def _listen(self):
+        presence_channel = f"{self.prefix}:presence".encode()
+        events_channel = f"{self.prefix}:events".encode()
+        async for message in self._pubsub.listen():
+            if message["type"] != "message":
+                continue
+            try:
+                if message["channel"] == presence_channel:
+                    await self._refresh_presence(int(message["data"]))
+                elif message["channel"] == events_channel:
+                    event = json.loads(message["data"])
+                    if event["worker"] != self.worker_id and self._notify is not None:
+                        self._notify(event["kind"], event["user"])
+                else:
+                    user_id = int(message["channel"].rsplit(b":", 1)[1])
+                    if user_id in self._subscribed:
+                        self._deliver(user_id, json.loads(message["data"]))
+            except Exception as e:
+                logger.warning(f"Bad pub/sub message: {e}")
+
+    async def _heartbeat_once(self):
+        await self._redis.set(f"{self.prefix}:worker:{self.worker_id}", int(time.time()),
+                              ex=self.HEARTBEAT_SECONDS * 3)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.HEARTBEAT_SECONDS)
+            try:
+                await self._heartbeat_once()
+                # 定期重算，清除已退出 worker 留下的在线数
+                for user_id in list(self._presence):
+                    await self._refresh_presence(user_id)
+            except Exception as e:
+                logger.warning(f"Redis heartbeat failed: {e}")
+
+
+def create_backend(name: str = PUBSUB_BACKEND):
+    if name == "local":
+        return LocalBackend()
+    if name == "unix":
+        return UnixSocketBackend()
+    if name == "redis":
+        return RedisBackend()
+    raise ValueError(f"Unknown PUBSUB_BACKEND: {name}")
+
+
+async def _serve_broker(path: str):
+    fd = os.open(path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+    fcntl.flock(fd, fcntl.LOCK_EX)  # 等待进程内 broker 的 worker 让出
+    broker = Broker(path)
+    await broker.start()
+    await asyncio.Future()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve_broker(PUBSUB_SOCKET))
@@ -0,0 +1,109 @@
+"""按 key 的令牌桶限流
+
+/api/token 以来源 IP 为主限流，每次尝试消耗一个令牌。另按用户名限制
+猜测同一个账号的失败次数 (不论来自多少个 IP)，只在密码错误时扣减。
+用户名的桶耗尽后，只有曾经用该账号登录成功过的来源 (IP) 还能继续尝试，
+其他人无法靠错误密码把已知账号的主人锁在外面。请求被任一个桶拒绝时
+不消耗另一个桶的令牌。
+"""
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Tuple
+
+# 每个来源 IP: 每秒补充的令牌数和桶容量 (同一出口 IP 后可能有多名主播同时登录)
+LOGIN_IP_RATE = float(os.environ.get("LOGIN_IP_RATE", 1))
+LOGIN_IP_BURST = float(os.environ.get("LOGIN_IP_BURST", 20))
+# 每个用户名的失败次数
+LOGIN_USER_RATE = float(os.environ.get("LOGIN_USER_RATE", 0.2))
+LOGIN_USER_BURST = float(os.environ.get("LOGIN_USER_BURST", 5))
+
+
+class RateLimiter:
+    """每个 key 一个令牌桶，最多跟踪 max_keys 个 key (LRU 淘汰，淘汰后视为满桶)"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self.limited = 0
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, updated_at]
+
+    def acquire(self, key: str) -> float:
+        """消耗一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        retry_after = self.check(key)
+        if retry_after:
+            self.limited += 1
+        else:
+            self._take(key)
+        return retry_after
+
+    def check(self, key: str) -> float:
+        """不消耗令牌，返回需要等待的秒数 (0 表示有令牌)"""
+        bucket = self._refill(key)
+        if bucket[0] >= 1:
+            return 0.0
+        return (1 - bucket[0]) / self.rate if self.rate > 0 else math.inf
+
+    def charge(self, key: str):
+        """事后扣减一个令牌 (并发的请求可能已经把桶用完，最多扣到 0)"""
+        bucket = self._refill(key)
+        bucket[0] = max(0.0, bucket[0] - 1)
+
+    def _take(self, key: str):
+        self._buckets[key][0] -= 1
+
+    def _refill(self, key: str) -> list:
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+
+class LoginLimiter:
+    """/api/token 的限流: 先 check()，认证后调用 failed() 或 succeeded()"""
+
+    def __init__(self, ip_limiter: RateLimiter, user_limiter: RateLimiter, max_trusted: int = 10000):
+        self.ip_limiter = ip_limiter
+        self.user_limiter = user_limiter
+        self.max_trusted = max_trusted
+        # 登录成功过的 (用户名, IP)，不受该用户名失败次数的限制
+        self._trusted: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+
+    def check(self, client_ip: str, username: str) -> float:
+        """允许尝试时消耗一个 IP 令牌并返回 0，否则返回需要等待的秒数 (不消耗)"""
+        ip_wait = self.ip_limiter.check(client_ip)
+        user_wait = 0.0 if (username, client_ip) in self._trusted else self.user_limiter.check(username)
+        if ip_wait or user_wait:
+            if ip_wait:
+                self.ip_limiter.limited += 1
+            if user_wait:
+                self.user_limiter.limited += 1
+            return max(ip_wait, user_wait)
+        self.ip_limiter._take(client_ip)
+        return 0.0
+
+    def failed(self, client_ip: str, username: str):
+        self.user_limiter.charge(username)
+
+    def succeeded(self, client_ip: str, username: str):
+        key = (username, client_ip)
+        self._trusted[key] = None
+        self._trusted.move_to_end(key)
+        while len(self._trusted) > self.max_trusted:
+            self._trusted.popitem(last=False)
+
+
+login_ip_limiter = RateLimiter(LOGIN_IP_RATE, LOGIN_IP_BURST)
+login_user_limiter = RateLimiter(LOGIN_USER_RATE, LOGIN_USER_BURST)
+login_limiter = LoginLimiter(login_ip_limiter, login_user_limiter)
@@ -0,0 +1,299 @@
+"""日志保留: 汇总、归档和分批删除
+
+logs 和 audits 表只增不减，SQLite 单文件越来越大，查询和备份都随之变慢。
+后台任务定期把超过保留期的行移出数据库:
+
+1. 汇总: 删除 logs 之前，把这些行对应的 (用户, 日期, 小时, 链接) 触发次数
+   写入 trigger_rollups (与 TriggerStats 共用，按天求和即每日汇总)。已有
+   格子取较大值，重复执行不会重复计数。
+2. 归档: 原始行写成按日期分区的 gzip NDJSON
+   (<归档目录>/<表名>/<YYYY-MM-DD>/part-<首行 id>.ndjson.gz)，先落盘再删除，
+   可用 zgrep 或 `python retention.py search` 检索。
+3. 删除: 每批最多 RETENTION_BATCH_SIZE 行一个短事务，批次之间让出写锁。
+
+每次运行报告移动的行数、归档大小、数据库释放的字节数和累计持锁时间。
+保留天数按表配置，0 表示不清理该表。多个 worker 各自按周期调度，同一时间
+只有拿到文件锁 (database.process_lock) 的一个执行，其余跳过本次。
+
+用法 (在 server 目录下):
+    python retention.py run
+    python retention.py search logs --since 2025-01-01 --until 2025-01-31 [--user 3] [--type success] [--contains 苹果]
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from database import SQLALCHEMY_DATABASE_URL, is_sqlite, process_lock, run_db
+from models import Audit, Log
+from stats import Cell, log_cells, merge_rollups
+
+logger = logging.getLogger(__name__)
+
+# 各表的保留天数，0 表示不清理
+RETENTION_LOGS_DAYS = int(os.environ.get("RETENTION_LOGS_DAYS", 90))
+RETENTION_AUDITS_DAYS = int(os.environ.get("RETENTION_AUDITS_DAYS", 365))
+# 每个删除事务的行数和批次之间的停顿
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", 2000))
+RETENTION_PAUSE_MS = float(os.environ.get("RETENTION_PAUSE_MS", 50))
+RETENTION_INTERVAL_HOURS = float(os.environ.get("RETENTION_INTERVAL_HOURS", 24))
+# 启动后首次运行前的等待，避开启动时的连接高峰
+RETENTION_INITIAL_DELAY = float(os.environ.get("RETENTION_INITIAL_DELAY", 600))
+
+
+def default_archive_dir() -> str:
+    # SQLite 时放在数据库文件旁边 (Docker 中即挂载的 data 卷)
+    if is_sqlite:
+        path = SQLALCHEMY_DATABASE_URL.split(":///", 1)[-1]
+        if path and path != ":memory:":
+            return os.path.join(os.path.dirname(os.path.abspath(path)), "archive")
+    return os.path.abspath("archive")
+
+
+RETENTION_ARCHIVE_DIR = os.environ.get("RETENTION_ARCHIVE_DIR") or default_archive_dir()
+
+class TablePolicy(NamedTuple):
+    model: type
+    days: int
+    rollup: bool  # 删除前是否写入 trigger_rollups
+
+
+def default_policies() -> List[TablePolicy]:
+    return [TablePolicy(Log, RETENTION_LOGS_DAYS, True), TablePolicy(Audit, RETENTION_AUDITS_DAYS, False)]
+
+
+def db_used_bytes(db: Session) -> Optional[int]:
+    """SQLite 实际占用的页 (删除后页进入空闲列表，文件本身不缩小，新数据会复用)"""
+    if not is_sqlite:
+        return None
+    conn = db.connection()
+    page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+    page_count = conn.exec_driver_sql("PRAGMA page_count").scalar()
+    freelist = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    return (page_count - freelist) * page_size
+
+
+def archive_path(root: str, table: str, day: date, first_id: int) -> str:
+    return os.path.join(root, table, day.isoformat(), f"part-{first_id:012d}.ndjson.gz")
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class RetentionJob:
+    def __init__(self, policies: Optional[List[TablePolicy]] = None, archive_dir: str = RETENTION_ARCHIVE_DIR,
+                 batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_PAUSE_MS / 1000):
+        self.policies = policies if policies is not None else default_policies()
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.pause = pause
+        self.last_report: Optional[dict] = None
+        self.rows_deleted: Dict[str, int] = defaultdict(int)
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._manual: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run_once(self) -> Optional[dict]:
+        """执行一次；同一数据库的其他 worker 正在执行时跳过并返回 None"""
+        async with self._lock:
+            with process_lock("retention", blocking=False) as acquired:
+                if not acquired:
+                    logger.info("Retention run skipped: another worker is running it")
+                    return None
+                return await self._run_all()
+
+    async def _run_all(self) -> dict:
+        started = time.perf_counter()
+        report = {"started_at": datetime.now().isoformat(timespec="seconds"),
+                  "archive_dir": self.archive_dir, "tables": {}}
+        report["db_bytes_before"] = await run_db(db_used_bytes)
+        for policy in self.policies:
+            if policy.days > 0:
+                report["tables"][policy.model.__tablename__] = await self._run_table(policy)
+        report["db_bytes_after"] = await run_db(db_used_bytes)
+        if report["db_bytes_before"] is not None:
+            report["bytes_saved"] = report["db_bytes_before"] - report["db_bytes_after"]
+        report["duration_s"] = round(time.perf_counter() - started, 3)
+        self.last_report = report
+        moved = {name: t["rows_deleted"] for name, t in report["tables"].items()}
+        logger.info(f"Retention run finished: moved={moved} bytes_saved={report.get('bytes_saved')} "
+                    f"lock_ms={ {name: t['lock_ms'] for name, t in report['tables'].items()} } "
+                    f"duration={report['duration_s']}s")
+        return report
+
+    async def _run_table(self, policy: TablePolicy) -> dict:
+        # 以整天为界，归档分区里不会出现半天的数据
+        cutoff = datetime.combine(date.today() - timedelta(days=max(1, policy.days)), dtime.min)
+        stats = {"cutoff": cutoff.isoformat(), "rows_deleted": 0, "batches": 0, "rollup_cells": 0,
+                 "raw_bytes": 0, "archive_bytes": 0, "lock_ms": 0.0, "max_lock_ms": 0.0, "files": 0}
+        rolled: Set[Tuple[int, date]] = set()
+        while True:
+            moved = await run_db(self._move_batch, policy, cutoff, stats, rolled)
+            if moved < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+        stats["lock_ms"] = round(stats["lock_ms"], 1)
+        stats["max_lock_ms"] = round(stats["max_lock_ms"], 1)
+        self.rows_deleted[policy.model.__tablename__] += stats["rows_deleted"]
+        return stats
+
+    def _move_batch(self, db: Session, policy: TablePolicy, cutoff: datetime, stats: dict,
+                    rolled: Set[Tuple[int, date]]) -> int:
+        table = policy.model.__table__
+        rows = db.execute(
+            select(table).where(table.c.timestamp < cutoff).order_by(table.c.id).limit(self.batch_size)
+        ).mappings().all()
+        if not rows:
+            return 0
+
+        # 先完成所有读取和归档并结束读事务，写事务只包含删除和汇总写入
+        cells = self._rollup_cells(db, rows, rolled) if policy.rollup else {}
+        db.commit()
+        self._archive(table.name, rows, stats)
+
+        start = time.perf_counter()
+        # 写事务以写语句开头: SQLite 在 WAL 下把读事务升级为写事务时，若期间有
+        # 其他连接提交过 (如日志写入线程)，会直接返回 SQLITE_BUSY 而不等待
+        # 批内行按 id 连续取出，按 id 区间删除即可，不需要很长的 IN 列表
+        db.execute(delete(table).where(table.c.id >= rows[0]["id"], table.c.id <= rows[-1]["id"],
+                                       table.c.timestamp < cutoff))
+        # 实时计数可能已写入 (值更大时保留)，中断后重跑时 logs 可能只剩一部分
+        merge_rollups(db, cells)
+        db.commit()
+        lock_ms = (time.perf_counter() - start) * 1000
+
+        stats["rows_deleted"] += len(rows)
+        stats["batches"] += 1
+        stats["rollup_cells"] += len(cells)
+        stats["lock_ms"] += lock_ms
+        stats["max_lock_ms"] = max(stats["max_lock_ms"], lock_ms)
+        return len(rows)
+
+    def _rollup_cells(self, db: Session, rows, rolled: Set[Tuple[int, date]]) -> Dict[Cell, int]:
+        """按 (用户, 日期) 从 logs 统计整天的触发次数 (走 ix_logs_user_type_timestamp)
+
+        同一天的行可能分在多个批次，在该天的第一批删除之前统计一次。
+        """
+        cells: Dict[Cell, int] = {}
+        for user_id, day in {(row["user_id"], row["timestamp"].date()) for row in rows} - rolled:
+            cells.update(log_cells(db, day, user_id=user_id))
+            rolled.add((user_id, day))
+        return cells
+
+    def _archive(self, table: str, rows, stats: dict):
+        by_day: Dict[date, list] = defaultdict(list)
+        for row in rows:
+            by_day[row["timestamp"].date()].append(row)
+        for day, day_rows in by_day.items():
+            path = archive_path(self.archive_dir, table, day, day_rows[0]["id"])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            raw = "".join(json.dumps({k: _encode(v) for k, v in row.items()}, ensure_ascii=False) + "\n"
+                          for row in day_rows).encode("utf-8")
+            # 写临时文件并 fsync 后再改名，确认落盘之后才删除数据库中的行
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6, mtime=0) as gz:
+                    gz.write(raw)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            stats["raw_bytes"] += len(raw)
+            stats["archive_bytes"] += os.path.getsize(path)
+            stats["files"] += 1
+
+    def run_in_background(self):
+        """手动触发一次 (保存任务引用，避免被回收)"""
+        self._manual = asyncio.create_task(self.run_once())
+
+    def start(self, interval: float, initial_delay: float = RETENTION_INITIAL_DELAY):
+        if self._task is None and any(p.days > 0 for p in self.policies):
+            self._task = asyncio.create_task(self._run(interval, initial_delay))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, interval: float, initial_delay: float):
+        await asyncio.sleep(initial_delay)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Retention run failed: {e}")
+            await asyncio.sleep(interval)
+
+
+retention_job = RetentionJob()
+
+
+def search_archive(root: str, table: str, since: date, until: date, user_id: Optional[int] = None,
+                   type: Optional[str] = None, contains: Optional[str] = None) -> Iterator[dict]:
+    """按日期分区检索归档，since/until 均包含"""
+    table_dir = os.path.join(root, table)
+    if not os.path.isdir(table_dir):
+        return
+    for day_dir in sorted(os.listdir(table_dir)):
+        try:
+            day = date.fromisoformat(day_dir)
+        except ValueError:
+            continue
+        if not since <= day <= until:
+            continue
+        for name in sorted(os.listdir(os.path.join(table_dir, day_dir))):
+            if not name.endswith(".ndjson.gz"):
+                continue
+            with gzip.open(os.path.join(table_dir, day_dir, name), "rt", encoding="utf-8") as f:
+                for line in f:
+                    if contains and contains not in line:
+                        continue
+                    row = json.loads(line)
+                    if user_id is not None and row.get("user_id") != user_id:
+                        continue
+                    if type is not None and row.get("type") != type:
+                        continue
+                    yield row
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("run", help="立即执行一次保留任务")
+    search = sub.add_parser("search", help="检索归档")
+    search.add_argument("table", choices=["logs", "audits"])
+    search.add_argument("--since", type=date.fromisoformat, default=date.min)
+    search.add_argument("--until", type=date.fromisoformat, default=date.max)
+    search.add_argument("--user", type=int)
+    search.add_argument("--type")
+    search.add_argument("--contains")
+    search.add_argument("--archive-dir", default=RETENTION_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        logging.basicConfig(level=logging.INFO)
+        print(json.dumps(asyncio.run(retention_job.run_once()), indent=2, ensure_ascii=False))
+    else:
+        for row in search_archive(args.archive_dir, args.table, args.since, args.until, args.user, args.type,
+                                  args.contains):
+            sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
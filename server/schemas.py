@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 from datetime import datetime
 
 class Token(BaseModel):
@@ -16,11 +16,24 @@ class UserLogin(BaseModel):
 class ConfigUpdate(BaseModel):
     id: int
     keywords: List[str]
+    pinyin_match: bool = False # 按拼音匹配，同音字也能触发
 
 class LogQuery(BaseModel):
     limit: int = 100
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
+    cursor: Optional[str] = None # 上一页响应头 X-Next-Cursor 的值
+
+class AuditQuery(LogQuery):
+    limit: int = 50
+
+class AudioFormat(BaseModel):
+    # 插件连接 /ws/plugin 后可在第一个文本帧中声明，未声明时为 FunASR 原生格式
+    # 只接受标准采样率 (与 audio.SUPPORTED_SAMPLE_RATES 一致)，任意整数的重采样滤波器可能极大
+    sample_rate: Literal[8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000,
+                         88200, 96000, 176400, 192000] = 16000
+    channels: int = Field(1, ge=1, le=8)
+    sample_width: Literal[1, 2, 4] = 2 # 字节数: 1 为 8bit 无符号，2/4 为有符号 PCM
 
 class UserCreate(BaseModel):
     username: str
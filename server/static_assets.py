@@ -0,0 +1,243 @@
+"""前端静态资源 (client/dist) 的托管
+
+启动时遍历一次构建目录，为每个文件记录类型、大小、强 ETag (内容哈希)
+和预压缩变体 (同名 .br / .gz 文件)。请求时按 Accept-Encoding 选择变体，
+If-None-Match 命中时返回 304；Vite 生成的带哈希的 /assets 文件使用一年的
+immutable 缓存，其余文件 (包括 SPA 路由回退的 index.html) 每次协商。
+小文件 (包括 index.html) 连同压缩变体直接保存在内存里。
+
+预压缩在构建时完成 (见 Dockerfile):
+    python server/static_assets.py client/dist
+brotli 为可选依赖，未安装时只生成 gzip。
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 不小于该字节数的文本类文件才压缩
+STATIC_COMPRESS_MIN_SIZE = int(os.environ.get("STATIC_COMPRESS_MIN_SIZE", 1024))
+# 不大于该字节数的文件整个放在内存里
+STATIC_INLINE_MAX = int(os.environ.get("STATIC_INLINE_MAX", 64 * 1024))
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# 按优先级排列的内容编码及其文件后缀
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE_TYPES = {"application/javascript", "application/json", "application/manifest+json",
+                      "application/xml", "image/svg+xml", "font/ttf", "font/otf", "application/wasm"}
+
+mimetypes.add_type("application/javascript", ".js")
+mimetypes.add_type("application/javascript", ".mjs")
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+
+def is_compressible(path: str) -> bool:
+    media_type = mimetypes.guess_type(path)[0] or ""
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def find_static_dir() -> Optional[str]:
+    """STATIC_DIR 优先，其次是工作目录下的 client/dist (Docker)，最后是相对 server 目录的 ../client/dist"""
+    candidates = [os.environ.get("STATIC_DIR"), "client/dist",
+                  os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client", "dist")]
+    for candidate in candidates:
+        if candidate and os.path.isdir(candidate):
+            return os.path.abspath(candidate)
+    return None
+
+
+def accepted_encodings(header: str) -> List[str]:
+    """解析 Accept-Encoding，忽略 q=0 的编码"""
+    accepted = []
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.append(name.strip().lower())
+    return accepted
+
+
+class Variant:
+    """资源的一种编码表示: 内存中的内容或磁盘上的文件"""
+
+    __slots__ = ("encoding", "path", "stat", "body", "etag")
+
+    def __init__(self, encoding: Optional[str], path: str, stat: os.stat_result, digest: str,
+                 body: Optional[bytes] = None):
+        self.encoding = encoding
+        self.path = path
+        self.stat = stat
+        self.body = body
+        # 不同编码的字节不同，强 ETag 也要区分
+        self.etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+class Asset:
+    __slots__ = ("media_type", "cache_control", "variants")
+
+    def __init__(self, media_type: str, cache_control: str, variants: Dict[Optional[str], Variant]):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.variants = variants
+
+    def select(self, accept_encoding: str) -> Variant:
+        if len(self.variants) > 1:
+            accepted = accepted_encodings(accept_encoding)
+            for encoding, _ in ENCODINGS:
+                if encoding in self.variants and (encoding in accepted or "*" in accepted):
+                    return self.variants[encoding]
+        return self.variants[None]
+
+
+class StaticAssets:
+    def __init__(self, root: Optional[str]):
+        self.root = root
+        self._assets: Dict[str, Asset] = {}
+        self.index: Optional[Asset] = None
+
+    def load(self):
+        """遍历构建目录建立索引，只在启动时调用一次"""
+        self._assets = {}
+        self.index = None
+        if self.root is None:
+            logger.info("No client build found, static files disabled")
+            return
+        inline_bytes, missing = 0, 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith((".br", ".gz")) and name[:-3] in filenames:
+                    continue  # 预压缩变体，随原文件一起登记
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+                asset = self._index_file(rel, path)
+                self._assets[rel] = asset
+                if asset.variants[None].body is not None:
+                    inline_bytes += sum(len(v.body) for v in asset.variants.values())
+                if len(asset.variants) == 1 and is_compressible(path) and \
+                        asset.variants[None].stat.st_size >= STATIC_COMPRESS_MIN_SIZE:
+                    missing += 1
+        self.index = self._assets.get("index.html")
+        logger.info(f"Indexed {len(self._assets)} static files from {self.root} ({inline_bytes} bytes in memory)")
+        if missing:
+            logger.warning(f"{missing} static files have no precompressed variant, "
+                           f"run `python server/static_assets.py {self.root}` after building the client")
+
+    def _index_file(self, rel: str, path: str) -> Asset:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.blake2b(data, digest_size=12).hexdigest()
+        stat = os.stat(path)
+        inline = len(data) <= STATIC_INLINE_MAX
+        variants = {None: Variant(None, path, stat, digest, data if inline else None)}
+        for encoding, suffix in ENCODINGS:
+            compressed_path = path + suffix
+            if not os.path.isfile(compressed_path):
+                continue
+            compressed_stat = os.stat(compressed_path)
+            if compressed_stat.st_mtime < stat.st_mtime:
+                logger.warning(f"Ignoring stale {compressed_path}")
+                continue
+            body = None
+            if inline:
+                with open(compressed_path, "rb") as f:
+                    body = f.read()
+            variants[encoding] = Variant(encoding, compressed_path, compressed_stat, digest, body)
+        if inline and len(variants) == 1 and is_compressible(path) and len(data) >= STATIC_COMPRESS_MIN_SIZE:
+            # 小文件 (如 index.html) 没有预压缩时在内存里压缩一次
+            for encoding, compressed in compress(data):
+                variants[encoding] = Variant(encoding, path, stat, digest, compressed)
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if media_type == "application/javascript":
+            media_type += "; charset=utf-8"  # text/* 由 Response 自动加上
+        # Vite 输出到 assets/ 的文件名带内容哈希，可以永久缓存
+        cache_control = IMMUTABLE if rel.startswith("assets/") else REVALIDATE
+        return Asset(media_type, cache_control, variants)
+
+    def lookup(self, path: str) -> Optional[Asset]:
+        return self._assets.get(path)
+
+    def response(self, request: Request, asset: Asset) -> Response:
+        variant = asset.select(request.headers.get("accept-encoding", ""))
+        headers = {"ETag": variant.etag, "Cache-Control": asset.cache_control}
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and matches_etag(if_none_match, variant.etag):
+            return Response(status_code=304, headers=headers)
+        if variant.encoding:
+            headers["Content-Encoding"] = variant.encoding
+        if variant.body is not None:
+            return Response(variant.body, media_type=asset.media_type, headers=headers)
+        return FileResponse(variant.path, media_type=asset.media_type, headers=headers, stat_result=variant.stat)
+
+
+def matches_etag(if_none_match: str, etag: str) -> bool:
+    # If-None-Match 使用弱比较
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def compress(data: bytes) -> List[Tuple[str, bytes]]:
+    """返回比原文小的压缩结果 [(编码, 字节)]"""
+    results = []
+    if brotli is not None:
+        results.append(("br", brotli.compress(data, quality=11)))
+    results.append(("gzip", gzip.compress(data, compresslevel=9, mtime=0)))
+    return [(encoding, body) for encoding, body in results if len(body) < len(data) * 0.95]
+
+
+def precompress(root: str) -> Tuple[int, int, int]:
+    """为目录下的文本类文件生成 .br / .gz，返回 (文件数, 原始字节, 压缩后 br 或 gz 字节)"""
+    count = original = compressed = 0
+    suffixes = dict(ENCODINGS)
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if name.endswith((".br", ".gz")) or not is_compressible(path):
+                continue
+            if os.path.getsize(path) < STATIC_COMPRESS_MIN_SIZE:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            results = compress(data)
+            for encoding, body in results:
+                with open(path + suffixes[encoding], "wb") as f:
+                    f.write(body)
+            if results:
+                count += 1
+                original += len(data)
+                compressed += len(results[0][1])
+    return count, original, compressed
+
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else find_static_dir()
+    if root is None or not os.path.isdir(root):
+        sys.exit(f"static directory not found: {root}")
+    if brotli is None:
+        print("brotli not installed, generating gzip only")
+    count, original, compressed = precompress(root)
+    print(f"Compressed {count} files in {root}: {original} -> {compressed} bytes")
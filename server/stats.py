@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import extract, func
+from sqlalchemy.orm import Session
+
+from database import run_db
+from models import Log, TriggerRollup
+
+logger = logging.getLogger(__name__)
+
+# (user_id, day, hour, link_id)
+Cell = Tuple[int, date, int, int]
+
+
+def log_cells(db: Session, day: date, until: Optional[datetime] = None,
+              user_id: Optional[int] = None) -> Dict[Cell, int]:
+    """从 logs 统计 day 当天 (until 之前) 每个格子的触发次数"""
+    start = datetime.combine(day, dtime.min)
+    end = start + timedelta(days=1)
+    if until is not None:
+        end = min(end, until)
+    hour = extract("hour", Log.timestamp)
+    link = func.coalesce(Log.link_id, 0)
+    query = db.query(Log.user_id, hour, link, func.count()).filter(
+        Log.type == "success",
+        Log.timestamp >= start,
+        Log.timestamp < end
+    )
+    if user_id is not None:
+        query = query.filter(Log.user_id == user_id)
+    rows = query.group_by(Log.user_id, hour, link).all()
+    return {(owner, day, int(h), link_id): count for owner, h, link_id, count in rows}
+
+
+def merge_rollups(db: Session, cells: Dict[Cell, int]):
+    """把从 logs 统计的计数合并进 trigger_rollups: 已有格子取较大值，不提交
+
+    logs 和实时累加的计数都只会少算 (日志丢弃、进程退出丢失增量)，取较大值
+    可以重复执行，不会重复计数。
+    """
+    for (user_id, day, hour, link_id), count in cells.items():
+        existing = db.query(TriggerRollup).filter(
+            TriggerRollup.user_id == user_id,
+            TriggerRollup.day == day,
+            TriggerRollup.hour == hour,
+            TriggerRollup.link_id == link_id
+        ).first()
+        if existing is None:
+            db.add(TriggerRollup(user_id=user_id, day=day, hour=hour, link_id=link_id, count=count))
+        elif (existing.count or 0) < count:
+            existing.count = count
+    db.flush()
+
+
+class TriggerStats:
+    """当天触发次数的内存计数器
+
+    触发时在事件循环上 O(1) 累加，/api/stats 直接读取，不再扫描 logs。
+
+    多个 worker 共用 trigger_rollups: 每个 worker 只记录自上次持久化以来
+    的增量，定期按 (用户, 日期, 小时, 链接) 累加到数据库 (count = count + n)，
+    随后读回当天的汇总，内存计数 = 数据库汇总 + 本 worker 未写入的增量。
+    因此各 worker 返回的数字一致，其他 worker 的触发最多晚一个持久化周期。
+
+    启动时先用 logs 修复当天的汇总 (rebuild)，补上进程退出时未写入的增量
+    和升级前的触发。只统计两个持久化周期之前的日志: 更新的日志对应的触发
+    可能还在其他 worker 的内存增量里，计入会在它写入时重复。
+    """
+
+    def __init__(self):
+        self.day = date.today()
+        self._totals: Dict[int, int] = {}
+        self._hourly: Dict[int, list] = {}
+        self._links: Dict[int, Dict[int, int]] = {}
+        # 自上次持久化以来的增量
+        self._dirty: Dict[Cell, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, user_id: int, link_id: int, timestamp: Optional[datetime] = None):
+        timestamp = timestamp or datetime.now()
+        self._roll_over(timestamp.date())
+        cell = (user_id, self.day, timestamp.hour, link_id)
+        self._add(cell, 1)
+        self._dirty[cell] = self._dirty.get(cell, 0) + 1
+
+    def snapshot(self, user_id: int) -> dict:
+        self._roll_over(date.today())
+        links = self._links.get(user_id, {})
+        return {
+            "today_triggers": self._totals.get(user_id, 0),
+            "hourly": list(self._hourly.get(user_id, [0] * 24)),
+            "links": [{"link_id": k, "count": v} for k, v in sorted(links.items())],
+        }
+
+    def _add(self, cell: Cell, count: int):
+        user_id, _, hour, link_id = cell
+        self._totals[user_id] = self._totals.get(user_id, 0) + count
+        self._hourly.setdefault(user_id, [0] * 24)[hour] += count
+        links = self._links.setdefault(user_id, {})
+        links[link_id] = links.get(link_id, 0) + count
+
+    def _roll_over(self, today: date):
+        if today == self.day:
+            return
+        # 前一天未持久化的增量保留在 _dirty 中，下次 persist 写入
+        self.day = today
+        self._totals, self._hourly, self._links = {}, {}, {}
+
+    def _reset(self, cells: Dict[Cell, int]):
+        """以数据库中当天的汇总为准，加上尚未写入的增量"""
+        self._totals, self._hourly, self._links = {}, {}, {}
+        for cell, count in cells.items():
+            self._add(cell, count)
+        for cell, count in self._dirty.items():
+            if cell[1] == self.day:
+                self._add(cell, count)
+
+    def persist(self, db: Session, deltas: Dict[Cell, int], day: date) -> Dict[Cell, int]:
+        """把增量累加到 trigger_rollups，返回 day 当天全部格子的汇总
+
+        两个 worker 同时插入同一个新格子时后提交的违反唯一约束，整批回滚，
+        增量留到下次重试 (那时格子已存在，走累加)。
+        """
+        for (user_id, cell_day, hour, link_id), delta in deltas.items():
+            updated = db.query(TriggerRollup).filter(
+                TriggerRollup.user_id == user_id,
+                TriggerRollup.day == cell_day,
+                TriggerRollup.hour == hour,
+                TriggerRollup.link_id == link_id
+            ).update({TriggerRollup.count: TriggerRollup.count + delta}, synchronize_session=False)
+            if not updated:
+                db.add(TriggerRollup(user_id=user_id, day=cell_day, hour=hour, link_id=link_id, count=delta))
+        db.commit()
+        rows = db.query(TriggerRollup.user_id, TriggerRollup.hour, TriggerRollup.link_id, TriggerRollup.count) \
+            .filter(TriggerRollup.day == day).all()
+        return {(user_id, day, hour, link_id): count for user_id, hour, link_id, count in rows}
+
+    def rebuild(self, db: Session, until: datetime):
+        """用 logs 中 until 之前的日志修复当天的汇总 (取较大值，多个 worker 同时启动也安全)"""
+        cells = log_cells(db, self.day, until)
+        merge_rollups(db, cells)
+        db.commit()
+        logger.info(f"Rebuilt {len(cells)} trigger rollup cells from logs")
+
+    async def flush(self):
+        deltas, self._dirty = self._dirty, {}
+        day = self.day
+        try:
+            cells = await run_db(self.persist, deltas, day)
+        except Exception as e:
+            # 写入失败的增量放回，下次重试
+            for cell, delta in deltas.items():
+                self._dirty[cell] = self._dirty.get(cell, 0) + delta
+            logger.error(f"Failed to persist trigger rollups: {e}")
+            return
+        if day == self.day:
+            self._reset(cells)
+
+    async def start(self, interval: float):
+        self._roll_over(date.today())
+        await run_db(self.rebuild, datetime.now() - timedelta(seconds=2 * interval))
+        # 读取修复后的汇总，包括其他 worker 已写入的部分
+        await self.flush()
+        self._task = asyncio.create_task(self._run(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+
+trigger_stats = TriggerStats()
+# 持久化并同步其他 worker 计数的周期 (秒)
+STATS_FLUSH_SECONDS = float(os.environ.get("STATS_FLUSH_SECONDS", 10))
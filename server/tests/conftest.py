@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# 测试不碰工作目录下的 sql_app.db；需要数据库的测试各自创建 engine
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,190 @@
+import random
+
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from audio import SUPPORTED_SAMPLE_RATES, AudioConverter, polyphase_filter
+from schemas import AudioFormat
+
+
+def pcm(rate, channels, sample_width, seconds=0.5, freq=440.0):
+    """正弦波 (各声道相同)，按 sample_width 编码"""
+    t = np.arange(int(rate * seconds)) / rate
+    wave = np.sin(2 * np.pi * freq * t) * 0.5
+    samples = np.repeat(wave[:, None], channels, axis=1).reshape(-1)
+    if sample_width == 1:
+        return np.clip(np.rint(samples * 127 + 128), 0, 255).astype(np.uint8).tobytes()
+    if sample_width == 4:
+        return np.rint(samples * 2 ** 31 * 0.99).astype("<i4").tobytes()
+    return np.rint(samples * 32767).astype("<i2").tobytes()
+
+
+def convert_in_chunks(converter, data, rng):
+    out, pos = [], 0
+    while pos < len(data):
+        # 任意字节处切开，包括采样和声道的中间
+        size = rng.randint(1, 3000)
+        out.append(converter.convert(data[pos:pos + size]))
+        pos += size
+    return b"".join(out)
+
+
+@pytest.mark.parametrize("rate,channels,sample_width", [
+    (48000, 2, 2), (44100, 1, 2), (8000, 1, 1), (22050, 1, 4), (11025, 2, 2),
+])
+def test_chunked_conversion_matches_whole(rate, channels, sample_width):
+    data = pcm(rate, channels, sample_width)
+    whole = AudioConverter(rate, channels, sample_width).convert(data)
+    chunked = convert_in_chunks(AudioConverter(rate, channels, sample_width), data, random.Random(rate))
+    assert chunked == whole
+    # 输出是 16kHz: 长度误差不超过一个采样
+    assert abs(len(whole) // 2 - 16000 * len(data) // (rate * channels * sample_width)) <= 1
+
+
+@pytest.mark.parametrize("rate", [48000, 44100, 8000])
+def test_resampled_tone_keeps_frequency_and_level(rate):
+    out = np.frombuffer(AudioConverter(rate).convert(pcm(rate, 1, 2, seconds=1.0, freq=1000)), dtype="<i2")
+    steady = out[1000:-1000].astype(np.float64)
+    spectrum = np.abs(np.fft.rfft(steady))
+    peak_hz = np.argmax(spectrum) * 16000 / len(steady)
+    assert abs(peak_hz - 1000) < 5
+    rms = np.sqrt(np.mean(steady ** 2))
+    assert abs(20 * np.log10(rms / (32767 * 0.5 / np.sqrt(2)))) < 0.5
+
+
+def test_passthrough_for_native_format():
+    data = pcm(16000, 1, 2)
+    converter = AudioConverter()
+    assert converter.passthrough and converter.convert(data) is data
+
+
+@pytest.mark.parametrize("rate", [191999, 176399, 44101, 7999, 384000])
+def test_odd_sample_rates_are_rejected(rate):
+    with pytest.raises(ValidationError):
+        AudioFormat.model_validate_json(f'{{"sample_rate": {rate}}}')
+    with pytest.raises(ValueError):
+        AudioConverter(rate)
+
+
+def test_supported_rates_have_small_filters():
+    for rate in SUPPORTED_SAMPLE_RATES:
+        AudioFormat(sample_rate=rate)
+        converter = AudioConverter(rate)
+        assert converter.up <= 640
+        if converter._filter is not None:
+            assert converter._filter.nbytes < 128 * 1024
+            # 同一转换比共享同一个滤波器
+            assert AudioConverter(rate)._filter is converter._filter
+    assert polyphase_filter.cache_info().currsize <= polyphase_filter.cache_info().maxsize
+
+
+# --- 接入: 环形缓冲区、分帧、静音抑制和背压 ---
+
+from audio import AudioIngest, RingBuffer, frame_dbfs  # noqa: E402
+
+
+def test_ring_buffer_wraps_and_grows():
+    ring = RingBuffer(8)
+    ring.write(b"abcdef")
+    assert ring.read(4) == b"abcd"
+    ring.write(b"ghijk")  # 写入跨过缓冲区末尾
+    assert ring.size == 7
+    ring.write(b"lmnopqrstu")  # 超过容量时扩容，保留顺序
+    assert ring.read(ring.size) == b"efghijklmnopqrstu"
+    assert ring.size == 0
+
+
+def tone_frame(ingest, level=0.3):
+    n = ingest.frame_bytes // 2
+    return (np.sin(np.arange(n) * 0.1) * 32767 * level).astype("<i2").tobytes()
+
+
+def silent_frame(ingest):
+    return bytes(ingest.frame_bytes)
+
+
+def drain(ingest):
+    frames = []
+    while ingest._pending:
+        frames.append(ingest._pending.popleft()[1])
+    return frames
+
+
+def run(coro):
+    import asyncio
+    return asyncio.run(coro)
+
+
+def test_ingest_reframes_arbitrary_chunks():
+    async def scenario():
+        ingest = AudioIngest(vad_enabled=False, max_pending=1000)
+        data = bytes(range(256)) * 60  # 15360 字节 = 8 帧
+        rng = random.Random(3)
+        pos = 0
+        while pos < len(data):
+            size = rng.randint(1, 2500)
+            await ingest.push(data[pos:pos + size])
+            pos += size
+        return ingest, data
+
+    ingest, data = run(scenario())
+    frames = drain(ingest)
+    assert all(len(f) == ingest.frame_bytes for f in frames)
+    assert b"".join(frames) == data[:len(frames) * ingest.frame_bytes]
+    assert len(frames) == len(data) // ingest.frame_bytes
+    assert ingest._ring.size == len(data) % ingest.frame_bytes
+
+
+def test_vad_gate_suppresses_silence_with_preroll_and_hangover():
+    async def scenario():
+        # 60ms 帧: 预录 3 帧，说话结束后再发 5 帧
+        ingest = AudioIngest(frame_ms=60, preroll_ms=180, hangover_ms=300, max_pending=1000)
+        speech, silence = tone_frame(ingest), silent_frame(ingest)
+        assert frame_dbfs(speech) > ingest.vad_dbfs > frame_dbfs(silence)
+        for frame in [silence] * 10 + [speech] * 2 + [silence] * 10:
+            await ingest.push(frame)
+        return ingest, speech, silence
+
+    ingest, speech, silence = run(scenario())
+    frames = drain(ingest)
+    # 3 帧预录 + 2 帧语音 + 5 帧拖尾
+    assert frames == [silence] * 3 + [speech] * 2 + [silence] * 5
+    # 被挤出预录缓冲的帧计入抑制，仍在预录缓冲中的 3 帧不计入
+    assert ingest.frames_suppressed == 10 + 10 - 3 - 5 - 3
+
+
+def test_shed_backpressure_keeps_newest_frames():
+    async def scenario():
+        ingest = AudioIngest(vad_enabled=False, max_pending=3, backpressure="shed")
+        frames = [bytes([i]) * ingest.frame_bytes for i in range(6)]
+        for frame in frames:
+            await ingest.push(frame)
+        return ingest, frames
+
+    ingest, frames = run(scenario())
+    assert drain(ingest) == frames[3:]
+    assert ingest.frames_shed == 3
+
+
+def test_pause_backpressure_waits_for_consumer():
+    import asyncio
+
+    async def scenario():
+        ingest = AudioIngest(vad_enabled=False, max_pending=2, backpressure="pause")
+        frames = [bytes([i]) * ingest.frame_bytes for i in range(5)]
+        push = asyncio.create_task(ingest.push(b"".join(frames)))
+        await asyncio.sleep(0.05)
+        # 队列满后暂停读取，不丢帧
+        blocked = not push.done() and ingest.pending == 2
+        received = []
+        async for frame in ingest.frames():
+            received.append(frame)
+            if len(received) == len(frames):
+                break
+        await push
+        return blocked, received, frames, ingest.frames_shed
+
+    blocked, received, frames, shed = run(scenario())
+    assert blocked
+    assert received == frames and shed == 0
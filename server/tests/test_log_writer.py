@@ -0,0 +1,32 @@
+import asyncio
+import logging
+
+from sqlalchemy import func, select
+
+from database import SessionLocal
+from log_writer import LogWriter
+from migrations import run_migrations
+from models import Log
+
+
+def count_logs(message):
+    with SessionLocal() as db:
+        return db.scalar(select(func.count()).select_from(Log).where(Log.message == message))
+
+
+def test_submit_after_stop_is_dropped_and_logged(caplog):
+    run_migrations()
+
+    async def scenario():
+        writer = LogWriter(flush_interval=10)
+        writer.start()
+        assert writer.submit(1, "success", "before stop")
+        await writer.stop()
+        with caplog.at_level(logging.WARNING, logger="log_writer"):
+            accepted = writer.submit(1, "success", "after stop")
+        return writer, accepted
+
+    writer, accepted = asyncio.run(scenario())
+    assert count_logs("before stop") == 1
+    assert not accepted and writer.dropped == 1 and writer.queue_depth == 0
+    assert "dropped success log for user 1" in caplog.text
@@ -0,0 +1,26 @@
+from matcher import MATCH_MAX_SEGMENT_CHARS, KeywordMatcher, StreamingMatcher
+
+
+def streaming(keyword_map):
+    return StreamingMatcher(KeywordMatcher(keyword_map), cooldown=0)
+
+
+def test_partial_hit_across_truncation_boundary():
+    s = streaming({"苹果": 1})
+    # 关键词的前半段恰好位于截断前的末尾
+    assert s.feed_partial("x" * (MATCH_MAX_SEGMENT_CHARS - 1) + "苹") is None
+    hit = s.feed_partial("果x")
+    assert hit is not None and hit.keyword == "苹果"
+    assert s.text[hit.start:hit.end] == "苹果"
+    assert len(s.text) <= MATCH_MAX_SEGMENT_CHARS
+
+
+def test_partial_hit_in_delta_longer_than_segment_limit():
+    s = streaming({"苹果": 1})
+    s.feed_partial("y" * 10)
+    hit = s.feed_partial("x" * MATCH_MAX_SEGMENT_CHARS + "苹果")
+    assert hit is not None
+    assert s.text[hit.start:hit.end] == "苹果"
+    # 之后的中间结果照常匹配
+    hit = s.feed_partial("z苹果")
+    assert hit is not None and s.text[hit.start:hit.end] == "苹果"
@@ -0,0 +1,143 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import models
+from database import Base
+from migrations import MIGRATIONS, run_migrations
+
+# 迁移机制引入之前 (baseline) 由 create_all 建出的 SQLite 表结构
+BASELINE_DDL = [
+    """CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR, hashed_password VARCHAR,
+       is_active BOOLEAN, is_superuser BOOLEAN, PRIMARY KEY (id))""",
+    "CREATE INDEX ix_users_id ON users (id)",
+    "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+    """CREATE TABLE configs (id INTEGER NOT NULL, user_id INTEGER, link_id INTEGER, keywords TEXT,
+       PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    "CREATE INDEX ix_configs_id ON configs (id)",
+    """CREATE TABLE logs (id INTEGER NOT NULL, user_id INTEGER, timestamp DATETIME, type VARCHAR,
+       message VARCHAR, details TEXT, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    "CREATE INDEX ix_logs_id ON logs (id)",
+    """CREATE TABLE audits (id INTEGER NOT NULL, user_id INTEGER, timestamp DATETIME, action VARCHAR,
+       details VARCHAR, ip_address VARCHAR, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    "CREATE INDEX ix_audits_id ON audits (id)",
+    """CREATE TABLE alarm_configs (id INTEGER NOT NULL, user_id INTEGER, no_recognition_threshold INTEGER,
+       email_notification BOOLEAN, email_address VARCHAR, PRIMARY KEY (id), UNIQUE (user_id),
+       FOREIGN KEY(user_id) REFERENCES users (id))""",
+    "CREATE INDEX ix_alarm_configs_id ON alarm_configs (id)",
+]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/db.sqlite")
+    yield engine
+    engine.dispose()
+
+
+def schema(engine):
+    inspector = inspect(engine)
+    return {
+        table: (
+            {c["name"] for c in inspector.get_columns(table)},
+            {i["name"] for i in inspector.get_indexes(table)},
+        )
+        for table in inspector.get_table_names() if table != "schema_migrations"
+    }
+
+
+def model_schema():
+    return {
+        table.name: (
+            {c.name for c in table.columns},
+            {i.name for i in table.indexes},
+        )
+        for table in Base.metadata.sorted_tables
+    }
+
+
+def test_fresh_database_matches_models(engine):
+    assert run_migrations(engine) == [version for version, _, _ in MIGRATIONS]
+    current = schema(engine)
+    for table, (columns, indexes) in model_schema().items():
+        assert current[table][0] == columns, table
+        assert indexes <= current[table][1], table
+    assert run_migrations(engine) == []
+
+
+def test_upgrade_baseline_database_with_data(engine):
+    with engine.begin() as conn:
+        for statement in BASELINE_DDL:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO users (id, username) VALUES (1, 'a'), (2, 'b')"))
+        rows = [
+            (1, 1, ["苹果", "香蕉", "苹果"]),
+            (1, 2, ["香蕉", "梨"]),
+            (1, 1, ["桃"]),  # 同一链接的重复行
+            (1, 3, []),
+            (2, 1, ["苹果"]),
+        ]
+        for user_id, link_id, keywords in rows:
+            conn.execute(text("INSERT INTO configs (user_id, link_id, keywords) VALUES (:u, :l, :k)"),
+                         {"u": user_id, "l": link_id, "k": json.dumps(keywords, ensure_ascii=False)})
+        conn.execute(text("INSERT INTO logs (user_id, type, message) VALUES (1, 'success', 'x')"))
+
+    assert run_migrations(engine) == [version for version, _, _ in MIGRATIONS]
+
+    with engine.connect() as conn:
+        configs = conn.execute(text(
+            "SELECT user_id, link_id, position FROM configs ORDER BY user_id, position")).all()
+        keywords = conn.execute(text(
+            "SELECT user_id, link_id, keyword, position FROM keywords ORDER BY user_id, link_id, position")).all()
+        assert conn.execute(text("SELECT count(*) FROM logs")).scalar() == 1
+    assert [tuple(r) for r in configs] == [(1, 1, 0), (1, 2, 1), (1, 3, 2), (2, 1, 0)]
+    assert [tuple(r) for r in keywords] == [
+        (1, 1, "苹果", 0), (1, 1, "香蕉", 1), (1, 1, "桃", 2),
+        (1, 2, "香蕉", 0), (1, 2, "梨", 1),
+        (2, 1, "苹果", 0),
+    ]
+
+    current = schema(engine)
+    for table, (columns, _) in model_schema().items():
+        assert current[table][0] == columns, table
+
+
+def test_upgraded_database_loads_config(engine):
+    from sqlalchemy.orm import Session
+
+    from keyword_store import load_links
+
+    with engine.begin() as conn:
+        for statement in BASELINE_DDL:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO users (id, username) VALUES (1, 'a')"))
+        conn.execute(text("""INSERT INTO configs (user_id, link_id, keywords) VALUES (1, 2, '["梨"]')"""))
+    run_migrations(engine)
+    with Session(engine) as db:
+        assert [tuple(link) for link in load_links(db, 1)] == [(2, ["梨"], False)]
+    assert models.Keyword.__tablename__ in inspect(engine).get_table_names()
+
+
+def test_concurrent_workers_apply_each_migration_once(tmp_path):
+    import threading
+
+    engines = [create_engine(f"sqlite:///{tmp_path}/shared.sqlite") for _ in range(4)]
+    results, errors = [], []
+
+    def worker(engine):
+        try:
+            results.append(run_migrations(engine))
+        except Exception as e:  # pragma: no cover - 失败时在断言中报告
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(engine,)) for engine in engines]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for engine in engines:
+        engine.dispose()
+    assert not errors
+    # 只有第一个拿到锁的 worker 执行了迁移
+    assert sorted(results, key=len) == [[]] * 3 + [[version for version, _, _ in MIGRATIONS]]
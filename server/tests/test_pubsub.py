@@ -0,0 +1,159 @@
+import asyncio
+
+from pubsub import RESYNC, UnixSocketBackend
+
+
+async def wait_for(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_unix_notify_reaches_other_workers(tmp_path):
+    path = str(tmp_path / "pubsub.sock")
+
+    async def scenario():
+        events = {"a": [], "b": []}
+        a, b = UnixSocketBackend(path), UnixSocketBackend(path)
+        await a.start(lambda user_id, batch: None, lambda kind, user_id: events["a"].append((kind, user_id)))
+        await wait_for(lambda: a._writer is not None)
+        # b 连接之前发出的通知在连接后补发
+        b.notify("alarm", 2)
+        await b.start(lambda user_id, batch: None, lambda kind, user_id: events["b"].append((kind, user_id)))
+        await wait_for(lambda: b._writer is not None)
+
+        a.notify("config", 1)
+        await wait_for(lambda: events["a"] and events["b"])
+        await asyncio.sleep(0.05)
+        await a.close()
+        await b.close()
+        return events
+
+    events = asyncio.run(scenario())
+    # 发送者自己不会收到
+    assert events == {"a": [("alarm", 2)], "b": [("config", 1)]}
+
+
+def test_unix_reconnect_requests_resync(tmp_path):
+    path = str(tmp_path / "pubsub.sock")
+
+    async def scenario():
+        events = []
+        host, other = UnixSocketBackend(path), UnixSocketBackend(path)
+        await host.start(lambda user_id, batch: None)
+        await wait_for(lambda: host._writer is not None)
+        await other.start(lambda user_id, batch: None, lambda kind, user_id: events.append(kind))
+        await wait_for(lambda: other._writer is not None)
+        # broker 所在的 worker 退出，另一个 worker 接替并重连
+        await host.close()
+        await wait_for(lambda: RESYNC in events)
+        await other.close()
+        return events
+
+    assert asyncio.run(scenario()) == [RESYNC]
+
+
+class FakeRedisServer:
+    """测试用的内存 Redis: 只实现 RedisBackend 用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+        self.subscribers = []
+
+    def client(self):
+        return FakeRedis(self)
+
+
+class FakeRedis:
+    def __init__(self, server: FakeRedisServer):
+        self.server = server
+
+    async def set(self, key, value, ex=None):
+        self.server.data[key] = str(value).encode()
+
+    async def mget(self, keys):
+        return [self.server.data.get(key) for key in keys]
+
+    async def delete(self, key):
+        self.server.data.pop(key, None)
+
+    async def hset(self, key, field, value):
+        self.server.data.setdefault(key, {})[field.encode()] = value.encode()
+
+    async def hdel(self, key, field):
+        self.server.data.get(key, {}).pop(field.encode(), None)
+
+    async def hgetall(self, key):
+        return dict(self.server.data.get(key, {}))
+
+    async def scan_iter(self, match):
+        for key in list(self.server.data):
+            if key.startswith(match.rstrip("*")):
+                yield key.encode()
+
+    async def publish(self, channel, message):
+        for pubsub in self.server.subscribers:
+            if channel in pubsub.channels:
+                pubsub.queue.put_nowait({"type": "message", "channel": channel.encode(),
+                                         "data": message.encode() if isinstance(message, str) else message})
+
+    def pubsub(self):
+        pubsub = FakePubSub()
+        self.server.subscribers.append(pubsub)
+        return pubsub
+
+    async def close(self):
+        pass
+
+
+class FakePubSub:
+    def __init__(self):
+        self.channels = set()
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+    async def close(self):
+        pass
+
+
+def test_redis_loads_existing_presence_on_start(monkeypatch):
+    import sys
+    import types
+
+    from pubsub import Presence, RedisBackend
+
+    server = FakeRedisServer()
+    fake = types.ModuleType("redis.asyncio")
+    fake.from_url = lambda url: server.client()
+    monkeypatch.setitem(sys.modules, "redis", types.ModuleType("redis"))
+    monkeypatch.setitem(sys.modules, "redis.asyncio", fake)
+
+    async def scenario():
+        a, b = RedisBackend(), RedisBackend()
+        a.worker_id, b.worker_id = "host:1", "host:2"
+        await a.start(lambda user_id, batch: None)
+        a.set_presence(1, 2, 1)
+        await asyncio.sleep(0.01)
+        # b 启动前 a 已上报在线数，b 启动时应读到
+        await b.start(lambda user_id, batch: None)
+        before = b.presence(1)
+        b.set_presence(1, 1, 0)
+        await wait_for(lambda: a.presence(1) == Presence(3, 1))
+        after = b.presence(1)
+        await a.close()
+        await b.close()
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    assert before == Presence(2, 1)
+    assert after == Presence(3, 1)
@@ -0,0 +1,64 @@
+from ratelimit import LoginLimiter, RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_limiter(clock):
+    return LoginLimiter(RateLimiter(1, 20, clock=clock), RateLimiter(0.2, 5, clock=clock))
+
+
+def test_rejected_request_consumes_no_ip_tokens():
+    clock = Clock()
+    limiter = make_limiter(clock)
+    for _ in range(5):
+        assert limiter.check("1.2.3.4", "bob") == 0
+        limiter.failed("1.2.3.4", "bob")
+    # 用户名的失败次数用完: 请求被拒，IP 桶不被消耗
+    for _ in range(30):
+        assert limiter.check("1.2.3.4", "bob") > 0
+    assert limiter.ip_limiter.check("1.2.3.4") == 0
+    assert limiter.check("1.2.3.4", "alice") == 0
+    assert (limiter.ip_limiter.limited, limiter.user_limiter.limited) == (0, 30)
+
+
+def test_many_sources_guessing_one_username_are_throttled():
+    clock = Clock()
+    limiter = make_limiter(clock)
+    results = []
+    for i in range(50):
+        ip = f"6.6.6.{i}"
+        retry_after = limiter.check(ip, "admin")
+        results.append(retry_after)
+        if not retry_after:
+            limiter.failed(ip, "admin")
+    assert results[:5] == [0] * 5 and all(results[5:])
+    # 每 5 秒恢复一次尝试机会
+    clock.now += 5
+    assert limiter.check("6.6.6.99", "admin") == 0
+
+
+def test_known_source_can_log_in_during_an_attack():
+    clock = Clock()
+    limiter = make_limiter(clock)
+    assert limiter.check("10.0.0.1", "admin") == 0
+    limiter.succeeded("10.0.0.1", "admin")
+    for i in range(20):
+        if not limiter.check(f"6.6.6.{i}", "admin"):
+            limiter.failed(f"6.6.6.{i}", "admin")
+    assert limiter.check("10.0.0.99", "admin") > 0
+    assert limiter.check("10.0.0.1", "admin") == 0
+
+
+def test_successful_logins_do_not_charge_the_username():
+    clock = Clock()
+    limiter = make_limiter(clock)
+    for i in range(15):
+        assert limiter.check(f"10.0.0.{i}", "shared") == 0
+        limiter.succeeded(f"10.0.0.{i}", "shared")
+    assert limiter.check("10.0.1.1", "shared") == 0
@@ -0,0 +1,138 @@
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import delete
+
+import retention
+from database import SessionLocal, process_lock
+from migrations import run_migrations
+from models import Log, TriggerRollup
+from retention import RetentionJob, TablePolicy, search_archive
+
+USER = 77
+OLD_DAY = date.today() - timedelta(days=40)
+
+
+def setup_module():
+    run_migrations()
+
+
+@pytest.fixture(autouse=True)
+def clean():
+    with SessionLocal() as db:
+        db.execute(delete(Log).where(Log.user_id == USER))
+        db.execute(delete(TriggerRollup).where(TriggerRollup.user_id == USER))
+        db.commit()
+
+
+def seed(*timestamps):
+    with SessionLocal() as db:
+        logs = [Log(user_id=USER, timestamp=ts, type="success", message="t", link_id=5) for ts in timestamps]
+        db.add_all(logs)
+        db.commit()
+        return [log.id for log in logs]
+
+
+def at(day, hour):
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+
+
+def remaining_ids():
+    with SessionLocal() as db:
+        return sorted(id for (id,) in db.query(Log.id).filter(Log.user_id == USER))
+
+
+def archived_ids(root):
+    return [row["id"] for row in search_archive(str(root), "logs", date.min, date.max, user_id=USER)]
+
+
+def rollups():
+    with SessionLocal() as db:
+        return {(r.day, r.hour): r.count for r in db.query(TriggerRollup).filter(TriggerRollup.user_id == USER)}
+
+
+def test_run_is_skipped_while_another_worker_holds_the_lock(tmp_path):
+    job = RetentionJob([TablePolicy(Log, 30, True)], archive_dir=str(tmp_path))
+    with process_lock("retention") as acquired:
+        assert acquired
+        assert asyncio.run(job.run_once()) is None
+    assert job.last_report is None
+    report = asyncio.run(job.run_once())
+    assert report is not None and job.last_report is report
+
+
+def test_batches_split_rows_sharing_a_timestamp(tmp_path):
+    # 7 行同一时刻，批次边界落在这一时刻的中间
+    old = seed(*[at(OLD_DAY, 10)] * 7, *[at(OLD_DAY + timedelta(days=1), 3)] * 2)
+    recent = seed(datetime.now())
+    job = RetentionJob([TablePolicy(Log, 30, True)], archive_dir=str(tmp_path), batch_size=3, pause=0)
+    stats = asyncio.run(job.run_once())["tables"]["logs"]
+
+    assert remaining_ids() == recent
+    assert archived_ids(tmp_path) == old
+    assert (stats["rows_deleted"], stats["batches"], stats["files"]) == (9, 3, 4)
+    assert rollups() == {(OLD_DAY, 10): 7, (OLD_DAY + timedelta(days=1), 3): 2}
+
+
+def test_rollups_keep_the_larger_count(tmp_path):
+    seed(*[at(OLD_DAY, 10)] * 2, *[at(OLD_DAY, 11)] * 3)
+    with SessionLocal() as db:
+        # 实时计数比 logs 多 (日志被丢弃) 或少 (增量未写入)
+        db.add(TriggerRollup(user_id=USER, day=OLD_DAY, hour=10, link_id=5, count=10))
+        db.add(TriggerRollup(user_id=USER, day=OLD_DAY, hour=11, link_id=5, count=1))
+        db.commit()
+    job = RetentionJob([TablePolicy(Log, 30, True)], archive_dir=str(tmp_path))
+    asyncio.run(job.run_once())
+    assert rollups() == {(OLD_DAY, 10): 10, (OLD_DAY, 11): 3}
+
+
+def test_archive_left_without_rename_is_rewritten(tmp_path, monkeypatch):
+    old = seed(*[at(OLD_DAY, 10)] * 4)
+    job = RetentionJob([TablePolicy(Log, 30, True)], archive_dir=str(tmp_path), batch_size=3, pause=0)
+
+    def crash(src, dst):
+        raise OSError("killed before rename")
+
+    with monkeypatch.context() as m:
+        m.setattr(retention.os, "replace", crash)
+        with pytest.raises(OSError):
+            asyncio.run(job.run_once())
+    # 临时文件不计入归档，行仍在数据库中
+    assert remaining_ids() == old
+    assert archived_ids(tmp_path) == []
+    assert any(name.endswith(".tmp") for _, _, files in os.walk(tmp_path) for name in files)
+
+    asyncio.run(job.run_once())
+    assert remaining_ids() == []
+    assert archived_ids(tmp_path) == old
+    assert not any(name.endswith(".tmp") for _, _, files in os.walk(tmp_path) for name in files)
+    assert rollups() == {(OLD_DAY, 10): 4}
+
+
+def test_batch_archived_but_not_deleted_is_not_duplicated(tmp_path, monkeypatch):
+    old = seed(*[at(OLD_DAY, 10)] * 6)
+    job = RetentionJob([TablePolicy(Log, 30, True)], archive_dir=str(tmp_path), batch_size=3, pause=0)
+    merge = retention.merge_rollups
+    calls = []
+
+    def crash_on_second_batch(db, cells):
+        calls.append(cells)
+        if len(calls) == 2:
+            raise RuntimeError("killed before delete commit")
+        merge(db, cells)
+
+    with monkeypatch.context() as m:
+        m.setattr(retention, "merge_rollups", crash_on_second_batch)
+        with pytest.raises(RuntimeError):
+            asyncio.run(job.run_once())
+    # 第二批已归档，删除被回滚
+    assert remaining_ids() == old[3:]
+    assert archived_ids(tmp_path) == old
+
+    asyncio.run(job.run_once())
+    assert remaining_ids() == []
+    assert archived_ids(tmp_path) == old
+    # 重跑时 logs 只剩一半，汇总保留第一次写入的整天计数
+    assert rollups() == {(OLD_DAY, 10): 6}
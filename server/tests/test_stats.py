@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import delete
+
+from database import SessionLocal
+from migrations import run_migrations
+from models import TriggerRollup
+from stats import TriggerStats
+
+
+def setup_module():
+    run_migrations()
+    with SessionLocal() as db:
+        db.execute(delete(TriggerRollup))
+        db.commit()
+
+
+def test_workers_add_up_instead_of_overwriting():
+    async def scenario():
+        # 两个 worker 各自记录同一个格子
+        a, b = TriggerStats(), TriggerStats()
+        await a.flush()
+        await b.flush()
+        now = datetime.now()
+        for _ in range(3):
+            a.record(1, 7, now)
+        for _ in range(2):
+            b.record(1, 7, now)
+        assert a.snapshot(1)["today_triggers"] == 3
+
+        await a.flush()
+        await b.flush()
+        # a 尚未读到 b 写入的增量，再同步一次后两边一致
+        await a.flush()
+        a.record(1, 8, now)
+        return a.snapshot(1), b.snapshot(1)
+
+    snap_a, snap_b = asyncio.run(scenario())
+    assert snap_a["today_triggers"] == 6
+    assert snap_a["links"] == [{"link_id": 7, "count": 5}, {"link_id": 8, "count": 1}]
+    assert snap_b["today_triggers"] == 5
+    with SessionLocal() as db:
+        assert sum(r.count for r in db.query(TriggerRollup).filter(TriggerRollup.link_id == 7)) == 5
+
+    # 新启动的 worker 从数据库读到全部已写入的计数
+    async def restart():
+        stats = TriggerStats()
+        await stats.flush()
+        return stats.snapshot(1)
+
+    assert asyncio.run(restart())["today_triggers"] == 5
+
+
+def test_rebuild_recovers_unflushed_triggers_from_logs():
+    from datetime import timedelta
+
+    from database import run_db
+    from models import Log
+
+    user_id = 42
+    now = datetime.now()
+    with SessionLocal() as db:
+        db.execute(delete(Log).where(Log.user_id == user_id))
+        db.commit()
+
+    async def scenario():
+        # worker 记录了 4 次触发，只持久化了前 1 次，随后退出 (增量丢失)
+        crashed = TriggerStats()
+        await crashed.flush()
+        crashed.record(user_id, 3, now)
+        await crashed.flush()
+        for _ in range(3):
+            crashed.record(user_id, 3, now)
+        with SessionLocal() as db:
+            db.add_all([Log(user_id=user_id, timestamp=now, type="success", message="t", link_id=3)
+                        for _ in range(4)])
+            # 截止时间之后的日志不计入 (可能还在其他 worker 的内存增量里)
+            db.add(Log(user_id=user_id, timestamp=now + timedelta(seconds=5), type="success", message="t",
+                       link_id=3))
+            db.commit()
+
+        # 两个 worker 同时启动，各自修复一次，结果不叠加
+        until = now + timedelta(seconds=1)
+        a, b = TriggerStats(), TriggerStats()
+        await run_db(a.rebuild, until)
+        await run_db(b.rebuild, until)
+        await a.flush()
+        await b.flush()
+        return a.snapshot(user_id), b.snapshot(user_id)
+
+    snap_a, snap_b = asyncio.run(scenario())
+    assert snap_a["today_triggers"] == snap_b["today_triggers"] == 4
+    assert snap_a["links"] == [{"link_id": 3, "count": 4}]
@@ -0,0 +1,45 @@
+import asyncio
+
+import websockets
+
+from upstream import FunASRPool
+
+
+def test_spare_is_refilled_as_soon_as_it_is_taken():
+    async def scenario():
+        connections = []
+
+        async def handler(ws):
+            connections.append(ws)
+            await ws.wait_closed()
+
+        server = await websockets.serve(handler, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        # 健康检查间隔远大于测试时长，补充只能来自取用时的调度
+        pool = FunASRPool([f"ws://127.0.0.1:{port}"], warm_spares=1, health_interval=3600)
+        endpoint = pool.endpoints[0]
+        pool.start()
+        for _ in range(100):
+            if endpoint.spares:
+                break
+            await asyncio.sleep(0.01)
+        spare = endpoint.spares[0]
+
+        taken_endpoint, ws = await pool.acquire()
+        assert ws is spare
+        for _ in range(100):
+            if endpoint.spares:
+                break
+            await asyncio.sleep(0.01)
+        refilled = list(endpoint.spares)
+
+        await ws.close()
+        pool.release(taken_endpoint)
+        await pool.close()
+        server.close()
+        await server.wait_closed()
+        return spare, refilled, len(connections)
+
+    spare, refilled, connected = asyncio.run(scenario())
+    assert len(refilled) == 1 and refilled[0] is not spare
+    assert connected == 2
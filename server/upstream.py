@@ -0,0 +1,273 @@
+"""FunASR 上游连接管理
+
+FUNASR_URLS 可配置多个实例 (逗号分隔的 ws 地址)，未配置时使用
+FUNASR_HOST/FUNASR_PORT。每个实例保持少量预先建立好的空闲连接，插件
+连接时直接取用，省去握手时间，取用后立即在后台补足；新会话分配给当前
+负载最低的健康实例。
+
+上游断开时 UpstreamSession 在后台按带抖动的指数退避重连 (可能换到
+另一个实例)，期间插件发来的音频先缓存，重连后补发，插件会话不受影响。
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, List, Optional
+
+import websockets
+from websockets.exceptions import ConnectionClosed
+
+logger = logging.getLogger(__name__)
+
+# 每个实例保持的预热空闲连接数
+FUNASR_WARM_SPARES = int(os.environ.get("FUNASR_WARM_SPARES", 1))
+# 健康检查间隔 (秒)
+FUNASR_HEALTH_INTERVAL = float(os.environ.get("FUNASR_HEALTH_INTERVAL", 10))
+# 重连期间最多缓存的音频字节数 (默认约 10 秒 16k/16bit 单声道)
+FUNASR_BUFFER_BYTES = int(os.environ.get("FUNASR_BUFFER_BYTES", 16000 * 2 * 10))
+# 重连退避: 初始和最大等待秒数
+FUNASR_BACKOFF_BASE = float(os.environ.get("FUNASR_BACKOFF_BASE", 0.2))
+FUNASR_BACKOFF_MAX = float(os.environ.get("FUNASR_BACKOFF_MAX", 5))
+FUNASR_CONNECT_TIMEOUT = float(os.environ.get("FUNASR_CONNECT_TIMEOUT", 5))
+
+
+def funasr_urls_from_env() -> List[str]:
+    urls = os.environ.get("FUNASR_URLS")
+    if urls:
+        return [u.strip() for u in urls.split(",") if u.strip()]
+    host = os.environ.get("FUNASR_HOST", "10.98.98.5")
+    port = os.environ.get("FUNASR_PORT", "10095")
+    return [f"ws://{host}:{port}"]
+
+
+def backoff_delay(attempt: int, base: float = FUNASR_BACKOFF_BASE, cap: float = FUNASR_BACKOFF_MAX) -> float:
+    """full jitter 指数退避，避免大量会话同时重连"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class Endpoint:
+    def __init__(self, url: str):
+        self.url = url
+        self.active = 0  # 正在使用的会话数
+        self.spares: Deque = deque()
+        self.failures = 0
+        self.retry_at = 0.0  # 连续失败后在该时间前不再分配
+        self.refill: Optional[asyncio.Task] = None  # 正在补充预热连接的任务
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.retry_at
+
+    def mark_failed(self):
+        self.failures += 1
+        self.retry_at = time.monotonic() + backoff_delay(self.failures)
+
+    def mark_ok(self):
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+class FunASRPool:
+    def __init__(self, urls: List[str], warm_spares: int = FUNASR_WARM_SPARES,
+                 health_interval: float = FUNASR_HEALTH_INTERVAL):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.warm_spares = warm_spares
+        self.health_interval = health_interval
+        self.reconnects = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for endpoint in self.endpoints:
+            if endpoint.refill is not None:
+                endpoint.refill.cancel()
+                endpoint.refill = None
+            while endpoint.spares:
+                await endpoint.spares.popleft().close()
+
+    def pick(self) -> Endpoint:
+        """选择负载最低的健康实例，都不健康时选最早可重试的"""
+        healthy = [e for e in self.endpoints if e.healthy]
+        if not healthy:
+            return min(self.endpoints, key=lambda e: e.retry_at)
+        low = min(e.active for e in healthy)
+        return random.choice([e for e in healthy if e.active == low])
+
+    async def acquire(self):
+        """取得一个上游连接，优先使用预热连接，返回 (endpoint, ws)"""
+        endpoint = self.pick()
+        while endpoint.spares:
+            ws = endpoint.spares.popleft()
+            if ws.open:
+                endpoint.active += 1
+                self._refill(endpoint)
+                return endpoint, ws
+        try:
+            ws = await self._connect(endpoint)
+        except Exception:
+            endpoint.mark_failed()
+            raise
+        endpoint.active += 1
+        self._refill(endpoint)
+        return endpoint, ws
+
+    def release(self, endpoint: Endpoint):
+        endpoint.active -= 1
+
+    async def _connect(self, endpoint: Endpoint):
+        ws = await websockets.connect(endpoint.url, open_timeout=FUNASR_CONNECT_TIMEOUT)
+        endpoint.mark_ok()
+        return ws
+
+    async def _health_loop(self):
+        while True:
+            for endpoint in self.endpoints:
+                await self._check(endpoint)
+            await asyncio.sleep(self.health_interval)
+
+    async def _check(self, endpoint: Endpoint):
+        # 丢掉已断开或不响应 ping 的空闲连接，再补足预热连接
+        alive = deque()
+        while endpoint.spares:
+            ws = endpoint.spares.popleft()
+            try:
+                await asyncio.wait_for(await ws.ping(), FUNASR_CONNECT_TIMEOUT)
+                alive.append(ws)
+            except Exception:
+                await ws.close()
+        # 检查期间补充任务可能已放入新连接，合并而不是替换
+        endpoint.spares.extend(alive)
+        self._refill(endpoint)
+
+    def _refill(self, endpoint: Endpoint):
+        """在后台补足预热连接，每个实例同时只有一个补充任务"""
+        if self.warm_spares and (endpoint.refill is None or endpoint.refill.done()):
+            endpoint.refill = asyncio.create_task(self._fill(endpoint))
+
+    async def _fill(self, endpoint: Endpoint):
+        while len(endpoint.spares) < self.warm_spares and endpoint.healthy:
+            try:
+                endpoint.spares.append(await self._connect(endpoint))
+            except Exception as e:
+                endpoint.mark_failed()
+                logger.warning(f"FunASR {endpoint.url} unavailable: {e}")
+
+
+class UpstreamSession:
+    """一个插件会话对应的上游连接，断线后透明重连
+
+    send() 在连接可用时直接发送，重连期间缓存到有界缓冲区 (超出时丢弃
+    最旧的音频)；messages() 跨重连持续产出识别结果。
+    """
+
+    def __init__(self, pool: FunASRPool, handshake: Optional[str] = None,
+                 buffer_bytes: int = FUNASR_BUFFER_BYTES):
+        self.pool = pool
+        # 每次 (重新) 连接后先发送的文本帧，例如 FunASR 的会话参数
+        self.handshake = handshake
+        self.buffer_bytes = buffer_bytes
+        self.dropped_bytes = 0
+        self.reconnects = 0
+        self._ws = None
+        self._endpoint: Optional[Endpoint] = None
+        self._buffer: Deque[bytes] = deque()
+        self._buffered = 0
+        self._results: asyncio.Queue = asyncio.Queue()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._results.put_nowait(None)
+
+    async def send(self, data: bytes):
+        ws = self._ws
+        if ws is not None:
+            try:
+                await ws.send(data)
+                return
+            except ConnectionClosed:
+                # 由 _run 负责重连，这一帧先缓存
+                if self._ws is ws:
+                    self._ws = None
+        self._buffer_audio(data)
+
+    def _buffer_audio(self, data: bytes):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        while self._buffered > self.buffer_bytes and self._buffer:
+            dropped = self._buffer.popleft()
+            self._buffered -= len(dropped)
+            self.dropped_bytes += len(dropped)
+
+    async def messages(self) -> AsyncIterator:
+        while True:
+            message = await self._results.get()
+            if message is None:
+                return
+            yield message
+
+    async def _run(self):
+        attempt = 0
+        connected_before = False
+        try:
+            while not self._closed:
+                try:
+                    self._endpoint, ws = await self.pool.acquire()
+                except Exception as e:
+                    logger.warning(f"FunASR connect failed (attempt {attempt + 1}): {e}")
+                    await asyncio.sleep(backoff_delay(attempt))
+                    attempt += 1
+                    continue
+                if connected_before:
+                    self.reconnects += 1
+                    self.pool.reconnects += 1
+                    logger.info(f"Reconnected to FunASR {self._endpoint.url}")
+                connected_before = True
+                attempt = 0
+                try:
+                    await self._serve(ws)
+                except ConnectionClosed as e:
+                    logger.warning(f"FunASR connection lost: {e}")
+                finally:
+                    self._ws = None
+                    self.pool.release(self._endpoint)
+                    await ws.close()
+                if not self._closed:
+                    await asyncio.sleep(backoff_delay(0))
+        finally:
+            self._results.put_nowait(None)
+
+    async def _serve(self, ws):
+        if self.handshake is not None:
+            await ws.send(self.handshake)
+        # 先补发断线期间缓存的音频，期间新来的音频继续进入缓冲区
+        while self._buffer:
+            data = self._buffer.popleft()
+            self._buffered -= len(data)
+            await ws.send(data)
+        self._ws = ws
+        async for message in ws:
+            await self._results.put(message)
+        # 对端正常关闭也需要重连
+        raise ConnectionClosed(None, None)
+
+
+funasr_pool = FunASRPool(funasr_urls_from_env())
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import User
+
+# 缓存条目的有效期 (秒) 和最多缓存的用户数
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 60))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 1024))
+
+
+class UserCache:
+    """按 token 的 sub (用户名) 缓存已解析的用户，TTL + LRU
+
+    用户被修改或删除时通过 Session 事件自动失效，delete_user 提交后也会
+    显式失效一次。失效发生在数据库线程，查询和写入在事件循环，因此加锁。
+    提交后调用 on_commit(user_id)，用于通知其他 worker 失效各自的缓存。
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_size: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次失效递增，加载期间发生过失效的结果不写入缓存
+        self.generation = 0
+        # 在提交所在的数据库线程调用
+        self.on_commit: Optional[Callable[[int], None]] = None
+
+    def get(self, username: str) -> Optional[User]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[username]
+            self.misses += 1
+            return None
+
+    def put(self, username: str, user: User, generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[username] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self.generation += 1
+            for username, (_, user) in list(self._entries.items()):
+                if user.id == user_id:
+                    del self._entries[username]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_flush(session, flush_context):
+    # flush 时立即失效，提交后再失效一次，避免期间读到旧数据的请求把它重新写入缓存
+    changed = {obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)}
+    for user_id in changed:
+        user_cache.invalidate_user(user_id)
+    session.info.setdefault("changed_users", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    for user_id in session.info.pop("changed_users", ()):
+        user_cache.invalidate_user(user_id)
+        if user_cache.on_commit is not None:
+            user_cache.on_commit(user_id)